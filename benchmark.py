@@ -0,0 +1,1321 @@
+"""Benchmarks do Bot de Vida Financeira
+
+Uso: python benchmark.py [nome_do_benchmark]
+Sem argumentos executa todos os benchmarks.
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import sys
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+from bot import (
+    ATUALIZACOES_CONCORRENTES,
+    LANCAMENTOS_POR_PAGINA_MES,
+    LIMITE_PARCELAS_IMEDIATAS,
+    MATPLOTLIB_DISPONIVEL,
+    MigradorEsquema,
+    ParsingInteligente,
+    PoolConexoes,
+    VidaFinanceiraBot,
+    calcular_resumo_mes,
+    construir_aplicacao,
+    consultar_mes,
+    dobrar_acentos,
+    fechar_meses,
+    gasto_na_janela,
+    gerar_relatorio_mensal,
+    intervalo_mes_atual,
+    montar_pagina_mes,
+    obter_pool,
+    obter_resumo_mes,
+    parcelas_previstas,
+    renderizar_grafico_png,
+    somar_meses,
+)
+
+# Mensagens no formato usado pelo casal (exemplos da documentação e do uso)
+MENSAGENS_REAIS = [
+    "/add alimentação despesa 25,50 almoço no araujo pix",
+    "/add salário receita 5000 trabalho freelance nubank",
+    "/add transporte despesa 15 uber para casa cartão",
+    "/add alimentação despesa 25,50 almoço pix",
+    "/add supermercado 312,47 compras do mês débito",
+    "/add energia 187,30 conta de luz março",
+    "/add farmácia 42,90 remédio dor de cabeça dinheiro",
+    "/add cinema 64 ingressos e pipoca crédito",
+    "/add aluguel 1.850,00 transferência para o proprietário",
+    "/add gasolina 250 posto shell cartão",
+    "/add reembolso 120 despesa médica do plano",
+    "/add presente aniversário da mãe 150",
+    "/add curso de inglês 389,90 boleto",
+    "/add bônus 1.200,00 receita empresa",
+    "/add café da manhã padaria 18,50 pix",
+    "/add internet 99,90 vivo fibra",
+]
+
+
+class PoolPorChamada(PoolConexoes):
+    """Reproduz o comportamento antigo: uma conexão nova a cada chamada"""
+
+    def obter_conexao(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # Dentro de uma transação a conexão precisa ser a mesma
+        if conn is not None and conn.in_transaction:
+            return conn
+        if conn is not None:
+            conn.close()
+        conn = self._criar_conexao()
+        self._local.conn = conn
+        return conn
+
+
+def criar_bot_temporario(diretorio: str, nome: str) -> VidaFinanceiraBot:
+    """Cria uma instância do bot apontando para um banco temporário"""
+    return VidaFinanceiraBot("token-benchmark", os.path.join(diretorio, nome))
+
+
+def executar_comandos(bot: VidaFinanceiraBot, quantidade: int):
+    """Simula a sequência de chamadas feita por /add seguida de /saldo"""
+    for i in range(quantidade):
+        user_id = 1000 + (i % 10)
+        bot.registrar_usuario(user_id, f"user{user_id}", "Benchmark")
+        bot.criar_conta_padrao(user_id)
+        bot.criar_responsavel_padrao(user_id, "Benchmark")
+        bot.criar_metodo_pagamento_padrao(user_id)
+        bot.adicionar_lancamento(
+            user_id, "alimentação", "despesa", 2550, "almoço", "Benchmark", "pix"
+        )
+        bot.obter_saldo(user_id)
+
+
+def benchmark_pool(quantidade: int = 300):
+    """Compara comandos por segundo: conexão por chamada vs pool persistente"""
+    with tempfile.TemporaryDirectory() as diretorio:
+        bot_antigo = criar_bot_temporario(diretorio, "por_chamada.db")
+        bot_antigo.pool.fechar()
+        bot_antigo.pool = PoolPorChamada(bot_antigo.db_path)
+
+        bot_pool = criar_bot_temporario(diretorio, "pool.db")
+
+        resultados = {}
+        for nome, bot in (("por chamada", bot_antigo), ("pool", bot_pool)):
+            inicio = time.perf_counter()
+            executar_comandos(bot, quantidade)
+            duracao = time.perf_counter() - inicio
+            resultados[nome] = quantidade / duracao
+            bot.pool.fechar()
+
+    print("📊 Pool de conexões (/add + /saldo)")
+    for nome, por_segundo in resultados.items():
+        print(f"  {nome:>12}: {por_segundo:8.1f} comandos/s")
+    print(f"  ganho: {resultados['pool'] / resultados['por chamada']:.1f}x")
+
+
+def stress_escritas_concorrentes(
+    chats: int = 40, lancamentos_por_chat: int = 25, leitores: int = 4
+):
+    """Vários chats escrevendo ao mesmo tempo no modo WAL com escritor único"""
+    with tempfile.TemporaryDirectory() as diretorio:
+        bot = VidaFinanceiraBot(
+            "token-benchmark",
+            os.path.join(diretorio, "stress.db"),
+            modo_armazenamento="wal",
+        )
+        for chat in range(chats):
+            bot.registrar_usuario(chat, f"chat{chat}", f"Chat {chat}")
+            bot.criar_conta_padrao(chat)
+
+        erros = []
+        leituras = [0]
+        escrevendo = threading.Event()
+        escrevendo.set()
+
+        def escrever(chat: int):
+            for _ in range(lancamentos_por_chat):
+                if not bot.adicionar_lancamento(
+                    chat, "alimentação", "despesa", 1000, "stress", f"Chat {chat}", "pix"
+                ):
+                    erros.append(chat)
+
+        def ler():
+            while escrevendo.is_set():
+                bot.obter_saldo(0)
+                leituras[0] += 1
+
+        threads_leitura = [threading.Thread(target=ler) for _ in range(leitores)]
+        threads_escrita = [
+            threading.Thread(target=escrever, args=(chat,)) for chat in range(chats)
+        ]
+
+        inicio = time.perf_counter()
+        for thread in threads_leitura + threads_escrita:
+            thread.start()
+        for thread in threads_escrita:
+            thread.join()
+        duracao = time.perf_counter() - inicio
+        escrevendo.clear()
+        for thread in threads_leitura:
+            thread.join()
+
+        esperado = chats * lancamentos_por_chat
+        total = (
+            bot.pool.obter_conexao()
+            .execute("SELECT COUNT(*) FROM lancamentos")
+            .fetchone()[0]
+        )
+        bot.pool.fechar()
+
+    print("📊 Stress de escritas concorrentes (WAL + escritor serializado)")
+    print(f"  chats: {chats}, lançamentos: {total}/{esperado}, erros: {len(erros)}")
+    print(f"  escritas: {esperado / duracao:8.1f} lançamentos/s")
+    print(f"  leituras concorrentes: {leituras[0] / duracao:8.1f} /saldo por segundo")
+
+    if erros or total != esperado:
+        raise SystemExit("❌ Stress falhou: lançamentos perdidos ou com erro")
+
+
+def benchmark_unidade_de_trabalho(quantidade: int = 300):
+    """Compara commits e lançamentos/s: uma transação por etapa vs unidade de trabalho
+
+    Cada lançamento usa nomes novos de categoria, responsável e método, o
+    pior caso em que todas as dimensões precisam ser criadas.
+    """
+    resultados = {}
+    with tempfile.TemporaryDirectory() as diretorio:
+        for nome in ("por etapa", "unidade"):
+            bot = criar_bot_temporario(diretorio, f"{nome.replace(' ', '_')}.db")
+            bot.criar_conta_padrao(1)
+
+            commits = [0]
+            bot.pool.obter_conexao().set_trace_callback(
+                lambda sql: commits.__setitem__(0, commits[0] + (sql == "COMMIT"))
+            )
+
+            inicio = time.perf_counter()
+            for i in range(quantidade):
+                if nome == "por etapa":
+                    # Fluxo antigo: cada dimensão confirmada separadamente
+                    bot.obter_ou_criar_responsavel(1, f"resp{i}")
+                    bot.obter_ou_criar_categoria(1, f"cat{i}", "despesa")
+                    bot.obter_ou_criar_metodo_pagamento(1, f"metodo{i}")
+                bot.adicionar_lancamento(
+                    1, f"cat{i}", "despesa", 1000, "benchmark", f"resp{i}", f"metodo{i}"
+                )
+            duracao = time.perf_counter() - inicio
+
+            resultados[nome] = (quantidade / duracao, commits[0] / quantidade)
+            bot.pool.fechar()
+
+    print("📊 Unidade de trabalho (lançamento com dimensões novas)")
+    for nome, (por_segundo, commits_por_lancamento) in resultados.items():
+        print(
+            f"  {nome:>10}: {por_segundo:8.1f} lançamentos/s, "
+            f"{commits_por_lancamento:.1f} commits por lançamento"
+        )
+
+
+def benchmark_provisionamento(quantidade: int = 300):
+    """Compara statements por /add: onboarding a cada mensagem vs provisionamento único"""
+    resultados = {}
+    with tempfile.TemporaryDirectory() as diretorio:
+        for nome in ("sempre", "provisionado"):
+            bot = criar_bot_temporario(diretorio, f"{nome}.db")
+
+            statements = [0]
+            bot.pool.obter_conexao().set_trace_callback(
+                lambda sql: statements.__setitem__(0, statements[0] + 1)
+            )
+
+            inicio = time.perf_counter()
+            for _ in range(quantidade):
+                if nome == "sempre":
+                    # Fluxo antigo de add_lancamento_command
+                    bot.registrar_usuario(1, "user", "Benchmark")
+                    bot.criar_conta_padrao(1)
+                    bot.criar_responsavel_padrao(1, "Benchmark")
+                    bot.criar_metodo_pagamento_padrao(1)
+                else:
+                    bot.provisionar_usuario(1, "user", "Benchmark")
+                bot.adicionar_lancamento(
+                    1, "alimentação", "despesa", 1000, "benchmark", "Benchmark", "pix"
+                )
+            duracao = time.perf_counter() - inicio
+
+            resultados[nome] = (quantidade / duracao, statements[0] / quantidade)
+            cache = bot.cache_dimensoes.estatisticas()
+            bot.pool.fechar()
+
+    print("📊 Provisionamento de usuários (/add repetido do mesmo usuário)")
+    for nome, (por_segundo, por_add) in resultados.items():
+        print(
+            f"  {nome:>12}: {por_segundo:8.1f} /add por segundo, "
+            f"{por_add:.1f} statements por /add"
+        )
+    print(
+        f"  cache de dimensões: {cache['acertos']} acertos, {cache['falhas']} falhas "
+        f"({cache['taxa_acerto']:.0%})"
+    )
+
+
+def benchmark_saldo(domicilios: int = 2000, consultas: int = 2000):
+    """Compara /saldo por segundo: SUM sobre todas as contas vs saldo em memória"""
+    with tempfile.TemporaryDirectory() as diretorio:
+        bot = criar_bot_temporario(diretorio, "saldo.db")
+        for domicilio in range(domicilios):
+            bot.provisionar_usuario(domicilio, f"user{domicilio}", "Saldo", domicilio)
+            bot.adicionar_lancamento(
+                domicilio, "salário", "receita", 100000, "benchmark", "Saldo", "pix"
+            )
+
+        conn = bot.pool.obter_conexao()
+        resultados = {}
+
+        inicio = time.perf_counter()
+        for i in range(consultas):
+            conn.execute("SELECT SUM(saldo_centavos) FROM contas").fetchone()
+        resultados["SUM contas"] = consultas / (time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        for i in range(consultas):
+            saldo = bot.obter_saldo(i % domicilios)
+        resultados["domicílio"] = consultas / (time.perf_counter() - inicio)
+
+        divergencias = bot.reconciliar_saldos(corrigir=False)
+        bot.pool.fechar()
+
+    print(f"📊 Saldo por domicílio ({domicilios} domicílios)")
+    for nome, por_segundo in resultados.items():
+        print(f"  {nome:>12}: {por_segundo:10.1f} /saldo por segundo")
+    print(f"  último saldo: {saldo}, divergências: {len(divergencias)}")
+
+    if divergencias or saldo != 100000:
+        raise SystemExit("❌ Saldo por domicílio divergente dos lançamentos")
+
+
+def benchmark_migracao(lancamentos: int = 100000, tamanho_lote: int = 1000):
+    """Compara o maior tempo com o lock de escrita: cópia única vs migração em lotes"""
+    with tempfile.TemporaryDirectory() as diretorio:
+        # Banco legado: só o esquema original, com lançamentos em REAL
+        legado = os.path.join(diretorio, "legado.db")
+        MigradorEsquema(obter_pool(legado)).migrar(ate=1)
+        obter_pool(legado).fechar()
+        conn = sqlite3.connect(legado)
+        conn.executemany(
+            "INSERT INTO lancamentos (user_id, categoria_id, tipo, valor, descricao) "
+            "VALUES (1, 1, 'despesa', ?, 'benchmark')",
+            [(10.5 + i % 100,) for i in range(lancamentos)],
+        )
+        conn.commit()
+        conn.close()
+
+        # Fluxo antigo do migrar_db.py: renomeia e copia numa só transação
+        copia_unica = os.path.join(diretorio, "copia_unica.db")
+        shutil.copy(legado, copia_unica)
+        conn = sqlite3.connect(copia_unica)
+        inicio = time.perf_counter()
+        conn.execute("ALTER TABLE lancamentos RENAME TO lancamentos_old")
+        conn.execute(
+            "CREATE TABLE lancamentos AS "
+            "SELECT *, date(data_lancamento) AS data_referencia FROM lancamentos_old"
+        )
+        conn.commit()
+        lock_unico = time.perf_counter() - inicio
+        conn.close()
+
+        # Mede cada transação de escrita da migração (lotes, DDL e registro
+        # da versão), que é o tempo em que o lock fica com o migrador
+        pool = obter_pool(legado)
+        executar_escrita = pool.executar_escrita
+        maior_lote = [0.0]
+
+        def medir(funcao):
+            inicio = time.perf_counter()
+            try:
+                return executar_escrita(funcao)
+            finally:
+                maior_lote[0] = max(maior_lote[0], time.perf_counter() - inicio)
+
+        pool.executar_escrita = medir
+        inicio = time.perf_counter()
+        MigradorEsquema(pool, tamanho_lote, lambda *progresso: None).migrar()
+        total_lotes = time.perf_counter() - inicio
+        del pool.executar_escrita
+        pool.fechar()
+
+        # Inicialização com o esquema atual
+        bot = VidaFinanceiraBot("token-benchmark", legado)
+        statements = [0]
+        bot.pool.obter_conexao().set_trace_callback(
+            lambda sql: statements.__setitem__(0, statements[0] + 1)
+        )
+        bot.init_database()
+        bot.pool.fechar()
+
+    print(f"📊 Migração de esquema ({lancamentos} lançamentos)")
+    print(f"  cópia única: lock de escrita por {lock_unico * 1000:8.1f} ms")
+    print(
+        f"   em lotes: maior lock {maior_lote[0] * 1000:8.1f} ms "
+        f"(total {total_lotes:.1f} s, lotes de {tamanho_lote})"
+    )
+    print(f"  inicialização com esquema atual: {statements[0]} statements")
+
+
+def _listas_antigas(parser: ParsingInteligente):
+    """Listas do fluxo antigo, com as grafias com e sem acento escritas à mão"""
+
+    def _com_variantes(palavras):
+        return list(dict.fromkeys(v for p in palavras for v in (p, dobrar_acentos(p))))
+
+    return [
+        [
+            ("receita", _com_variantes(parser.palavras_receita)),
+            ("despesa", _com_variantes(parser.palavras_despesa)),
+        ],
+        [(c, _com_variantes(p)) for c, p in parser.categorias_comuns.items()],
+        [(m, _com_variantes(p)) for m, p in parser.metodos_pagamento.items()],
+    ]
+
+
+def _palavras_chave_por_listas(listas, texto: str):
+    """Fluxo antigo: um `in` sobre a mensagem para cada palavra-chave"""
+    texto_lower = texto.lower()
+    encontrados = []
+    for tabelas in listas:
+        encontrado = None
+        for valor, palavras in tabelas:
+            for palavra in palavras:
+                if palavra in texto_lower:
+                    encontrado = valor
+                    break
+            if encontrado:
+                break
+        encontrados.append(encontrado)
+    return dict(zip(("tipo", "categoria", "metodo_pagamento"), encontrados))
+
+
+def benchmark_parser(repeticoes: int = 2000):
+    """Compara mensagens por segundo: listas de palavras vs regex única"""
+    parser = ParsingInteligente()
+    listas = _listas_antigas(parser)
+    mensagens = MENSAGENS_REAIS * repeticoes
+
+    resultados = {}
+    for nome, identificar in (
+        ("listas", lambda texto: _palavras_chave_por_listas(listas, texto)),
+        ("regex única", parser.identificar_palavras_chave),
+        ("/add completo", parser.parse_comando_add),
+    ):
+        inicio = time.perf_counter()
+        for mensagem in mensagens:
+            identificar(mensagem)
+        resultados[nome] = len(mensagens) / (time.perf_counter() - inicio)
+
+    divergentes = [
+        mensagem
+        for mensagem in MENSAGENS_REAIS
+        if _palavras_chave_por_listas(listas, mensagem)
+        != parser.identificar_palavras_chave(mensagem)
+    ]
+
+    # A data do /add é a data do lançamento, não parte da descrição
+    datado = parser.parse_comando_add("/add 50 mercado 03/05/2024")
+    if (datado["data_referencia"], datado["descricao"]) != ("2024-05-03", "mercado"):
+        raise SystemExit(f"❌ Data do /add mal interpretada: {datado}")
+
+    print(f"📊 Parser de palavras-chave ({len(MENSAGENS_REAIS)} mensagens reais)")
+    for nome, por_segundo in resultados.items():
+        print(f"  {nome:>13}: {por_segundo:10.1f} mensagens/s")
+    print(f"  ganho: {resultados['regex única'] / resultados['listas']:.1f}x")
+
+    if divergentes:
+        raise SystemExit(f"❌ Resultados diferentes para: {divergentes}")
+
+
+def benchmark_lote(lancamentos: int = 300, mensagens: int = 5):
+    """Compara um /add por linha vs /add em lote (executemany, um commit)"""
+    texto = "/add\n" + "\n".join(
+        MENSAGENS_REAIS[i % len(MENSAGENS_REAIS)].replace("/add ", "")
+        for i in range(lancamentos)
+    )
+
+    resultados = {}
+    with tempfile.TemporaryDirectory() as diretorio:
+        for nome in ("por linha", "lote"):
+            bot = criar_bot_temporario(diretorio, f"{nome.replace(' ', '_')}.db")
+            bot.provisionar_usuario(1, "user", "Benchmark")
+
+            commits = [0]
+            bot.pool.obter_conexao().set_trace_callback(
+                lambda sql: commits.__setitem__(0, commits[0] + (sql == "COMMIT"))
+            )
+
+            inicio = time.perf_counter()
+            for _ in range(mensagens):
+                linhas = [r for _, r in bot.parser.parse_lote_add(texto)]
+                if nome == "por linha":
+                    for r in linhas:
+                        bot.adicionar_lancamento(
+                            1,
+                            r["categoria"],
+                            r["tipo"],
+                            r["valor_centavos"],
+                            r["descricao"],
+                            "Benchmark",
+                            r["metodo_pagamento"],
+                        )
+                else:
+                    bot.adicionar_lancamentos(1, linhas, "Benchmark")
+            duracao = time.perf_counter() - inicio
+
+            resultados[nome] = (
+                mensagens * lancamentos / duracao,
+                duracao / mensagens,
+                commits[0] / mensagens,
+            )
+            divergencias = bot.reconciliar_saldos(corrigir=False)
+            bot.pool.fechar()
+            if divergencias:
+                raise SystemExit(f"❌ Saldo divergente no modo {nome}")
+
+    print(f"📊 /add em lote ({lancamentos} lançamentos por mensagem)")
+    for nome, (por_segundo, por_mensagem, commits) in resultados.items():
+        print(
+            f"  {nome:>9}: {por_segundo:8.1f} lançamentos/s, "
+            f"{por_mensagem * 1000:7.1f} ms e {commits:.0f} commits por mensagem"
+        )
+
+
+def benchmark_parcelas(planos: int = 50, total_parcelas: int = 12):
+    """Compara gravar compras parceladas: uma parcela por vez vs plano expandido"""
+    parser = ParsingInteligente()
+    resultado = parser.parse_comando_add(
+        f"/add eletrônicos despesa 150 tv [1/{total_parcelas}] cartão"
+    )
+
+    resultados = {}
+    with tempfile.TemporaryDirectory() as diretorio:
+        for nome in ("uma por vez", "expandido"):
+            bot = criar_bot_temporario(diretorio, f"{nome.replace(' ', '_')}.db")
+            bot.provisionar_usuario(1, "user", "Benchmark")
+
+            inicio = time.perf_counter()
+            for _ in range(planos):
+                if nome == "uma por vez":
+                    for _ in range(total_parcelas):
+                        bot.adicionar_lancamento(
+                            1,
+                            resultado["categoria"],
+                            resultado["tipo"],
+                            resultado["valor_centavos"],
+                            resultado["descricao"],
+                            "Benchmark",
+                            resultado["metodo_pagamento"],
+                        )
+                else:
+                    bot.adicionar_lancamentos(1, [resultado], "Benchmark")
+            resultados[nome] = (time.perf_counter() - inicio) / planos
+            bot.pool.fechar()
+
+        # Modo projetado: um plano longo só gera linhas quando o mês chega
+        longo = dict(resultado, parcelas=(1, LIMITE_PARCELAS_IMEDIATAS * 5))
+        bot = criar_bot_temporario(diretorio, "projetado.db")
+        bot.provisionar_usuario(1, "user", "Benchmark")
+        for _ in range(planos):
+            bot.adicionar_lancamentos(1, [longo], "Benchmark")
+
+        inicio = time.perf_counter()
+        vazias = 1000
+        for _ in range(vazias):
+            bot.materializar_parcelas(datetime.utcnow().date().isoformat())
+        sem_pendencias = (time.perf_counter() - inicio) / vazias
+
+        # Consultar um mês futuro não grava nada: as parcelas são previstas
+        daqui_um_ano = somar_meses(datetime.utcnow().date(), 12)
+        ate = daqui_um_ano.isoformat()
+        if bot.materializar_parcelas(ate):
+            raise SystemExit("❌ Parcelas futuras gravadas antes do dia delas")
+        conn = bot.pool.obter_conexao()
+        inicio = time.perf_counter()
+        previstas = parcelas_previstas(
+            conn, 1, daqui_um_ano.year, daqui_um_ano.month
+        )
+        previsao = time.perf_counter() - inicio
+        if len(previstas) != planos:
+            raise SystemExit(
+                f"❌ {len(previstas)} parcelas previstas, esperadas {planos}"
+            )
+
+        # Um ano de parcelas vencidas de uma vez (bot parado), direto na unidade
+        inicio = time.perf_counter()
+        inseridas = bot.executar_unidade(
+            lambda unidade: unidade.materializar_parcelas(ate)
+        )
+        um_ano = time.perf_counter() - inicio
+
+        divergencias = bot.reconciliar_saldos(corrigir=False)
+        bot.pool.fechar()
+        if divergencias:
+            raise SystemExit("❌ Saldo divergente após materializar parcelas")
+
+    print(f"📊 Compras parceladas ({planos} planos de {total_parcelas} parcelas)")
+    for nome, por_plano in resultados.items():
+        print(f"  {nome:>11}: {por_plano * 1000:7.2f} ms por /add parcelado")
+    print(
+        f"  projetado: {sem_pendencias * 1e6:7.1f} µs por verificação sem pendências, "
+        f"{inseridas} parcelas de 12 meses em {um_ano * 1000:.1f} ms"
+    )
+    print(f"  previstas de um mês futuro: {previsao * 1000:.2f} ms")
+
+
+def benchmark_exportacao(tamanhos=(20000, 100000)):
+    """Mede tempo e pico de memória do /exportar conforme o histórico cresce"""
+    parser = ParsingInteligente()
+    lancamentos = [
+        parser.parse_comando_add(mensagem) for mensagem in MENSAGENS_REAIS
+    ]
+    lancamentos = [l for l in lancamentos if not l["erro"]]
+
+    print("📊 /exportar (CSV em lotes do cursor para arquivo temporário)")
+    with tempfile.TemporaryDirectory() as diretorio:
+        bot = criar_bot_temporario(diretorio, "exportacao.db")
+        bot.provisionar_usuario(1, "user", "Benchmark")
+        total = 0
+        for tamanho in tamanhos:
+            while total < tamanho:
+                bot.adicionar_lancamentos(1, lancamentos, "Benchmark")
+                total += len(lancamentos)
+
+            tracemalloc.start()
+            inicio = time.perf_counter()
+            arquivo = bot.exportar_csv(1)
+            duracao = time.perf_counter() - inicio
+            pico = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            arquivo.seek(0, os.SEEK_END)
+            tamanho_csv = arquivo.tell()
+            arquivo.close()
+            print(
+                f"  {total:>7} lançamentos: {duracao * 1000:7.1f} ms, "
+                f"CSV de {tamanho_csv / 1024 / 1024:.1f} MiB, "
+                f"pico de {pico / 1024:.0f} KiB em memória"
+            )
+        bot.pool.fechar()
+
+
+def benchmark_relatorio(lancamentos: int = 2000, consultas: int = 200):
+    """Compara /relatorio MM-YYYY: gerar o CSV a cada pedido vs cache registrado"""
+    parser = ParsingInteligente()
+    resultado = parser.parse_comando_add(MENSAGENS_REAIS[0])
+    hoje = datetime.utcnow().date()
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        bot = criar_bot_temporario(diretorio, "relatorio.db")
+        bot.provisionar_usuario(1, "user", "Benchmark")
+        bot.adicionar_lancamentos(1, [resultado] * lancamentos, "Benchmark")
+
+        # Tempo com o escritor serializado ocupado (as escritas dos demais
+        # usuários esperam por ele)
+        executar_escrita = bot.pool.executar_escrita
+        no_escritor = [0.0]
+
+        def medir(funcao):
+            inicio = time.perf_counter()
+            try:
+                return executar_escrita(funcao)
+            finally:
+                no_escritor[0] += time.perf_counter() - inicio
+
+        bot.pool.executar_escrita = medir
+
+        anterior = os.getcwd()
+        os.chdir(diretorio)
+        try:
+            resultados = {}
+            for nome in ("sem cache", "com cache"):
+                statements = [0]
+                no_escritor[0] = 0.0
+                bot.pool.obter_conexao().set_trace_callback(
+                    lambda sql: statements.__setitem__(0, statements[0] + 1)
+                )
+                inicio = time.perf_counter()
+                for _ in range(consultas):
+                    if nome == "sem cache":
+                        executar_escrita(
+                            lambda conn: conn.execute("DELETE FROM relatorios_mensais")
+                        )
+                    gerar_relatorio_mensal(1, hoje.month, hoje.year, bot.pool)
+                resultados[nome] = (
+                    (time.perf_counter() - inicio) / consultas,
+                    statements[0] / consultas,
+                    no_escritor[0] / consultas,
+                )
+                bot.pool.obter_conexao().set_trace_callback(None)
+        finally:
+            os.chdir(anterior)
+            del bot.pool.executar_escrita
+            bot.pool.fechar()
+
+    print(f"📊 /relatorio de um mês com {lancamentos} lançamentos")
+    for nome, (por_consulta, statements, escritor) in resultados.items():
+        print(
+            f"  {nome:>9}: {por_consulta * 1000:7.2f} ms e "
+            f"{statements:.0f} statements por pedido, "
+            f"{escritor * 1000:.2f} ms no escritor"
+        )
+
+
+def benchmark_mes_fechado(lancamentos: int = 5000, consultas: int = 500):
+    """Compara o resumo de um mês passado: agregar os lançamentos vs mês fechado"""
+    parser = ParsingInteligente()
+    linhas = [parser.parse_comando_add(mensagem) for mensagem in MENSAGENS_REAIS]
+    linhas = [l for l in linhas if not l["erro"]]
+    ano, mes = 2024, 3
+    for indice, linha in enumerate(linhas):
+        linha["data_referencia"] = f"{ano}-{mes:02d}-{indice % 28 + 1:02d}"
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        bot = criar_bot_temporario(diretorio, "mes_fechado.db")
+        bot.provisionar_usuario(1, "user", "Benchmark")
+        for _ in range(lancamentos // len(linhas)):
+            bot.adicionar_lancamentos(1, linhas, "Benchmark")
+
+        conn = bot.pool.obter_conexao()
+        inicio = time.perf_counter()
+        for _ in range(consultas):
+            calculado = calcular_resumo_mes(conn, 1, ano, mes)
+        agregando = (time.perf_counter() - inicio) / consultas
+
+        fechar_meses(bot.pool)
+        inicio = time.perf_counter()
+        for _ in range(consultas):
+            fechado, _ = obter_resumo_mes(bot.pool, 1, ano, mes)
+        lendo_fechado = (time.perf_counter() - inicio) / consultas
+
+        # Um /add com data num mês fechado reabre o mês
+        bot.adicionar_lancamentos(
+            1, [parser.parse_comando_add(f"/add 50 mercado 10/{mes:02d}/{ano}")]
+        )
+        reaberto, _ = obter_resumo_mes(bot.pool, 1, ano, mes)
+        bot.pool.fechar()
+
+    if calculado != fechado:
+        raise SystemExit("❌ Resumo fechado diferente do calculado")
+    if reaberto["quantidade"] != fechado["quantidade"] + 1:
+        raise SystemExit("❌ Lançamento com data não reabriu o mês fechado")
+
+    print(f"📊 Resumo de um mês passado com {calculado['quantidade']} lançamentos")
+    print(f"  agregando: {agregando * 1000:7.3f} ms por consulta")
+    print(f"    fechado: {lendo_fechado * 1000:7.3f} ms por consulta")
+
+
+def _tendencias_por_sql(conn, ano: int, mes: int):
+    """Fluxo em SQL puro: uma consulta por mês da janela e por responsável"""
+    meses = [somar_meses(date(ano, mes, 1), -atraso) for atraso in range(13)]
+    por_mes = []
+    for inicio in meses:
+        fim = somar_meses(inicio, 1)
+        por_mes.append(
+            dict(
+                conn.execute(
+                    """
+                    SELECT c.nome, SUM(l.valor_centavos) FROM lancamentos l
+                    JOIN categorias c ON l.categoria_id = c.id
+                    WHERE l.tipo = 'despesa'
+                    AND l.data_referencia >= ? AND l.data_referencia < ?
+                    GROUP BY c.nome
+                """,
+                    (inicio.isoformat(), fim.isoformat()),
+                ).fetchall()
+            )
+        )
+
+    categorias = {}
+    for nome in set().union(*por_mes):
+        serie = [totais.get(nome, 0) for totais in por_mes]
+        categorias[nome] = {
+            "atual": serie[0],
+            "anterior": serie[1],
+            "ano_anterior": serie[12],
+            **{
+                f"media_{janela}": sum(serie[:janela]) / janela
+                for janela in (3, 6, 12)
+            },
+        }
+
+    responsaveis = dict(
+        conn.execute(
+            """
+            SELECT r.nome, SUM(l.valor_centavos) FROM lancamentos l
+            JOIN responsaveis r ON l.responsavel_id = r.id
+            WHERE l.tipo = 'despesa'
+            AND l.data_referencia >= ? AND l.data_referencia < ?
+            GROUP BY r.nome
+        """,
+            (meses[11].isoformat(), somar_meses(meses[0], 1).isoformat()),
+        ).fetchall()
+    )
+    return categorias, responsaveis
+
+
+def benchmark_tendencias(lancamentos: int = 1000000, anos: int = 8):
+    """Compara /tendencias: SQL por mês vs arrays NumPy carregados uma vez"""
+    import random
+
+    nomes_categorias = [
+        "alimentação", "transporte", "moradia", "saúde", "lazer", "educação",
+        "vestuário", "assinaturas", "pets", "presentes", "viagem", "outros",
+    ]  # fmt: skip
+    hoje = datetime.utcnow().date().replace(day=1)
+    primeiro = somar_meses(hoje, -12 * anos)
+    dias = (hoje - primeiro).days
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        bot = criar_bot_temporario(diretorio, "tendencias.db")
+        conn = bot.pool.obter_conexao()
+        dimensoes = []
+        for user_id, nome in ((1, "Ana"), (2, "Bruno")):
+            bot.provisionar_usuario(user_id, nome.lower(), nome)
+            conta = bot.executar_unidade(lambda u: u.obter_conta_padrao(user_id))
+            responsavel = bot.obter_ou_criar_responsavel(user_id, nome)
+            categorias = [
+                bot.executar_unidade(
+                    lambda u, c=c: u.obter_ou_criar_categoria(user_id, c, "despesa")
+                )
+                for c in nomes_categorias
+            ]
+            dimensoes.append((user_id, conta, responsavel, categorias))
+
+        aleatorio = random.Random(42)
+
+        def _gerar():
+            for _ in range(lancamentos):
+                user_id, conta, responsavel, categorias = aleatorio.choice(dimensoes)
+                tipo = "receita" if aleatorio.random() < 0.1 else "despesa"
+                centavos = aleatorio.randint(100, 50000)
+                dia = primeiro + timedelta(days=aleatorio.randrange(dias))
+                yield (
+                    user_id, conta, responsavel, aleatorio.choice(categorias),
+                    tipo, centavos / 100, centavos, "sintético", dia.isoformat(),
+                )  # fmt: skip
+
+        bot.pool.executar_escrita(
+            lambda c: c.executemany(
+                "INSERT INTO lancamentos (user_id, conta_id, responsavel_id, "
+                "categoria_id, tipo, valor, valor_centavos, descricao, "
+                "data_referencia) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                _gerar(),
+            )
+        )
+
+        referencia = somar_meses(hoje, -1)
+        inicio = time.perf_counter()
+        categorias_sql, responsaveis_sql = _tendencias_por_sql(
+            conn, referencia.year, referencia.month
+        )
+        por_sql = time.perf_counter() - inicio
+
+        tempos = {}
+        for etapa in ("primeira carga", "sem escritas", "após um /add"):
+            if etapa == "após um /add":
+                bot.adicionar_lancamento(1, "lazer", "despesa", 1, "x", "Ana", "pix")
+            inicio = time.perf_counter()
+            tendencias = bot.obter_tendencias(1, referencia.year, referencia.month)
+            tempos[etapa] = time.perf_counter() - inicio
+        bot.pool.fechar()
+
+    for categoria in tendencias["categorias"]:
+        esperado = categorias_sql[categoria["nome"]]
+        if any(
+            abs(categoria[chave] - valor) > 1e-6 for chave, valor in esperado.items()
+        ):
+            raise SystemExit(f"❌ Tendência divergente em {categoria['nome']}")
+    if {n: t for n, t, _ in tendencias["responsaveis"]} != responsaveis_sql:
+        raise SystemExit("❌ Participação por responsável divergente")
+
+    print(f"📊 /tendencias sobre {lancamentos} lançamentos ({anos} anos)")
+    print(f"  SQL por mês:    {por_sql * 1000:8.1f} ms a cada consulta")
+    for etapa, duracao in tempos.items():
+        print(f"  NumPy, {etapa:>14}: {duracao * 1000:8.1f} ms")
+
+
+def benchmark_graficos(pedidos: int = 8):
+    """Mede /grafico: primeira renderização, cache e latência de outros chats"""
+    if not MATPLOTLIB_DISPONIVEL:
+        print("📊 /grafico: matplotlib não instalado, só o gráfico em texto")
+        return
+
+    parser = ParsingInteligente()
+    linhas = [parser.parse_comando_add(mensagem) for mensagem in MENSAGENS_REAIS]
+    linhas = [l for l in linhas if not l["erro"]]
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        bot = criar_bot_temporario(diretorio, "graficos.db")
+        bot.provisionar_usuario(1, "user", "Benchmark")
+        bot.adicionar_lancamentos(1, linhas, "Benchmark")
+
+        inicio = time.perf_counter()
+        bot.criar_grafico_png(1)
+        primeira = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        bot.criar_grafico_png(1)
+        em_cache = time.perf_counter() - inicio
+
+        # Vários gráficos novos ao mesmo tempo enquanto outro chat usa /saldo
+        chaves = [(None, versao) for versao in range(pedidos)]
+        threads = [
+            threading.Thread(
+                target=bot.graficos.renderizar,
+                args=(
+                    chave,
+                    renderizar_grafico_png,
+                    f"Benchmark {chave[1]}",
+                    [l["categoria"] for l in linhas],
+                    [l["valor_centavos"] for l in linhas],
+                ),
+            )
+            for chave in chaves
+        ]
+        for thread in threads:
+            thread.start()
+        latencias = []
+        while any(thread.is_alive() for thread in threads):
+            inicio = time.perf_counter()
+            bot.obter_saldo(1)
+            latencias.append(time.perf_counter() - inicio)
+            time.sleep(0.001)
+        for thread in threads:
+            thread.join()
+        bot.graficos.fechar()
+        bot.pool.fechar()
+
+    print("📊 /grafico em PNG (pool de processos)")
+    print(f"  primeira renderização: {primeira * 1000:8.1f} ms (inclui subir o pool)")
+    print(f"              em cache: {em_cache * 1000:8.3f} ms")
+    print(
+        f"  /saldo durante {pedidos} renderizações: "
+        f"pior {max(latencias) * 1000:.2f} ms em {len(latencias)} chamadas"
+    )
+
+
+def benchmark_mes(tamanhos=(100, 10000, 50000), consultas: int = 200):
+    """Mede o tempo de uma página do /mes conforme o mês cresce"""
+    hoje = datetime.utcnow().date()
+    print(f"📊 /mes paginado ({LANCAMENTOS_POR_PAGINA_MES} lançamentos por página)")
+    with tempfile.TemporaryDirectory() as diretorio:
+        bot = criar_bot_temporario(diretorio, "mes.db")
+        bot.provisionar_usuario(1, "user", "Benchmark")
+        conn = bot.pool.obter_conexao()
+        total = 0
+        for tamanho in tamanhos:
+            bot.adicionar_lancamentos(
+                1,
+                [
+                    {
+                        "categoria": "lazer",
+                        "tipo": "despesa",
+                        "valor_centavos": 100 + indice,
+                        "descricao": "benchmark",
+                        "data_referencia": hoje.replace(
+                            day=indice % 28 + 1
+                        ).isoformat(),
+                    }
+                    for indice in range(total, tamanho)
+                ],
+                "Benchmark",
+            )
+            total = tamanho
+
+            # Posições no início, no meio e no fim do mês
+            posicoes = [
+                tuple(linha)
+                for linha in conn.execute(
+                    "SELECT data_referencia, id FROM lancamentos "
+                    "ORDER BY data_referencia, id"
+                )
+            ]
+            # /mes completo (o que o handler roda) e a navegação pelos botões
+            inicio = time.perf_counter()
+            for _ in range(consultas):
+                consultar_mes(bot, 1, hoje.year, hoje.month)
+            tempos = [(time.perf_counter() - inicio) / consultas]
+            for posicao in (posicoes[len(posicoes) // 2], posicoes[-12]):
+                inicio = time.perf_counter()
+                for _ in range(consultas):
+                    montar_pagina_mes(conn, 1, hoje.year, hoje.month, posicao)
+                tempos.append((time.perf_counter() - inicio) / consultas)
+            print(
+                f"  {tamanho:>6} lançamentos no mês: "
+                + ", ".join(
+                    f"{nome} {tempo * 1000:.3f} ms"
+                    for nome, tempo in zip(("/mes", "meio", "fim"), tempos)
+                )
+            )
+        bot.pool.fechar()
+
+
+# Consulta antiga do /limites: soma as despesas do mês a cada pedido
+SQL_LIMITES_POR_AGREGACAO = """
+    SELECT c.nome, lg.valor_limite_centavos, COALESCE(SUM(l.valor_centavos), 0) as gasto_atual
+    FROM limites_gastos lg
+    JOIN categorias c ON lg.categoria_id = c.id
+    LEFT JOIN lancamentos l ON l.categoria_id = c.id
+        AND l.user_id = ?
+        AND l.tipo = 'despesa'
+        AND l.data_referencia >= ? AND l.data_referencia < ?
+    WHERE lg.user_id = ?
+    GROUP BY c.nome, lg.valor_limite_centavos
+    HAVING gasto_atual > lg.valor_limite_centavos
+"""
+
+
+def benchmark_limites(tamanhos=(1000, 20000, 100000), consultas: int = 200):
+    """Compara o /limites: somar os lançamentos do mês vs contadores do resumo"""
+    categorias = ["alimentação", "transporte", "lazer", "saúde", "moradia"]
+    inicio_mes, fim_mes = intervalo_mes_atual()
+    print(f"📊 /limites com {len(categorias)} categorias limitadas")
+    with tempfile.TemporaryDirectory() as diretorio:
+        bot = criar_bot_temporario(diretorio, "limites.db")
+        bot.provisionar_usuario(1, "user", "Benchmark")
+        for categoria in categorias:
+            bot.adicionar_limite_gasto(1, categoria, 100)
+        conn = bot.pool.obter_conexao()
+        total = 0
+        for tamanho in tamanhos:
+            bot.adicionar_lancamentos(
+                1,
+                [
+                    {
+                        "categoria": categorias[indice % len(categorias)],
+                        "tipo": "despesa",
+                        "valor_centavos": 100 + indice,
+                        "descricao": "benchmark",
+                    }
+                    for indice in range(total, tamanho)
+                ],
+                "Benchmark",
+            )
+            total = tamanho
+
+            inicio = time.perf_counter()
+            for _ in range(consultas):
+                agregado = conn.execute(
+                    SQL_LIMITES_POR_AGREGACAO, (1, inicio_mes, fim_mes, 1)
+                ).fetchall()
+            agregando = (time.perf_counter() - inicio) / consultas
+
+            inicio = time.perf_counter()
+            for _ in range(consultas):
+                contadores = bot.verificar_limites(1)
+            lendo_contadores = (time.perf_counter() - inicio) / consultas
+
+            if sorted(linha[2] for linha in agregado) != sorted(
+                limite["gasto_atual_centavos"] for limite in contadores
+            ):
+                raise SystemExit("❌ Contadores diferentes da soma dos lançamentos")
+            print(
+                f"  {tamanho:>6} lançamentos no mês: agregando "
+                f"{agregando * 1000:.3f} ms, contadores {lendo_contadores * 1000:.3f} ms"
+            )
+        bot.pool.fechar()
+
+
+def benchmark_janelas(anos: int = 5, por_dia: int = 20, consultas: int = 500):
+    """Compara o gasto de uma categoria em janela móvel: somar os lançamentos
+    do intervalo vs duas buscas nos gastos diários acumulados"""
+    hoje = datetime.utcnow().date()
+    dias = anos * 365
+    with tempfile.TemporaryDirectory() as diretorio:
+        bot = criar_bot_temporario(diretorio, "janelas.db")
+        bot.provisionar_usuario(1, "user", "Benchmark")
+        for dia in range(dias, -1, -1):
+            data = (hoje - timedelta(days=dia)).isoformat()
+            bot.adicionar_lancamentos(
+                1,
+                [
+                    {
+                        "categoria": "alimentação",
+                        "tipo": "despesa",
+                        "valor_centavos": 100 + indice,
+                        "descricao": "benchmark",
+                        "data_referencia": data,
+                    }
+                    for indice in range(por_dia)
+                ],
+                "Benchmark",
+            )
+        conn = bot.pool.obter_conexao()
+        categoria_id = conn.execute(
+            "SELECT id FROM categorias WHERE user_id = 1 AND nome = 'alimentação'"
+        ).fetchone()[0]
+
+        print(
+            f"📊 Limite em janela móvel, {anos} anos de histórico "
+            f"({dias * por_dia} lançamentos)"
+        )
+        for janela in (7, 365, dias):
+            inicio_janela = (hoje - timedelta(days=janela)).isoformat()
+            inicio = time.perf_counter()
+            for _ in range(consultas):
+                somado = conn.execute(
+                    "SELECT COALESCE(SUM(valor_centavos), 0) FROM lancamentos "
+                    "WHERE categoria_id = ? AND tipo = 'despesa' "
+                    "AND data_referencia > ? AND data_referencia <= ?",
+                    (categoria_id, inicio_janela, hoje.isoformat()),
+                ).fetchone()[0]
+            somando = (time.perf_counter() - inicio) / consultas
+
+            inicio = time.perf_counter()
+            for _ in range(consultas):
+                acumulado = gasto_na_janela(conn, 1, categoria_id, janela, hoje)
+            acumulando = (time.perf_counter() - inicio) / consultas
+
+            if somado != acumulado:
+                raise SystemExit("❌ Gasto acumulado diferente da soma")
+            print(
+                f"  {janela:>5} dias: somando {somando * 1000:.3f} ms, "
+                f"acumulado {acumulando * 1000:.3f} ms"
+            )
+        bot.pool.fechar()
+
+
+def benchmark_metas(
+    aportes=(1000, 20000, 100000), metas: int = 5, consultas: int = 200
+):
+    """Compara o /metas: somar o livro de aportes vs valor atual mantido na meta"""
+    print(f"📊 /metas com {metas} metas")
+    with tempfile.TemporaryDirectory() as diretorio:
+        bot = criar_bot_temporario(diretorio, "metas.db")
+        # Domicílio de um grupo sem escritas: o primeiro lote cria o saldo dele
+        bot.provisionar_usuario(1, "user", "Benchmark", -100555)
+        for indice in range(metas):
+            bot.adicionar_meta(1, f"meta{indice}", 10**12)
+        conn = bot.pool.obter_conexao()
+        total = 0
+        for tamanho in aportes:
+            bot.adicionar_lancamentos(
+                1,
+                [
+                    {
+                        "categoria": "investimento",
+                        "tipo": "despesa",
+                        "valor_centavos": 100 + indice,
+                        "descricao": "benchmark",
+                        "meta": f"meta{indice % metas}",
+                    }
+                    for indice in range(total, tamanho)
+                ],
+                "Benchmark",
+            )
+            total = tamanho
+
+            inicio = time.perf_counter()
+            for _ in range(consultas):
+                somado = conn.execute(
+                    "SELECT m.id, COALESCE(SUM(a.valor_centavos), 0) FROM metas m "
+                    "LEFT JOIN aportes_metas a ON a.meta_id = m.id "
+                    "WHERE m.user_id = ? GROUP BY m.id",
+                    (1,),
+                ).fetchall()
+            somando = (time.perf_counter() - inicio) / consultas
+
+            inicio = time.perf_counter()
+            for _ in range(consultas):
+                listadas = bot.listar_metas(1)
+            lendo_contadores = (time.perf_counter() - inicio) / consultas
+
+            if sorted(linha[1] for linha in somado) != sorted(
+                meta["valor_atual_centavos"] for meta in listadas
+            ):
+                raise SystemExit("❌ Valor atual diferente da soma dos aportes")
+            desencontrados = conn.execute(
+                "SELECT COUNT(*) FROM aportes_metas a "
+                "LEFT JOIN lancamentos l ON l.id = a.lancamento_id "
+                "WHERE l.valor_centavos IS NOT a.valor_centavos"
+            ).fetchone()[0]
+            if desencontrados:
+                raise SystemExit(
+                    f"❌ {desencontrados} aportes apontam para o lançamento errado"
+                )
+            print(
+                f"  {tamanho:>6} aportes: somando {somando * 1000:.3f} ms, "
+                f"valor atual {lendo_contadores * 1000:.3f} ms"
+            )
+        bot.pool.fechar()
+
+
+class TelegramSimulado(BaseRequest):
+    """API do Telegram simulada: cada chamada responde depois de uma latência
+    fixa de rede, sem sair da máquina, e as respostas enviadas são contadas"""
+
+    def __init__(self, latencia: float):
+        self.latencia = latencia
+        self.respostas = 0
+        self._esperadas = None
+        self._concluido = None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def aguardar(self, respostas: int):
+        """Espera até o bot ter enviado esse total de respostas"""
+        self._esperadas = respostas
+        self._concluido = asyncio.Event()
+        if self.respostas >= respostas:
+            return
+        await self._concluido.wait()
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        await asyncio.sleep(self.latencia)
+        if url.endswith("/getMe"):
+            resultado = {
+                "id": 1,
+                "is_bot": True,
+                "first_name": "Benchmark",
+                "username": "benchmark_bot",
+            }
+        else:
+            parametros = request_data.parameters if request_data else {}
+            resultado = {
+                "message_id": 1,
+                "date": 0,
+                "chat": {"id": parametros.get("chat_id", 1), "type": "private"},
+                "text": parametros.get("text", ""),
+            }
+            self.respostas += 1
+            if self._concluido and self.respostas >= self._esperadas:
+                self._concluido.set()
+        return 200, json.dumps({"ok": True, "result": resultado}).encode()
+
+
+def criar_atualizacao(numero: int, chat_id: int, texto: str) -> dict:
+    """Update do Telegram (JSON) de uma mensagem de comando num chat privado"""
+    return {
+        "update_id": numero,
+        "message": {
+            "message_id": numero,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+            "text": texto,
+            "entities": [
+                {"type": "bot_command", "offset": 0, "length": len(texto.split()[0])}
+            ],
+        },
+    }
+
+
+async def _atender_atualizacoes(bot, concorrencia: int, atualizacoes, latencia):
+    """Passa as atualizações pelo Application e mede até a última resposta"""
+    telegram = TelegramSimulado(latencia)
+    application = construir_aplicacao(
+        bot, "123:benchmark", concorrencia, request=telegram
+    )
+    await application.initialize()
+    await application.start()
+    try:
+        inicio = time.perf_counter()
+        for dados in atualizacoes:
+            await application.update_queue.put(Update.de_json(dados, application.bot))
+        await telegram.aguardar(len(atualizacoes))
+        duracao = time.perf_counter() - inicio
+        threads = threading.active_count()
+    finally:
+        await application.stop()
+        await application.shutdown()
+        application.bot_data["executor_banco"].shutdown(wait=True)
+    return duracao, threads
+
+
+def benchmark_atualizacoes(
+    atualizacoes: int = 400, chats: int = 40, latencia: float = 0.05
+):
+    """Mede atualizações por segundo do Application assíncrono conforme o
+    número de atualizações atendidas ao mesmo tempo (/add e /saldo com uma
+    latência simulada de rede em cada chamada à API do Telegram)"""
+    comandos = MENSAGENS_REAIS + ["/saldo"] * 4
+    niveis = (
+        (1, "uma por vez"),
+        (4, "como os 4 workers do Updater síncrono"),
+        (ATUALIZACOES_CONCORRENTES, "padrão"),
+    )
+    print(
+        f"📊 {atualizacoes} atualizações de {chats} chats, "
+        f"latência do Telegram {latencia * 1000:.0f} ms"
+    )
+    with tempfile.TemporaryDirectory() as diretorio:
+        bot = VidaFinanceiraBot(
+            "token-benchmark",
+            os.path.join(diretorio, "atualizacoes.db"),
+            modo_armazenamento="wal",
+        )
+        adicionados = 0
+        for concorrencia, descricao in niveis:
+            lote = [
+                criar_atualizacao(
+                    numero, 2000 + numero % chats, comandos[numero % len(comandos)]
+                )
+                for numero in range(atualizacoes)
+            ]
+            adicionados += sum(
+                dados["message"]["text"].startswith("/add") for dados in lote
+            )
+            duracao, threads = asyncio.run(
+                _atender_atualizacoes(bot, concorrencia, lote, latencia)
+            )
+            print(
+                f"  {concorrencia:>3} ao mesmo tempo ({descricao}): "
+                f"{atualizacoes / duracao:8.1f} atualizações/s, {threads} threads"
+            )
+
+        gravados = (
+            bot.pool.obter_conexao()
+            .execute("SELECT COUNT(*) FROM lancamentos")
+            .fetchone()[0]
+        )
+        if gravados != adicionados:
+            raise SystemExit(f"❌ {gravados} lançamentos gravados de {adicionados}")
+        bot.pool.fechar()
+
+
+BENCHMARKS = {
+    "pool": benchmark_pool,
+    "stress": stress_escritas_concorrentes,
+    "unidade": benchmark_unidade_de_trabalho,
+    "provisionamento": benchmark_provisionamento,
+    "saldo": benchmark_saldo,
+    "migracao": benchmark_migracao,
+    "parser": benchmark_parser,
+    "lote": benchmark_lote,
+    "parcelas": benchmark_parcelas,
+    "exportacao": benchmark_exportacao,
+    "relatorio": benchmark_relatorio,
+    "mes_fechado": benchmark_mes_fechado,
+    "tendencias": benchmark_tendencias,
+    "graficos": benchmark_graficos,
+    "mes": benchmark_mes,
+    "limites": benchmark_limites,
+    "janelas": benchmark_janelas,
+    "metas": benchmark_metas,
+    "atualizacoes": benchmark_atualizacoes,
+}
+
+
+if __name__ == "__main__":
+    nomes = sys.argv[1:] or list(BENCHMARKS)
+    for nome in nomes:
+        BENCHMARKS[nome]()
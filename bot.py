@@ -1,19 +1,40 @@
 # Bot de Vida Financeira - Telegram
 # Sistema inteligente para controle financeiro pessoal
 
+import asyncio
 import os
 import sqlite3
 import logging
-from datetime import datetime, date, timedelta
-from typing import Optional, Dict, List, Tuple
+import multiprocessing
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from importlib.util import find_spec
+from contextlib import contextmanager
+from functools import partial
+from datetime import datetime, date, timedelta, timezone
+from typing import Optional, Dict, List, NamedTuple, Tuple
 import re
+import unicodedata
 import csv
+import hashlib
+import io
 import json
+import math
+import tempfile
 import calendar
 
+try:
+    import numpy as np
+except ImportError:  # /tendencias fica indisponível sem o NumPy
+    np = None
+
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
-    Updater,
+    Application,
     CommandHandler,
     MessageHandler,
     filters,
@@ -21,96 +42,2191 @@ from telegram.ext import (
     CallbackQueryHandler,
 )
 
-# Configuração de logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
-logger = logging.getLogger(__name__)
+# Configuração de logging
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+DB_PATH = "financeiro.db"
+
+
+class PoolConexoes:
+    """Pool de conexões SQLite, uma conexão persistente por thread
+
+    Cada thread do executor do banco reutiliza sempre a mesma conexão, evitando o
+    custo de abrir o arquivo, reler o schema e aquecer o cache de statements
+    a cada comando. Os statements preparados ficam no cache da conexão
+    (cached_statements) e são reaproveitados entre chamadas.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, cached_statements: int = 256):
+        self.db_path = db_path
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conexoes: List[sqlite3.Connection] = []
+        self._escritor: Optional["EscritorSerializado"] = None
+
+    def _criar_conexao(self) -> sqlite3.Connection:
+        """Abre uma nova conexão configurada para o pool"""
+        # isolation_level=None: transações controladas explicitamente
+        # por transacao(), leituras rodam em autocommit
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def obter_conexao(self) -> sqlite3.Connection:
+        """Retorna a conexão da thread atual, criando-a se necessário"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._criar_conexao()
+            self._local.conn = conn
+            with self._lock:
+                self._conexoes.append(conn)
+        return conn
+
+    @contextmanager
+    def transacao(self):
+        """Executa um bloco dentro de uma transação na conexão da thread
+
+        Transações aninhadas na mesma thread participam da transação externa.
+        """
+        conn = self.obter_conexao()
+        if conn.in_transaction:
+            yield conn
+            return
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+
+    def ativar_wal(self):
+        """Ativa o modo WAL com um único escritor serializado
+
+        Leitores continuam usando as conexões de cada thread e não bloqueiam
+        o escritor; todas as escritas passam pela fila do escritor.
+        """
+        if self._escritor is not None:
+            return
+
+        modo = self.obter_conexao().execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        if modo.lower() != "wal":
+            logger.warning(f"Não foi possível ativar WAL (modo atual: {modo})")
+            return
+
+        self._escritor = EscritorSerializado(self)
+        self._escritor.iniciar()
+        logger.info("Modo WAL ativado com escritor serializado")
+
+    def executar_escrita(self, funcao):
+        """Executa funcao(conn) em uma transação de escrita e retorna o resultado
+
+        No modo WAL a função é enviada ao escritor serializado; chamadas feitas
+        de dentro do próprio escritor (aninhadas) rodam diretamente.
+        """
+        escritor = self._escritor
+        if escritor is not None and not escritor.na_thread_escritora():
+            return escritor.executar(funcao)
+
+        with self.transacao() as conn:
+            return funcao(conn)
+
+    def fechar(self):
+        """Fecha todas as conexões abertas pelo pool"""
+        if self._escritor is not None:
+            self._escritor.parar()
+            self._escritor = None
+
+        with self._lock:
+            for conn in self._conexoes:
+                conn.close()
+            self._conexoes.clear()
+        self._local = threading.local()
+
+
+class EscritorSerializado:
+    """Thread única que aplica as escritas com group commit
+
+    As tarefas enfileiradas são agrupadas em lotes: cada tarefa roda dentro
+    de um SAVEPOINT próprio (uma falha não desfaz as demais) e o lote
+    inteiro é confirmado com um único COMMIT.
+    """
+
+    def __init__(self, pool: PoolConexoes, tamanho_lote: int = 64):
+        self.pool = pool
+        self.tamanho_lote = tamanho_lote
+        self._fila: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._executar, name="escritor-sqlite", daemon=True
+        )
+
+    def iniciar(self):
+        self._thread.start()
+
+    def parar(self):
+        self._fila.put(None)
+        self._thread.join()
+
+    def na_thread_escritora(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def executar(self, funcao):
+        """Enfileira funcao(conn) e aguarda o resultado"""
+        futuro: Future = Future()
+        self._fila.put((funcao, futuro))
+        return futuro.result()
+
+    def _executar(self):
+        conn = self.pool.obter_conexao()
+        parar = False
+
+        while not parar:
+            tarefa = self._fila.get()
+            if tarefa is None:
+                break
+
+            lote = [tarefa]
+            while len(lote) < self.tamanho_lote:
+                try:
+                    tarefa = self._fila.get_nowait()
+                except queue.Empty:
+                    break
+                if tarefa is None:
+                    parar = True
+                    break
+                lote.append(tarefa)
+
+            self._aplicar_lote(conn, lote)
+
+    def _aplicar_lote(self, conn: sqlite3.Connection, lote: List[Tuple]):
+        """Aplica um lote de tarefas em uma única transação"""
+        resultados = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for funcao, futuro in lote:
+                conn.execute("SAVEPOINT tarefa")
+                try:
+                    resultado = funcao(conn)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO tarefa")
+                    conn.execute("RELEASE tarefa")
+                    resultados.append((futuro, None, e))
+                else:
+                    conn.execute("RELEASE tarefa")
+                    resultados.append((futuro, resultado, None))
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Erro ao confirmar lote de escrita: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            for _, futuro in lote:
+                futuro.set_exception(e)
+            return
+
+        for futuro, resultado, erro in resultados:
+            if erro is not None:
+                futuro.set_exception(erro)
+            else:
+                futuro.set_result(resultado)
+
+
+_pools: Dict[str, PoolConexoes] = {}
+_pools_lock = threading.Lock()
+
+
+def obter_pool(db_path: str = DB_PATH) -> PoolConexoes:
+    """Retorna o pool compartilhado para o banco informado"""
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = PoolConexoes(db_path)
+            _pools[db_path] = pool
+        return pool
+
+
+def get_database_connection():
+    """Retorna conexão com o banco de dados (reaproveitada pelo pool)"""
+    return obter_pool().obter_conexao()
+
+
+# Separador decimal: vírgula ou ponto seguido de 1 ou 2 dígitos no final
+_PADRAO_DECIMAL_FINAL = re.compile(r"[.,](\d{1,2})$")
+
+
+def para_centavos(valor) -> int:
+    """Converte um valor em reais para centavos inteiros, sem passar por float
+
+    Aceita textos como "25,50", "25.5", "1.234,56" ou "5000". Um separador
+    seguido de 1 ou 2 dígitos no final é o separador decimal; os demais são
+    separadores de milhar.
+    """
+    if isinstance(valor, int):
+        return valor * 100
+    if isinstance(valor, float):
+        return int(round(valor * 100))
+
+    texto = str(valor).strip()
+    inteiro, decimal = texto, ""
+    final_decimal = _PADRAO_DECIMAL_FINAL.search(texto)
+    if final_decimal:
+        inteiro, decimal = texto[: final_decimal.start()], final_decimal.group(1)
+
+    inteiro = inteiro.replace(".", "").replace(",", "")
+    if not inteiro.isdigit() and not (inteiro == "" and decimal):
+        raise ValueError(f"Valor inválido: {valor}")
+
+    return int(inteiro or 0) * 100 + int(decimal.ljust(2, "0"))
+
+
+def formatar_valor(centavos: int) -> str:
+    """Formata centavos como moeda brasileira: R$ 1.234,56"""
+    sinal = "-" if centavos < 0 else ""
+    reais, resto = divmod(abs(centavos), 100)
+    return f"R$ {sinal}{reais:,}".replace(",", ".") + f",{resto:02d}"
+
+
+def formatar_decimal(centavos: int) -> str:
+    """Formata centavos como número decimal para CSV: 1234.56"""
+    sinal = "-" if centavos < 0 else ""
+    reais, resto = divmod(abs(centavos), 100)
+    return f"{sinal}{reais}.{resto:02d}"
+
+
+def intervalo_mes(ano: int, mes: int) -> Tuple[str, str]:
+    """Retorna o intervalo semiaberto [início, fim) do mês em formato ISO
+
+    Comparar data_referencia com esse intervalo permite usar os índices,
+    ao contrário de strftime() aplicado sobre a coluna.
+    """
+    inicio = date(ano, mes, 1)
+    fim = date(ano + mes // 12, mes % 12 + 1, 1)
+    return inicio.isoformat(), fim.isoformat()
+
+
+def intervalo_mes_atual() -> Tuple[str, str]:
+    """Intervalo do mês atual (em UTC, como o CURRENT_DATE do SQLite)"""
+    hoje = datetime.utcnow()
+    return intervalo_mes(hoje.year, hoje.month)
+
+
+def somar_meses(data: date, meses: int) -> date:
+    """Soma meses a uma data limitando o dia ao fim do mês (31/01 + 1 = 28/02)"""
+    indice = data.year * 12 + data.month - 1 + meses
+    ano, mes = indice // 12, indice % 12 + 1
+    return date(ano, mes, min(data.day, calendar.monthrange(ano, mes)[1]))
+
+
+def ano_mes_atual() -> str:
+    """Mês atual no formato YYYY-MM usado pela tabela resumo_mensal"""
+    return datetime.utcnow().strftime("%Y-%m")
+
+
+# Soma (user_id, ano_mes, categoria_id, tipo, total_centavos, quantidade)
+# ao resumo mensal
+SQL_SOMAR_RESUMO_MENSAL = """
+    INSERT INTO resumo_mensal (user_id, ano_mes, categoria_id, tipo,
+                               total_centavos, quantidade)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, ano_mes, categoria_id, tipo) DO UPDATE SET
+        total_centavos = total_centavos + excluded.total_centavos,
+        quantidade = quantidade + excluded.quantidade
+"""
+
+
+def atualizar_resumo_mensal(
+    conn: sqlite3.Connection,
+    user_id: int,
+    data_referencia: str,
+    categoria_id: int,
+    tipo: str,
+    valor_centavos: int,
+    quantidade: int = 1,
+):
+    """Soma um lançamento ao resumo mensal, na transação do chamador"""
+    conn.execute(
+        SQL_SOMAR_RESUMO_MENSAL,
+        (user_id, data_referencia[:7], categoria_id, tipo, valor_centavos, quantidade),
+    )
+
+
+# Despesas por (usuário, categoria, dia) com a soma acumulada até o dia: o
+# gasto de qualquer janela (inicio, fim] é acumulado(fim) - acumulado(inicio)
+SQL_SOMAR_GASTO_DIARIO = """
+    INSERT INTO gastos_diarios (user_id, categoria_id, data, total_centavos,
+                                acumulado_centavos)
+    VALUES (?1, ?2, ?3, ?4, ?4 + COALESCE((
+        SELECT acumulado_centavos FROM gastos_diarios
+        WHERE user_id = ?1 AND categoria_id = ?2 AND data < ?3
+        ORDER BY data DESC LIMIT 1
+    ), 0))
+    ON CONFLICT (user_id, categoria_id, data) DO UPDATE SET
+        total_centavos = total_centavos + excluded.total_centavos,
+        acumulado_centavos = acumulado_centavos + excluded.total_centavos
+"""
+
+SQL_PROPAGAR_GASTO_DIARIO = """
+    UPDATE gastos_diarios SET acumulado_centavos = acumulado_centavos + ?
+    WHERE user_id = ? AND categoria_id = ? AND data > ?
+"""
+
+# Refaz o acumulado a partir dos totais diários (migração e reconstrução)
+SQL_RECALCULAR_GASTOS_ACUMULADOS = """
+    UPDATE gastos_diarios SET acumulado_centavos = a.acumulado
+    FROM (
+        SELECT user_id, categoria_id, data,
+               SUM(total_centavos) OVER (
+                   PARTITION BY user_id, categoria_id ORDER BY data
+               ) as acumulado
+        FROM gastos_diarios
+    ) a
+    WHERE gastos_diarios.user_id = a.user_id
+      AND gastos_diarios.categoria_id = a.categoria_id
+      AND gastos_diarios.data = a.data
+"""
+
+
+def atualizar_gastos_diarios(
+    conn: sqlite3.Connection, user_id: int, despesas: Dict[Tuple[str, int], int]
+):
+    """Soma despesas ((data, categoria_id) -> centavos) aos gastos diários,
+    na transação do chamador
+
+    Uma despesa de hoje só toca a linha do dia; uma data passada também
+    corrige o acumulado dos dias seguintes que têm gasto.
+    """
+    for (data, categoria_id), valor_centavos in despesas.items():
+        conn.execute(
+            SQL_SOMAR_GASTO_DIARIO, (user_id, categoria_id, data, valor_centavos)
+        )
+        conn.execute(
+            SQL_PROPAGAR_GASTO_DIARIO, (valor_centavos, user_id, categoria_id, data)
+        )
+
+
+def invalidar_relatorios_mensais(
+    conn: sqlite3.Connection, user_id: int, anos_meses
+) -> List[str]:
+    """Descarta os relatórios em cache dos meses (YYYY-MM) alterados
+
+    Roda na transação do chamador; retorna os arquivos a apagar depois do
+    commit.
+    """
+    arquivos = []
+    for ano_mes in set(anos_meses):
+        arquivos += [
+            linha[0]
+            for linha in conn.execute(
+                "DELETE FROM relatorios_mensais WHERE user_id = ? AND ano = ? "
+                "AND mes = ? RETURNING arquivo_path",
+                (user_id, int(ano_mes[:4]), int(ano_mes[5:7])),
+            )
+        ]
+    return arquivos
+
+
+def invalidar_relatorios_a_partir(
+    conn: sqlite3.Connection, user_id: int, ano_mes: str
+) -> List[str]:
+    """Descarta os relatórios em cache do mês (YYYY-MM) em diante, que
+    mostram as parcelas previstas de um plano novo"""
+    return [
+        linha[0]
+        for linha in conn.execute(
+            "DELETE FROM relatorios_mensais WHERE user_id = ? "
+            "AND ano * 100 + mes >= ? RETURNING arquivo_path",
+            (user_id, int(ano_mes[:4]) * 100 + int(ano_mes[5:7])),
+        )
+    ]
+
+
+def apagar_arquivos(arquivos: List[str]):
+    """Apaga arquivos gerados que não são mais válidos (ignora os ausentes)"""
+    for arquivo in arquivos:
+        try:
+            os.remove(arquivo)
+        except OSError:
+            pass
+
+
+def reabrir_meses(conn: sqlite3.Connection, user_id: int, anos_meses) -> int:
+    """Descarta o fechamento dos meses (YYYY-MM) que receberam lançamentos
+
+    Roda na transação do chamador; o mês volta a ser lido dos lançamentos
+    até ser fechado de novo.
+    """
+    reabertos = 0
+    for ano_mes in set(anos_meses):
+        reabertos += conn.execute(
+            "DELETE FROM meses_fechados WHERE user_id = ? AND ano_mes = ?",
+            (user_id, ano_mes),
+        ).rowcount
+    if reabertos:
+        logger.info(f"{reabertos} meses reabertos para o usuário {user_id}")
+    return reabertos
+
+
+# Recalcula o resumo mensal a partir dos lançamentos
+SQL_RESUMO_MENSAL_RECALCULADO = """
+    SELECT user_id, substr(data_referencia, 1, 7) as ano_mes, categoria_id, tipo,
+           SUM(valor_centavos) as total_centavos, COUNT(*) as quantidade
+    FROM lancamentos
+    WHERE categoria_id IS NOT NULL AND tipo IS NOT NULL
+    GROUP BY user_id, ano_mes, categoria_id, tipo
+"""
+
+
+def reconstruir_resumo_mensal(pool: "PoolConexoes") -> int:
+    """Recalcula a tabela resumo_mensal do zero e retorna o número de linhas"""
+
+    def _reconstruir(conn):
+        conn.execute("DELETE FROM resumo_mensal")
+        return conn.execute(
+            f"""
+            INSERT INTO resumo_mensal (user_id, ano_mes, categoria_id, tipo,
+                                       total_centavos, quantidade)
+            {SQL_RESUMO_MENSAL_RECALCULADO}
+        """
+        ).rowcount
+
+    return pool.executar_escrita(_reconstruir)
+
+
+# Despesas por dia recalculadas a partir dos lançamentos
+SQL_GASTOS_DIARIOS_RECALCULADOS = """
+    SELECT user_id, categoria_id, data_referencia, SUM(valor_centavos), 0
+    FROM lancamentos
+    WHERE tipo = 'despesa' AND categoria_id IS NOT NULL
+"""
+
+
+def reconstruir_gastos_diarios(pool: "PoolConexoes") -> int:
+    """Recalcula a tabela gastos_diarios do zero e retorna o número de linhas"""
+
+    def _reconstruir(conn):
+        conn.execute("DELETE FROM gastos_diarios")
+        linhas = conn.execute(
+            f"""
+            INSERT INTO gastos_diarios (user_id, categoria_id, data,
+                                        total_centavos, acumulado_centavos)
+            {SQL_GASTOS_DIARIOS_RECALCULADOS}
+            GROUP BY 1, 2, 3
+        """
+        ).rowcount
+        conn.execute(SQL_RECALCULAR_GASTOS_ACUMULADOS)
+        return linhas
+
+    return pool.executar_escrita(_reconstruir)
+
+
+def verificar_resumo_mensal(conn: sqlite3.Connection) -> List[str]:
+    """Compara resumo_mensal com os lançamentos e retorna as divergências"""
+    colunas = "user_id, ano_mes, categoria_id, tipo, total_centavos, quantidade"
+    divergencias = []
+
+    for descricao, sql in (
+        (
+            "faltando ou diferente no resumo",
+            f"{SQL_RESUMO_MENSAL_RECALCULADO} EXCEPT SELECT {colunas} FROM resumo_mensal",
+        ),
+        (
+            "sobrando no resumo",
+            f"SELECT {colunas} FROM resumo_mensal EXCEPT {SQL_RESUMO_MENSAL_RECALCULADO}",
+        ),
+    ):
+        for linha in conn.execute(sql):
+            divergencias.append(
+                f"{descricao}: user {linha[0]}, {linha[1]}, categoria {linha[2]}, "
+                f"{linha[3]}, {formatar_valor(linha[4])} ({linha[5]} lançamentos)"
+            )
+
+    return divergencias
+
+
+# Domicílio dos usuários cadastrados antes da separação por domicílio: o
+# casal original continua compartilhando o mesmo saldo
+DOMICILIO_PADRAO = 0
+
+
+def ajustar_saldo_domicilio(
+    conn: sqlite3.Connection, domicilio_id: int, variacao_centavos: int
+) -> Tuple[int, int]:
+    """Soma a variação ao saldo do domicílio, na transação do chamador
+
+    Retorna (versao, saldo_centavos) para a atualização da memória.
+    """
+    linha = conn.execute(
+        """
+        INSERT INTO saldos_domicilio (domicilio_id, saldo_centavos, versao)
+        VALUES (?, ?, 1)
+        ON CONFLICT (domicilio_id) DO UPDATE SET
+            saldo_centavos = saldo_centavos + excluded.saldo_centavos,
+            versao = versao + 1
+        RETURNING versao, saldo_centavos
+    """,
+        (domicilio_id, variacao_centavos),
+    ).fetchone()
+    return linha[0], linha[1]
+
+
+# Recalcula o saldo de cada domicílio a partir dos lançamentos
+SQL_SALDOS_DOMICILIO_RECALCULADOS = """
+    SELECT COALESCE(u.domicilio_id, 0) as domicilio_id,
+           SUM(CASE WHEN l.tipo = 'receita' THEN l.valor_centavos
+                    ELSE -l.valor_centavos END) as saldo_centavos
+    FROM lancamentos l
+    LEFT JOIN usuarios u ON u.user_id = l.user_id
+    GROUP BY 1
+"""
+
+
+def reconciliar_saldos_domicilio(
+    pool: "PoolConexoes", corrigir: bool = False
+) -> List[Dict]:
+    """Compara os saldos mantidos com os lançamentos e retorna as divergências
+
+    Com corrigir=True os saldos divergentes são substituídos pelo valor
+    recalculado, na mesma transação da comparação.
+    """
+
+    def _reconciliar(conn):
+        recalculados = {
+            linha[0]: linha[1] or 0
+            for linha in conn.execute(SQL_SALDOS_DOMICILIO_RECALCULADOS)
+        }
+        armazenados = {
+            linha[0]: linha[1]
+            for linha in conn.execute(
+                "SELECT domicilio_id, saldo_centavos FROM saldos_domicilio"
+            )
+        }
+
+        divergencias = []
+        for domicilio_id in sorted(set(recalculados) | set(armazenados)):
+            recalculado = recalculados.get(domicilio_id, 0)
+            armazenado = armazenados.get(domicilio_id)
+            if armazenado == recalculado:
+                continue
+            divergencias.append(
+                {
+                    "domicilio_id": domicilio_id,
+                    "armazenado_centavos": armazenado,
+                    "recalculado_centavos": recalculado,
+                }
+            )
+            if corrigir:
+                ajustar_saldo_domicilio(
+                    conn, domicilio_id, recalculado - (armazenado or 0)
+                )
+        return divergencias
+
+    return pool.executar_escrita(_reconciliar)
+
+
+# Migrações de esquema versionadas. Cada migração é uma função que recebe o
+# MigradorEsquema; DDL roda em transações curtas e cópias de dados em lotes
+# de ids, com o progresso gravado em migracoes_progresso para retomar uma
+# migração interrompida do ponto em que parou.
+
+
+def _migracao_esquema_inicial(migrador: "MigradorEsquema"):
+    """Tabelas do esquema original"""
+    migrador.ddl(
+        """
+        CREATE TABLE IF NOT EXISTS usuarios (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+        """
+        CREATE TABLE IF NOT EXISTS contas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            nome TEXT NOT NULL,
+            saldo REAL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES usuarios (user_id)
+        )
+    """,
+        """
+        CREATE TABLE IF NOT EXISTS responsaveis (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            nome TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES usuarios (user_id)
+        )
+    """,
+        """
+        CREATE TABLE IF NOT EXISTS categorias (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            nome TEXT NOT NULL,
+            tipo TEXT CHECK(tipo IN ('receita', 'despesa')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES usuarios (user_id)
+        )
+    """,
+        """
+        CREATE TABLE IF NOT EXISTS lancamentos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            conta_id INTEGER,
+            responsavel_id INTEGER,
+            categoria_id INTEGER,
+            metodo_pagamento_id INTEGER,
+            tipo TEXT CHECK(tipo IN ('receita', 'despesa')),
+            valor REAL NOT NULL,
+            descricao TEXT,
+            data_lancamento TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES usuarios (user_id),
+            FOREIGN KEY (conta_id) REFERENCES contas (id),
+            FOREIGN KEY (responsavel_id) REFERENCES responsaveis (id),
+            FOREIGN KEY (categoria_id) REFERENCES categorias (id),
+            FOREIGN KEY (metodo_pagamento_id) REFERENCES metodos_pagamento (id)
+        )
+    """,
+        """
+        CREATE TABLE IF NOT EXISTS relatorios_mensais (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            mes INTEGER NOT NULL,
+            ano INTEGER NOT NULL,
+            arquivo_path TEXT NOT NULL,
+            data_geracao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES usuarios (user_id)
+        )
+    """,
+        """
+        CREATE TABLE IF NOT EXISTS metas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            nome TEXT NOT NULL,
+            valor_meta REAL NOT NULL,
+            valor_atual REAL DEFAULT 0,
+            data_limite DATE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES usuarios (user_id)
+        )
+    """,
+        """
+        CREATE TABLE IF NOT EXISTS metodos_pagamento (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            nome TEXT NOT NULL,
+            tipo TEXT CHECK(tipo IN ('conta', 'cartao', 'dinheiro', 'pix', 'transferencia')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES usuarios (user_id)
+        )
+    """,
+        """
+        CREATE TABLE IF NOT EXISTS limites_gastos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            categoria_id INTEGER,
+            valor_limite REAL NOT NULL,
+            periodo TEXT DEFAULT 'mensal',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES usuarios (user_id),
+            FOREIGN KEY (categoria_id) REFERENCES categorias (id)
+        )
+    """,
+    )
+
+
+def _migracao_parcelamento(migrador: "MigradorEsquema"):
+    """Data de referência e parcelas nos lançamentos (antigo migrar_db.py)
+
+    Em vez de renomear e copiar a tabela inteira numa única transação, as
+    colunas são adicionadas e data_referencia é preenchida em lotes.
+    """
+    migrador.adicionar_colunas(
+        ("lancamentos", "data_referencia", "DATE"),
+        ("lancamentos", "parcela_atual", "INTEGER DEFAULT NULL"),
+        ("lancamentos", "total_parcelas", "INTEGER DEFAULT NULL"),
+    )
+    migrador.em_lotes(
+        "lancamentos",
+        lambda conn, inicio, fim: conn.execute(
+            """
+            UPDATE lancamentos SET data_referencia = date(data_lancamento)
+            WHERE id > ? AND id <= ? AND data_referencia IS NULL
+        """,
+            (inicio, fim),
+        ),
+        etapa="lancamentos.data_referencia",
+    )
+
+
+def _migracao_valores_em_centavos(migrador: "MigradorEsquema"):
+    """Colunas inteiras em centavos preenchidas a partir das colunas REAL"""
+    conversoes = [
+        ("lancamentos", "valor", "valor_centavos"),
+        ("contas", "saldo", "saldo_centavos"),
+        ("metas", "valor_meta", "valor_meta_centavos"),
+        ("metas", "valor_atual", "valor_atual_centavos"),
+        ("limites_gastos", "valor_limite", "valor_limite_centavos"),
+    ]
+    migrador.adicionar_colunas(
+        *[
+            (tabela, coluna_centavos, "INTEGER")
+            for tabela, _, coluna_centavos in conversoes
+        ]
+    )
+
+    for tabela, coluna_real, coluna_centavos in conversoes:
+
+        def _converter_lote(
+            conn, inicio, fim, tabela=tabela, real=coluna_real, centavos=coluna_centavos
+        ):
+            conn.execute(
+                f"""
+                UPDATE {tabela}
+                SET {centavos} = CAST(ROUND(COALESCE({real}, 0) * 100) AS INTEGER)
+                WHERE id > ? AND id <= ? AND {centavos} IS NULL
+            """,
+                (inicio, fim),
+            )
+
+        migrador.em_lotes(tabela, _converter_lote, etapa=f"{tabela}.{coluna_centavos}")
+
+
+def _migracao_provisionamento(migrador: "MigradorEsquema"):
+    """Versão de provisionamento dos usuários"""
+    migrador.adicionar_colunas(
+        ("usuarios", "provisionado_versao", "INTEGER DEFAULT 0")
+    )
+
+
+def _migracao_resumo_mensal(migrador: "MigradorEsquema"):
+    """Resumo mensal por categoria, preenchido a partir do histórico"""
+    migrador.ddl(
+        """
+        CREATE TABLE IF NOT EXISTS resumo_mensal (
+            user_id INTEGER NOT NULL,
+            ano_mes TEXT NOT NULL,
+            categoria_id INTEGER NOT NULL,
+            tipo TEXT NOT NULL,
+            total_centavos INTEGER NOT NULL DEFAULT 0,
+            quantidade INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, ano_mes, categoria_id, tipo)
+        ) WITHOUT ROWID
+    """
+    )
+    # Lançamentos criados depois do início da cópia entram no resumo pelo
+    # próprio inserir_lancamento, por isso o resumo é limpo no mesmo início
+    migrador.em_lotes(
+        "lancamentos",
+        lambda conn, inicio, fim: conn.execute(
+            """
+            INSERT INTO resumo_mensal (user_id, ano_mes, categoria_id, tipo,
+                                       total_centavos, quantidade)
+            SELECT user_id, substr(data_referencia, 1, 7), categoria_id, tipo,
+                   SUM(valor_centavos), COUNT(*)
+            FROM lancamentos
+            WHERE id > ? AND id <= ?
+              AND categoria_id IS NOT NULL AND tipo IS NOT NULL
+            GROUP BY 1, 2, 3, 4
+            ON CONFLICT (user_id, ano_mes, categoria_id, tipo) DO UPDATE SET
+                total_centavos = total_centavos + excluded.total_centavos,
+                quantidade = quantidade + excluded.quantidade
+        """,
+            (inicio, fim),
+        ),
+        antes=lambda conn: conn.execute("DELETE FROM resumo_mensal"),
+        etapa="resumo_mensal",
+    )
+
+
+def _migracao_saldos_domicilio(migrador: "MigradorEsquema"):
+    """Domicílio dos usuários e saldo mantido por domicílio"""
+    migrador.adicionar_colunas(("usuarios", "domicilio_id", "INTEGER DEFAULT 0"))
+    migrador.ddl(
+        """
+        CREATE TABLE IF NOT EXISTS saldos_domicilio (
+            domicilio_id INTEGER PRIMARY KEY,
+            saldo_centavos INTEGER NOT NULL DEFAULT 0,
+            versao INTEGER NOT NULL DEFAULT 0
+        )
+    """
+    )
+    migrador.em_lotes(
+        "lancamentos",
+        lambda conn, inicio, fim: conn.execute(
+            """
+            INSERT INTO saldos_domicilio (domicilio_id, saldo_centavos, versao)
+            SELECT COALESCE(u.domicilio_id, 0),
+                   SUM(CASE WHEN l.tipo = 'receita' THEN l.valor_centavos
+                            ELSE -l.valor_centavos END), 1
+            FROM lancamentos l
+            LEFT JOIN usuarios u ON u.user_id = l.user_id
+            WHERE l.id > ? AND l.id <= ?
+            GROUP BY 1
+            ON CONFLICT (domicilio_id) DO UPDATE SET
+                saldo_centavos = saldo_centavos + excluded.saldo_centavos,
+                versao = versao + 1
+        """,
+            (inicio, fim),
+        ),
+        antes=lambda conn: conn.execute("DELETE FROM saldos_domicilio"),
+        etapa="saldos_domicilio",
+    )
+
+
+def _migracao_indices(migrador: "MigradorEsquema"):
+    """Índices das consultas mensais e das buscas por nome
+
+    Um índice por transação: o SQLite não cria índices sem bloquear as
+    escritas, então o lock de cada um dura só a sua construção.
+    """
+    for indice in (
+        "idx_lancamentos_user_data ON lancamentos (user_id, data_referencia)",
+        "idx_lancamentos_categoria_tipo_data "
+        "ON lancamentos (categoria_id, tipo, data_referencia)",
+        "idx_lancamentos_data ON lancamentos (data_referencia)",
+        "idx_limites_user ON limites_gastos (user_id, categoria_id)",
+        "idx_categorias_user_nome ON categorias (user_id, nome, tipo)",
+        "idx_responsaveis_user_nome ON responsaveis (user_id, nome)",
+        "idx_metodos_user_nome ON metodos_pagamento (user_id, nome)",
+        "idx_contas_user_nome ON contas (user_id, nome)",
+        "idx_resumo_mensal_ano_mes ON resumo_mensal (ano_mes)",
+        "idx_usuarios_domicilio ON usuarios (domicilio_id)",
+    ):
+        migrador.ddl(f"CREATE INDEX IF NOT EXISTS {indice}")
+
+
+def _migracao_parcelamentos(migrador: "MigradorEsquema"):
+    """Planos de parcelamento e o vínculo das parcelas com o plano"""
+    migrador.adicionar_colunas(("lancamentos", "parcelamento_id", "INTEGER"))
+    migrador.ddl(
+        """
+        CREATE TABLE IF NOT EXISTS parcelamentos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            categoria TEXT NOT NULL,
+            tipo TEXT NOT NULL,
+            valor_centavos INTEGER NOT NULL,
+            descricao TEXT,
+            metodo_pagamento TEXT,
+            responsavel TEXT,
+            data_inicio DATE NOT NULL,
+            parcela_inicial INTEGER NOT NULL,
+            total_parcelas INTEGER NOT NULL,
+            proxima_parcela INTEGER,
+            proxima_data DATE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES usuarios (user_id)
+        )
+    """,
+        "CREATE INDEX IF NOT EXISTS idx_parcelamentos_proxima_data "
+        "ON parcelamentos (proxima_data) WHERE proxima_data IS NOT NULL",
+    )
+
+
+def _migracao_parcelamentos_usuario(migrador: "MigradorEsquema"):
+    """Planos pendentes por usuário, para projetar as parcelas na leitura"""
+    migrador.ddl(
+        "CREATE INDEX IF NOT EXISTS idx_parcelamentos_usuario "
+        "ON parcelamentos (user_id, proxima_data) WHERE proxima_data IS NOT NULL"
+    )
+
+
+def _migracao_cache_relatorios(migrador: "MigradorEsquema"):
+    """Relatórios mensais registrados por usuário/mês com hash do conteúdo"""
+    migrador.adicionar_colunas(("relatorios_mensais", "hash_conteudo", "TEXT"))
+    migrador.ddl(
+        """
+        DELETE FROM relatorios_mensais WHERE id NOT IN (
+            SELECT MAX(id) FROM relatorios_mensais GROUP BY user_id, ano, mes
+        )
+    """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_relatorios_mensais_usuario_mes "
+        "ON relatorios_mensais (user_id, ano, mes)",
+    )
+
+
+def _migracao_meses_fechados(migrador: "MigradorEsquema"):
+    """Resumo imutável dos meses encerrados"""
+    migrador.ddl(
+        """
+        CREATE TABLE IF NOT EXISTS meses_fechados (
+            user_id INTEGER NOT NULL,
+            ano_mes TEXT NOT NULL,
+            resumo TEXT NOT NULL,
+            fechado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, ano_mes)
+        )
+    """
+    )
+
+
+def _migracao_limites_unicos(migrador: "MigradorEsquema"):
+    """Um limite por usuário, categoria e período"""
+    # O índice antigo não era único: o INSERT OR REPLACE do /limite
+    # acumulava linhas em vez de substituir o limite
+    migrador.ddl(
+        """
+        DELETE FROM limites_gastos WHERE id NOT IN (
+            SELECT MAX(id) FROM limites_gastos
+            GROUP BY user_id, categoria_id, periodo
+        )
+    """,
+        "DROP INDEX IF EXISTS idx_limites_user",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_limites_user_categoria "
+        "ON limites_gastos (user_id, categoria_id, periodo)",
+    )
+
+
+def _migracao_gastos_diarios(migrador: "MigradorEsquema"):
+    """Despesas diárias acumuladas por categoria, para limites em janela móvel"""
+    migrador.ddl(
+        """
+        CREATE TABLE IF NOT EXISTS gastos_diarios (
+            user_id INTEGER NOT NULL,
+            categoria_id INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            total_centavos INTEGER NOT NULL DEFAULT 0,
+            acumulado_centavos INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, categoria_id, data)
+        ) WITHOUT ROWID
+    """
+    )
+    # Os totais diários vêm em lotes; o acumulado é refeito de uma vez no
+    # fim, corrigindo também os lançamentos gravados durante a cópia
+    migrador.em_lotes(
+        "lancamentos",
+        lambda conn, inicio, fim: conn.execute(
+            f"""
+            INSERT INTO gastos_diarios (user_id, categoria_id, data,
+                                        total_centavos, acumulado_centavos)
+            {SQL_GASTOS_DIARIOS_RECALCULADOS} AND id > ? AND id <= ?
+            GROUP BY 1, 2, 3
+            ON CONFLICT (user_id, categoria_id, data) DO UPDATE SET
+                total_centavos = total_centavos + excluded.total_centavos
+        """,
+            (inicio, fim),
+        ),
+        antes=lambda conn: conn.execute("DELETE FROM gastos_diarios"),
+        etapa="gastos_diarios",
+    )
+    migrador.ddl(SQL_RECALCULAR_GASTOS_ACUMULADOS)
+
+
+def _migracao_aportes_metas(migrador: "MigradorEsquema"):
+    """Livro de aportes das metas e regra de aporte das receitas"""
+    migrador.adicionar_colunas(
+        ("metas", "percentual_receitas", "REAL"),
+        ("metas", "primeiro_aporte", "DATE"),
+    )
+    migrador.ddl(
+        """
+        CREATE TABLE IF NOT EXISTS aportes_metas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            meta_id INTEGER NOT NULL,
+            lancamento_id INTEGER,
+            valor_centavos INTEGER NOT NULL,
+            origem TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (meta_id) REFERENCES metas (id),
+            FOREIGN KEY (lancamento_id) REFERENCES lancamentos (id)
+        )
+    """,
+        "CREATE INDEX IF NOT EXISTS idx_aportes_metas_meta "
+        "ON aportes_metas (meta_id, data)",
+        "CREATE INDEX IF NOT EXISTS idx_metas_user ON metas (user_id)",
+    )
+
+
+# (versão, descrição, função) em ordem de aplicação; nunca altere uma
+# migração já publicada, acrescente uma nova no fim
+MIGRACOES = [
+    (1, "esquema inicial", _migracao_esquema_inicial),
+    (2, "parcelamento dos lançamentos", _migracao_parcelamento),
+    (3, "valores em centavos", _migracao_valores_em_centavos),
+    (4, "provisionamento de usuários", _migracao_provisionamento),
+    (5, "resumo mensal", _migracao_resumo_mensal),
+    (6, "saldos por domicílio", _migracao_saldos_domicilio),
+    (7, "índices", _migracao_indices),
+    (8, "parcelamentos", _migracao_parcelamentos),
+    (9, "cache de relatórios mensais", _migracao_cache_relatorios),
+    (10, "meses fechados", _migracao_meses_fechados),
+    (11, "limites únicos por categoria", _migracao_limites_unicos),
+    (12, "gastos diários acumulados", _migracao_gastos_diarios),
+    (13, "aportes das metas", _migracao_aportes_metas),
+    (14, "parcelamentos por usuário", _migracao_parcelamentos_usuario),
+]
+
+VERSAO_ESQUEMA = MIGRACOES[-1][0]
+
+
+class MigradorEsquema:
+    """Aplica as migrações pendentes em ordem e registra a versão do esquema
+
+    progresso(descricao, processados, total) é chamado após cada lote; por
+    padrão o progresso vai para o log.
+    """
+
+    def __init__(
+        self, pool: PoolConexoes, tamanho_lote: int = 1000, progresso=None
+    ):
+        self.pool = pool
+        self.tamanho_lote = tamanho_lote
+        self.progresso = progresso or self._registrar_progresso
+        self._versao_em_andamento = None
+
+    @staticmethod
+    def _registrar_progresso(descricao: str, processados: int, total: int):
+        logger.info(f"Migração {descricao}: {processados}/{total} ids")
+
+    def versao_atual(self) -> int:
+        """Versão gravada no banco (0 para bancos sem controle de versão)"""
+        try:
+            linha = (
+                self.pool.obter_conexao()
+                .execute("SELECT MAX(versao) FROM versao_esquema")
+                .fetchone()
+            )
+        except sqlite3.OperationalError:
+            return 0
+        return linha[0] or 0
+
+    def pendentes(self) -> List[Tuple[int, str, object]]:
+        versao = self.versao_atual()
+        return [migracao for migracao in MIGRACOES if migracao[0] > versao]
+
+    def migrar(self, ate: int = VERSAO_ESQUEMA) -> int:
+        """Aplica as migrações pendentes até a versão `ate` e retorna a versão final"""
+        # Só tem efeito antes da primeira tabela: bancos novos já nascem com
+        # vacuum incremental (otimizar_banco)
+        self.pool.obter_conexao().execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self.ddl(
+            """
+            CREATE TABLE IF NOT EXISTS versao_esquema (
+                versao INTEGER PRIMARY KEY,
+                descricao TEXT NOT NULL,
+                aplicada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+            """
+            CREATE TABLE IF NOT EXISTS migracoes_progresso (
+                versao INTEGER NOT NULL,
+                etapa TEXT NOT NULL,
+                ultimo_id INTEGER NOT NULL,
+                id_maximo INTEGER NOT NULL,
+                PRIMARY KEY (versao, etapa)
+            )
+        """,
+        )
+
+        for versao, descricao, funcao in self.pendentes():
+            if versao > ate:
+                break
+            logger.info(f"Aplicando migração {versao}: {descricao}")
+            self._versao_em_andamento = versao
+            funcao(self)
+
+            def _registrar_versao(conn):
+                conn.execute(
+                    "INSERT INTO versao_esquema (versao, descricao) VALUES (?, ?)",
+                    (versao, descricao),
+                )
+                conn.execute(
+                    "DELETE FROM migracoes_progresso WHERE versao = ?", (versao,)
+                )
+
+            self.pool.executar_escrita(_registrar_versao)
+
+        self._versao_em_andamento = None
+        return self.versao_atual()
+
+    def ddl(self, *comandos: str):
+        """Executa os comandos numa única transação curta"""
+
+        def _executar(conn):
+            for comando in comandos:
+                conn.execute(comando)
+
+        self.pool.executar_escrita(_executar)
+
+    def adicionar_colunas(self, *colunas: Tuple[str, str, str]):
+        """Adiciona (tabela, coluna, definição) que ainda não existirem"""
+
+        def _adicionar(conn):
+            for tabela, coluna, definicao in colunas:
+                existentes = [
+                    linha["name"]
+                    for linha in conn.execute(f"PRAGMA table_info({tabela})")
+                ]
+                if coluna not in existentes:
+                    conn.execute(
+                        f"ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}"
+                    )
+
+        self.pool.executar_escrita(_adicionar)
+
+    def em_lotes(self, tabela: str, processar, antes=None, etapa: str = None):
+        """Chama processar(conn, inicio, fim) para os ids (inicio, fim] da tabela
+
+        Cada lote é uma transação que também grava o progresso; numa nova
+        execução a etapa continua do último lote confirmado. Os ids são
+        limitados ao MAX(id) do início da etapa, quando antes(conn) também
+        roda; linhas novas ficam a cargo do código da aplicação.
+        """
+        versao = self._versao_em_andamento
+        etapa = etapa or tabela
+
+        def _iniciar(conn):
+            linha = conn.execute(
+                "SELECT ultimo_id, id_maximo FROM migracoes_progresso "
+                "WHERE versao = ? AND etapa = ?",
+                (versao, etapa),
+            ).fetchone()
+            if linha:
+                return linha[0], linha[1]
+
+            if antes is not None:
+                antes(conn)
+            id_maximo = conn.execute(
+                f"SELECT COALESCE(MAX(id), 0) FROM {tabela}"
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO migracoes_progresso (versao, etapa, ultimo_id, id_maximo) "
+                "VALUES (?, ?, 0, ?)",
+                (versao, etapa, id_maximo),
+            )
+            return 0, id_maximo
+
+        ultimo_id, id_maximo = self.pool.executar_escrita(_iniciar)
+
+        while ultimo_id < id_maximo:
+            fim = min(ultimo_id + self.tamanho_lote, id_maximo)
+
+            def _lote(conn, inicio=ultimo_id, fim=fim):
+                processar(conn, inicio, fim)
+                conn.execute(
+                    "UPDATE migracoes_progresso SET ultimo_id = ? "
+                    "WHERE versao = ? AND etapa = ?",
+                    (fim, versao, etapa),
+                )
+
+            self.pool.executar_escrita(_lote)
+            ultimo_id = fim
+            self.progresso(etapa, ultimo_id, id_maximo)
+
+
+# Consultas mensais: todas filtram data_referencia por intervalo semiaberto
+# e são verificadas por verificar_planos_consulta()
+SQL_RELATORIO_MENSAL = """
+    SELECT l.*, c.nome as categoria, r.nome as responsavel, m.nome as metodo
+    FROM lancamentos l
+    LEFT JOIN categorias c ON l.categoria_id = c.id
+    LEFT JOIN responsaveis r ON l.responsavel_id = r.id
+    LEFT JOIN metodos_pagamento m ON l.metodo_pagamento_id = m.id
+    WHERE l.user_id = ?
+    AND l.data_referencia >= ? AND l.data_referencia < ?
+"""
+
+# Planos projetados do usuário com parcelas ainda não lançadas antes do fim
+# do mês (parcelas_previstas)
+SQL_PARCELAS_PREVISTAS = """
+    SELECT categoria, tipo, valor_centavos, descricao, metodo_pagamento,
+           responsavel, data_inicio, parcela_inicial, total_parcelas,
+           proxima_parcela
+    FROM parcelamentos
+    WHERE user_id = ? AND proxima_data IS NOT NULL AND proxima_data < ?
+"""
+
+# Páginas do /mes por keyset em (data_referencia, id). Cada página junta
+# o resto do dia da posição (busca por rowid no índice (user_id,
+# data_referencia)) com os dias seguintes (ou anteriores): o custo não
+# depende de quantos lançamentos o mês ou o dia têm
+_LANCAMENTOS_PAGINA_MES = """
+    SELECT l.id, l.data_referencia, l.tipo, l.valor_centavos, l.descricao,
+           l.parcela_atual, l.total_parcelas, c.nome as categoria
+    FROM lancamentos l
+    LEFT JOIN categorias c ON l.categoria_id = c.id
+"""
+
+SQL_PAGINA_MES_SEGUINTE = f"""
+    SELECT * FROM (
+        {_LANCAMENTOS_PAGINA_MES}
+        WHERE l.user_id = ? AND l.data_referencia = ? AND l.id > ?
+        ORDER BY l.id LIMIT ?
+    )
+    UNION ALL
+    SELECT * FROM (
+        {_LANCAMENTOS_PAGINA_MES}
+        WHERE l.user_id = ? AND l.data_referencia > ? AND l.data_referencia < ?
+        ORDER BY l.data_referencia, l.id LIMIT ?
+    )
+    ORDER BY data_referencia, id
+    LIMIT ?
+"""
+
+SQL_PAGINA_MES_ANTERIOR = f"""
+    SELECT * FROM (
+        {_LANCAMENTOS_PAGINA_MES}
+        WHERE l.user_id = ? AND l.data_referencia = ? AND l.id < ?
+        ORDER BY l.id DESC LIMIT ?
+    )
+    UNION ALL
+    SELECT * FROM (
+        {_LANCAMENTOS_PAGINA_MES}
+        WHERE l.user_id = ? AND l.data_referencia >= ? AND l.data_referencia < ?
+        ORDER BY l.data_referencia DESC, l.id DESC LIMIT ?
+    )
+    ORDER BY data_referencia DESC, id DESC
+    LIMIT ?
+"""
+
+# Totais do mês pelo resumo mensal (O(categorias))
+SQL_TOTAIS_MES_RESUMO = """
+    SELECT tipo, SUM(total_centavos), SUM(quantidade) FROM resumo_mensal
+    WHERE user_id = ? AND ano_mes = ?
+    GROUP BY tipo
+"""
+
+SQL_LANCAMENTOS_PERIODO = """
+    SELECT l.id, l.tipo, l.valor_centavos, l.descricao, l.data_lancamento, c.nome as categoria, r.nome as responsavel
+    FROM lancamentos l
+    JOIN categorias c ON l.categoria_id = c.id
+    JOIN responsaveis r ON l.responsavel_id = r.id
+    WHERE l.data_referencia >= ? AND l.data_referencia < ?
+    ORDER BY l.data_lancamento DESC
+"""
+
+SQL_RESUMO_CATEGORIA_PERIODO = """
+    SELECT c.nome, r.tipo, SUM(r.total_centavos) as total
+    FROM resumo_mensal r
+    JOIN categorias c ON r.categoria_id = c.id
+    WHERE r.ano_mes = ?
+    GROUP BY c.nome, r.tipo
+    ORDER BY total DESC
+"""
+
+# Limites mensais comparados com o gasto do mês no resumo mensal, que é
+# atualizado na mesma transação de cada lançamento: uma busca pela chave
+# primária por limite, sem somar lançamentos
+SQL_VERIFICAR_LIMITES = """
+    SELECT c.nome, lg.valor_limite_centavos, COALESCE(r.total_centavos, 0) as gasto_atual
+    FROM limites_gastos lg
+    JOIN categorias c ON lg.categoria_id = c.id
+    LEFT JOIN resumo_mensal r ON r.user_id = lg.user_id AND r.ano_mes = ?
+        AND r.categoria_id = lg.categoria_id AND r.tipo = 'despesa'
+    WHERE lg.user_id = ? AND lg.periodo = 'mensal'
+        AND COALESCE(r.total_centavos, 0) > lg.valor_limite_centavos
+"""
+
+# Limites de uma categoria (todos os períodos) com o gasto do mês, lidos a
+# cada despesa
+SQL_LIMITES_CATEGORIA = """
+    SELECT c.nome, lg.valor_limite_centavos, lg.periodo,
+           COALESCE(r.total_centavos, 0) as gasto_mes
+    FROM limites_gastos lg
+    JOIN categorias c ON lg.categoria_id = c.id
+    LEFT JOIN resumo_mensal r ON r.user_id = lg.user_id AND r.ano_mes = ?
+        AND r.categoria_id = lg.categoria_id AND r.tipo = 'despesa'
+    WHERE lg.user_id = ? AND lg.categoria_id = ?
+"""
+
+# Limites em janela móvel do usuário
+SQL_LIMITES_JANELA_MOVEL = """
+    SELECT lg.categoria_id, c.nome, lg.valor_limite_centavos, lg.periodo
+    FROM limites_gastos lg
+    JOIN categorias c ON lg.categoria_id = c.id
+    WHERE lg.user_id = ? AND lg.periodo != 'mensal'
+"""
+
+# Gasto de uma categoria na janela (inicio, fim]: duas buscas pela chave
+# primária de gastos_diarios, qualquer que seja o tamanho da janela
+SQL_GASTO_JANELA = """
+    SELECT COALESCE((
+        SELECT acumulado_centavos FROM gastos_diarios
+        WHERE user_id = ?1 AND categoria_id = ?2 AND data <= ?4
+        ORDER BY data DESC LIMIT 1
+    ), 0) - COALESCE((
+        SELECT acumulado_centavos FROM gastos_diarios
+        WHERE user_id = ?1 AND categoria_id = ?2 AND data <= ?3
+        ORDER BY data DESC LIMIT 1
+    ), 0)
+"""
+
+# Período do limite -> (dias da janela móvel terminada hoje, descrição);
+# "mensal" é o mês do calendário, lido do resumo mensal
+PERIODOS_LIMITE = {
+    "diario": (1, "hoje"),
+    "semanal": (7, "nos últimos 7 dias"),
+    "quinzenal": (14, "nos últimos 14 dias"),
+    "mensal": (None, "no mês"),
+    "anual": (365, "nos últimos 365 dias"),
+}
+
+
+def gasto_na_janela(
+    conn: sqlite3.Connection,
+    user_id: int,
+    categoria_id: int,
+    dias: int,
+    ate: date = None,
+) -> int:
+    """Despesas da categoria nos `dias` dias terminados em `ate` (padrão hoje)"""
+    ate = ate or datetime.utcnow().date()
+    inicio = ate - timedelta(days=dias)
+    return conn.execute(
+        SQL_GASTO_JANELA, (user_id, categoria_id, inicio.isoformat(), ate.isoformat())
+    ).fetchone()[0]
+
+
+# Percentuais do limite mensal que, ao serem atingidos, geram um alerta
+LIMIARES_ALERTA_LIMITE = (80, 100)
+
+
+def limiar_atingido(antes_centavos: int, depois_centavos: int, limite_centavos: int):
+    """Maior limiar de alerta cruzado pelo gasto (None se nenhum)"""
+    cruzados = [
+        limiar
+        for limiar in LIMIARES_ALERTA_LIMITE
+        if antes_centavos * 100 < limiar * limite_centavos <= depois_centavos * 100
+    ]
+    return max(cruzados) if cruzados and limite_centavos > 0 else None
+
+
+# Totais do mês por (categoria, responsável, método, dia, tipo), base do
+# resumo de um mês fechado
+SQL_TOTAIS_MES = """
+    SELECT c.nome as categoria, r.nome as responsavel, m.nome as metodo,
+           l.data_referencia as dia, l.tipo,
+           SUM(l.valor_centavos) as total, COUNT(*) as quantidade
+    FROM lancamentos l
+    LEFT JOIN categorias c ON l.categoria_id = c.id
+    LEFT JOIN responsaveis r ON l.responsavel_id = r.id
+    LEFT JOIN metodos_pagamento m ON l.metodo_pagamento_id = m.id
+    WHERE l.user_id = ?
+    AND l.data_referencia >= ? AND l.data_referencia < ?
+    GROUP BY categoria, responsavel, metodo, dia, l.tipo
+"""
+
+SQL_RELATORIO_EM_CACHE = """
+    SELECT arquivo_path, hash_conteudo FROM relatorios_mensais
+    WHERE user_id = ? AND ano = ? AND mes = ?
+"""
+
+CONSULTAS_MENSAIS = {
+    "gerar_relatorio_mensal": (SQL_RELATORIO_MENSAL, (0, "2000-01-01", "2000-02-01")),
+    "mes_command (seguinte)": (
+        SQL_PAGINA_MES_SEGUINTE,
+        (0, "2000-01-01", 0, 11, 0, "2000-01-01", "2000-02-01", 11, 11),
+    ),
+    "mes_command (anterior)": (
+        SQL_PAGINA_MES_ANTERIOR,
+        (0, "2000-01-31", 0, 11, 0, "2000-01-01", "2000-01-31", 11, 11),
+    ),
+    "mes_command (totais)": (SQL_TOTAIS_MES_RESUMO, (0, "2000-01")),
+    "obter_lancamentos_por_periodo": (
+        SQL_LANCAMENTOS_PERIODO,
+        ("2000-01-01", "2000-02-01"),
+    ),
+    "obter_resumo_por_categoria": (SQL_RESUMO_CATEGORIA_PERIODO, ("2000-01",)),
+    "verificar_limites": (SQL_VERIFICAR_LIMITES, ("2000-01", 0)),
+    "alertas_limite": (SQL_LIMITES_CATEGORIA, ("2000-01", 0, 0)),
+    "limites (janela móvel)": (SQL_LIMITES_JANELA_MOVEL, (0,)),
+    "limites (gasto na janela)": (SQL_GASTO_JANELA, (0, 0, "2000-01-01", "2000-01-08")),
+    "relatorio_em_cache": (SQL_RELATORIO_EM_CACHE, (0, 2000, 1)),
+    "parcelas_previstas": (SQL_PARCELAS_PREVISTAS, (0, "2000-02-01")),
+    "calcular_resumo_mes": (SQL_TOTAIS_MES, (0, "2000-01-01", "2000-02-01")),
+}
+
+# Exportação completa (/exportar): valor e data já saem formatados do SQLite,
+# então as linhas do cursor vão direto para o csv.writer
+SQL_EXPORTACAO_CSV = """
+    SELECT l.id, l.tipo,
+           printf('%s%d.%02d', CASE WHEN l.valor_centavos < 0 THEN '-' ELSE '' END,
+                  abs(l.valor_centavos) / 100, abs(l.valor_centavos) % 100),
+           l.descricao,
+           COALESCE(strftime('%d/%m/%Y %H:%M', l.data_lancamento), l.data_lancamento),
+           c.nome, r.nome
+    FROM lancamentos l
+    JOIN categorias c ON l.categoria_id = c.id
+    JOIN responsaveis r ON l.responsavel_id = r.id
+    ORDER BY l.data_lancamento DESC
+"""
+
+COLUNAS_EXPORTACAO_CSV = [
+    "id",
+    "tipo",
+    "valor",
+    "descricao",
+    "data_lancamento",
+    "categoria",
+    "responsavel",
+]
+
+# Linhas lidas do cursor por vez e bytes mantidos em memória antes de o
+# arquivo da exportação passar para o disco
+LINHAS_POR_LOTE_EXPORTACAO = 500
+MEMORIA_MAXIMA_EXPORTACAO = 1024 * 1024
+
+
+def verificar_planos_consulta(conn: sqlite3.Connection) -> List[str]:
+    """Roda EXPLAIN QUERY PLAN nas consultas mensais
+
+    Retorna a lista de problemas encontrados: cada consulta que percorre
+    uma tabela inteira (SCAN) em vez de usar um índice (SEARCH). Percorrer
+    o resultado já limitado de uma subconsulta, ou a linha única de um
+    SELECT sem FROM, não conta.
+    """
+    problemas = []
+    for nome, (sql, parametros) in CONSULTAS_MENSAIS.items():
+        for linha in conn.execute(f"EXPLAIN QUERY PLAN {sql}", parametros):
+            detalhe = linha[3]
+            if detalhe.startswith(("SCAN (subquery", "SCAN CONSTANT ROW")):
+                continue
+            if detalhe.startswith("SCAN "):
+                problemas.append(f"{nome}: {detalhe}")
+    return problemas
+
+
+# Linhas amostradas por índice no ANALYZE, lançamentos a partir dos quais
+# vale gravar estatísticas e páginas livres devolvidas ao sistema por
+# execução do vacuum incremental
+LIMITE_ANALISE = 1000
+MINIMO_LANCAMENTOS_ANALISE = 1000
+PAGINAS_VACUUM_INCREMENTAL = 2000
+
+
+def otimizar_banco(pool: PoolConexoes) -> Dict:
+    """Atualiza as estatísticas do planejador e devolve páginas livres
+
+    O ANALYZE é amostrado (analysis_limit) para não varrer tabelas
+    grandes e fica para depois em bancos quase vazios: estatísticas de
+    poucas linhas levariam o planejador a trocar os índices por SCAN.
+    O vacuum incremental só tem efeito em bancos criados com
+    auto_vacuum=INCREMENTAL; bancos antigos precisam de um VACUUM manual
+    para mudar de modo.
+    """
+
+    def _otimizar(conn):
+        # MAX(id) pelo rowid: uma estimativa sem percorrer a tabela
+        lancamentos = conn.execute("SELECT MAX(id) FROM lancamentos").fetchone()[0]
+        analisado = (lancamentos or 0) >= MINIMO_LANCAMENTOS_ANALISE
+        if analisado:
+            conn.execute(f"PRAGMA analysis_limit = {LIMITE_ANALISE}")
+            conn.execute("ANALYZE")
+        livres = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        incremental = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        if incremental:
+            # O sqlite3 do Python avança o pragma um único passo (uma página)
+            # por execute
+            for _ in range(min(livres, PAGINAS_VACUUM_INCREMENTAL)):
+                conn.execute("PRAGMA incremental_vacuum(1)")
+        return {
+            "analisado": analisado,
+            "paginas_livres": livres,
+            "paginas_livres_restantes": conn.execute(
+                "PRAGMA freelist_count"
+            ).fetchone()[0],
+            "vacuum_incremental": incremental,
+        }
+
+    return pool.executar_escrita(_otimizar)
+
+
+def calcular_resumo_mes(
+    conn: sqlite3.Connection, user_id: int, ano: int, mes: int
+) -> Dict:
+    """Resumo compacto do mês a partir dos lançamentos
+
+    Totais gerais e, para categoria, responsável, método e dia, um dict
+    nome -> {"receita": centavos, "despesa": centavos}.
+    """
+    resumo = {
+        "receita": 0,
+        "despesa": 0,
+        "quantidade": 0,
+        "categorias": {},
+        "responsaveis": {},
+        "metodos": {},
+        "dias": {},
+    }
+    inicio, fim = intervalo_mes(ano, mes)
+    for linha in conn.execute(SQL_TOTAIS_MES, (user_id, inicio, fim)):
+        tipo = linha["tipo"]
+        if tipo not in ("receita", "despesa"):
+            continue
+        resumo[tipo] += linha["total"]
+        resumo["quantidade"] += linha["quantidade"]
+        for dimensao, nome in (
+            ("categorias", linha["categoria"]),
+            ("responsaveis", linha["responsavel"]),
+            ("metodos", linha["metodo"]),
+            ("dias", linha["dia"]),
+        ):
+            totais = resumo[dimensao].setdefault(
+                nome or "-", {"receita": 0, "despesa": 0}
+            )
+            totais[tipo] += linha["total"]
+    return resumo
+
+
+def fechar_mes(conn: sqlite3.Connection, user_id: int, ano: int, mes: int) -> Dict:
+    """Grava o resumo do mês em meses_fechados, na transação do chamador"""
+    resumo = calcular_resumo_mes(conn, user_id, ano, mes)
+    conn.execute(
+        "INSERT OR REPLACE INTO meses_fechados (user_id, ano_mes, resumo) "
+        "VALUES (?, ?, ?)",
+        (user_id, f"{ano:04d}-{mes:02d}", json.dumps(resumo, ensure_ascii=False)),
+    )
+    return resumo
+
+
+def fechar_meses(pool: "PoolConexoes", antes_de: str = None) -> int:
+    """Fecha os meses anteriores a `antes_de` (YYYY-MM, padrão o mês atual)
+    que têm lançamentos e ainda não foram fechados
+
+    Cada mês é fechado na sua própria transação. Retorna quantos foram
+    fechados.
+    """
+    antes_de = antes_de or ano_mes_atual()
+    pendentes = pool.obter_conexao().execute(
+        """
+        SELECT DISTINCT r.user_id, r.ano_mes FROM resumo_mensal r
+        WHERE r.ano_mes < ? AND r.quantidade > 0 AND NOT EXISTS (
+            SELECT 1 FROM meses_fechados f
+            WHERE f.user_id = r.user_id AND f.ano_mes = r.ano_mes
+        )
+    """,
+        (antes_de,),
+    ).fetchall()
+
+    for user_id, ano_mes in pendentes:
+        ano, mes = int(ano_mes[:4]), int(ano_mes[5:7])
+        pool.executar_escrita(
+            lambda conn, user_id=user_id, ano=ano, mes=mes: fechar_mes(
+                conn, user_id, ano, mes
+            )
+        )
+    return len(pendentes)
+
 
+def obter_resumo_mes(
+    pool: "PoolConexoes", user_id: int, ano: int, mes: int
+) -> Tuple[Dict, bool]:
+    """Retorna (resumo, fechado) do mês
 
-def get_database_connection():
-    """Retorna conexão com o banco de dados"""
-    return sqlite3.connect("financeiro.db")
+    Um mês fechado é lido só de meses_fechados. Um mês já encerrado e ainda
+    não fechado é fechado agora; o mês atual e os futuros são calculados
+    dos lançamentos.
+    """
+    ano_mes = f"{ano:04d}-{mes:02d}"
+    linha = (
+        pool.obter_conexao()
+        .execute(
+            "SELECT resumo FROM meses_fechados WHERE user_id = ? AND ano_mes = ?",
+            (user_id, ano_mes),
+        )
+        .fetchone()
+    )
+    if linha:
+        return json.loads(linha[0]), True
 
+    if ano_mes < ano_mes_atual():
+        return (
+            pool.executar_escrita(lambda conn: fechar_mes(conn, user_id, ano, mes)),
+            True,
+        )
+    return calcular_resumo_mes(pool.obter_conexao(), user_id, ano, mes), False
 
-def gerar_relatorio_mensal(user_id: int, mes: int, ano: int) -> str:
-    """Gera relatório mensal em CSV"""
-    conn = get_database_connection()
-    cursor = conn.cursor()
 
-    os.makedirs("relatorios", exist_ok=True)
-    filepath = os.path.join("relatorios", f"relatorio_{mes:02d}_{ano}.csv")
+DIRETORIO_RELATORIOS = "relatorios"
 
-    cursor.execute(
-        """
-        SELECT l.*, c.nome as categoria, r.nome as responsavel, m.nome as metodo
-        FROM lancamentos l
-        LEFT JOIN categorias c ON l.categoria_id = c.id
-        LEFT JOIN responsaveis r ON l.responsavel_id = r.id
-        LEFT JOIN metodos_pagamento m ON l.metodo_pagamento_id = m.id
-        WHERE l.user_id = ? 
-        AND strftime('%m', l.data_referencia) = ?
-        AND strftime('%Y', l.data_referencia) = ?
-    """,
-        (user_id, f"{mes:02d}", str(ano)),
+
+def parcelas_previstas(
+    conn: sqlite3.Connection, user_id: int, ano: int, mes: int
+) -> List[Dict]:
+    """Parcelas dos planos projetados que caem no mês e ainda não foram
+    lançadas, em ordem de data
+
+    São calculadas a partir de parcelamentos na leitura: a parcela só é
+    gravada quando o dia dela chega (TarefasManutencao).
+    """
+    previstas = []
+    for plano in conn.execute(
+        SQL_PARCELAS_PREVISTAS, (user_id, intervalo_mes(ano, mes)[1])
+    ):
+        data_inicio = date.fromisoformat(plano["data_inicio"])
+        deslocamento = (ano - data_inicio.year) * 12 + mes - data_inicio.month
+        parcela = plano["parcela_inicial"] + deslocamento
+        if not plano["proxima_parcela"] <= parcela <= plano["total_parcelas"]:
+            continue
+        previstas.append(
+            dict(
+                plano,
+                data_referencia=somar_meses(data_inicio, deslocamento).isoformat(),
+                parcela_atual=parcela,
+            )
+        )
+    return sorted(previstas, key=lambda parcela: parcela["data_referencia"])
+
+
+def gerar_relatorio_mensal(
+    user_id: int, mes: int, ano: int, pool: PoolConexoes = None
+) -> str:
+    """Gera relatório mensal em CSV e retorna o caminho do arquivo
+
+    O relatório fica registrado em relatorios_mensais e é reaproveitado até
+    um lançamento do mês ser gravado (invalidar_relatorios_mensais): nesse
+    caso basta uma consulta pelo índice (user_id, ano, mes).
+
+    O CSV é lido e escrito pela conexão de leitura, fora do escritor, que só
+    recebe duas transações curtas: reservar o registro do mês antes da
+    leitura e gravar o arquivo depois. Um lançamento do mês gravado no meio
+    apaga a reserva, e o arquivo é devolvido sem entrar no cache.
+    """
+    pool = pool or obter_pool()
+    registro = (
+        pool.obter_conexao()
+        .execute(SQL_RELATORIO_EM_CACHE, (user_id, ano, mes))
+        .fetchone()
     )
+    if (
+        registro
+        and registro["hash_conteudo"]
+        and os.path.exists(registro["arquivo_path"])
+    ):
+        return registro["arquivo_path"]
+
+    # Reserva: hash_conteudo nulo até o arquivo ficar pronto
+    reserva = pool.executar_escrita(
+        lambda conn: conn.execute(
+            """
+            INSERT INTO relatorios_mensais (user_id, mes, ano, arquivo_path)
+            VALUES (?, ?, ?, '')
+            ON CONFLICT (user_id, ano, mes) DO UPDATE SET hash_conteudo = NULL
+            RETURNING id, arquivo_path
+        """,
+            (user_id, mes, ano),
+        ).fetchone()
+    )
+
+    conn = pool.obter_conexao()
+    inicio, fim = intervalo_mes(ano, mes)
+    lancamentos = conn.execute(SQL_RELATORIO_MENSAL, (user_id, inicio, fim))
 
-    lancamentos = cursor.fetchall()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(
+        [
+            "Data",
+            "Tipo",
+            "Valor",
+            "Categoria",
+            "Descrição",
+            "Responsável",
+            "Método",
+            "Parcela",
+        ]
+    )
 
-    with open(filepath, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
+    for l in lancamentos:
+        parcela_info = (
+            f"[{l['parcela_atual']}/{l['total_parcelas']}]"
+            if l["parcela_atual"]
+            else ""
+        )
         writer.writerow(
             [
-                "Data",
-                "Tipo",
-                "Valor",
-                "Categoria",
-                "Descrição",
-                "Responsável",
-                "Método",
-                "Parcela",
+                l["data_referencia"],
+                l["tipo"],
+                formatar_decimal(l["valor_centavos"]),
+                l["categoria"],
+                l["descricao"],
+                l["responsavel"],
+                l["metodo"],
+                parcela_info,
             ]
         )
 
-        for l in lancamentos:
-            parcela_info = (
-                f"[{l['parcela_atual']}/{l['total_parcelas']}]"
-                if l["parcela_atual"]
-                else ""
-            )
-            writer.writerow(
-                [
-                    l["data_lancamento"],
-                    l["tipo"],
-                    l["valor"],
-                    l["categoria"],
-                    l["descricao"],
-                    l["responsavel"],
-                    l["metodo"],
-                    parcela_info,
-                ]
-            )
+    # Parcelas futuras dos planos projetados: só previstas, não lançadas
+    for p in parcelas_previstas(conn, user_id, ano, mes):
+        writer.writerow(
+            [
+                p["data_referencia"],
+                p["tipo"],
+                formatar_decimal(p["valor_centavos"]),
+                p["categoria"],
+                p["descricao"],
+                p["responsavel"],
+                p["metodo_pagamento"],
+                f"[{p['parcela_atual']}/{p['total_parcelas']}] prevista",
+            ]
+        )
 
-    conn.close()
+    # O nome leva o hash do conteúdo: um relatório novo nunca sobrescreve
+    # um arquivo que ainda pode estar sendo enviado
+    conteudo = buffer.getvalue().encode("utf-8")
+    hash_conteudo = hashlib.sha256(conteudo).hexdigest()
+    diretorio = os.path.join(DIRETORIO_RELATORIOS, str(user_id))
+    os.makedirs(diretorio, exist_ok=True)
+    filepath = os.path.join(
+        diretorio, f"relatorio_{mes:02d}_{ano}_{hash_conteudo[:12]}.csv"
+    )
+    if not os.path.exists(filepath):
+        temporario = f"{filepath}.tmp"
+        with open(temporario, "wb") as f:
+            f.write(conteudo)
+        os.replace(temporario, filepath)
+
+    registrado = pool.executar_escrita(
+        lambda conn: conn.execute(
+            """
+            UPDATE relatorios_mensais
+            SET arquivo_path = ?, hash_conteudo = ?,
+                data_geracao = CURRENT_TIMESTAMP
+            WHERE id = ? AND hash_conteudo IS NULL
+        """,
+            (filepath, hash_conteudo, reserva["id"]),
+        ).rowcount
+    )
+    if registrado and reserva["arquivo_path"] not in ("", filepath):
+        apagar_arquivos([reserva["arquivo_path"]])
     return filepath
 
 
+def pre_gerar_relatorios(pool: PoolConexoes, ano: int = None, mes: int = None) -> int:
+    """Gera antecipadamente os relatórios do mês (padrão o mês anterior)
+
+    Usuários cujo relatório já está em cache custam uma consulta pelo
+    índice. Retorna quantos usuários têm lançamentos no mês.
+    """
+    if ano is None:
+        anterior = somar_meses(datetime.utcnow().date().replace(day=1), -1)
+        ano, mes = anterior.year, anterior.month
+    usuarios = [
+        linha[0]
+        for linha in pool.obter_conexao().execute(
+            "SELECT DISTINCT user_id FROM resumo_mensal "
+            "WHERE ano_mes = ? AND quantidade > 0",
+            (f"{ano:04d}-{mes:02d}",),
+        )
+    ]
+    for user_id in usuarios:
+        gerar_relatorio_mensal(user_id, mes, ano, pool)
+    return len(usuarios)
+
+
+# Metas do usuário carregadas para resolver os aportes de uma escrita
+SQL_METAS_APORTE = """
+    SELECT id, nome, valor_meta_centavos, valor_atual_centavos, percentual_receitas
+    FROM metas WHERE user_id = ?
+"""
+
+# Soma aportes ao valor atual da meta (a coluna REAL antiga é derivada)
+SQL_SOMAR_APORTE_META = """
+    UPDATE metas
+    SET valor_atual_centavos = valor_atual_centavos + ?,
+        valor_atual = (valor_atual_centavos + ?) / 100.0,
+        primeiro_aporte = COALESCE(primeiro_aporte, ?)
+    WHERE id = ?
+"""
+
+DIAS_POR_MES = 365.25 / 12
+# Histórico mínimo (dias) para estimar o ritmo de aportes: um aporte feito
+# hoje não vira um ritmo de 30 aportes por mês
+DIAS_MINIMOS_RITMO_META = 30
+
+
+def chave_meta(nome: str) -> str:
+    """Nome da meta sem acentos, espaços e pontuação ("Viagem de Casamento"
+    -> "viagemdecasamento"), para comparar com um #nome"""
+    return re.sub(r"[^a-z0-9]", "", dobrar_acentos(nome))
+
+
+def encontrar_meta(metas, nome: str) -> Optional[Dict]:
+    """Meta citada por #nome: a de nome igual ou, senão, a mais recente cujo
+    nome começa com ele"""
+    chave = chave_meta(nome)
+    if not chave:
+        return None
+    candidatas = sorted(metas, key=lambda meta: meta["id"], reverse=True)
+    for meta in candidatas:
+        if chave_meta(meta["nome"]) == chave:
+            return meta
+    for meta in candidatas:
+        if chave_meta(meta["nome"]).startswith(chave):
+            return meta
+    return None
+
+
+def projetar_meta(
+    valor_meta_centavos: int,
+    valor_atual_centavos: int,
+    primeiro_aporte: Optional[str],
+    data_limite: Optional[str],
+    hoje: date = None,
+) -> Dict:
+    """Progresso, ritmo e projeções de uma meta a partir dos seus contadores
+
+    O ritmo mensal é a média desde o primeiro aporte; a data prevista segue
+    esse ritmo e o aporte necessário divide o que falta pelos meses até o
+    prazo. Não lê o livro de aportes.
+    """
+    hoje = hoje or datetime.utcnow().date()
+    restante = max(0, valor_meta_centavos - valor_atual_centavos)
+    projecao = {
+        "progresso": (
+            valor_atual_centavos * 100 / valor_meta_centavos
+            if valor_meta_centavos > 0
+            else 0
+        ),
+        "restante_centavos": restante,
+        "ritmo_mensal_centavos": None,
+        "data_prevista": None,
+        "necessario_mensal_centavos": None,
+        "prazo_vencido": False,
+    }
+
+    if primeiro_aporte and valor_atual_centavos > 0:
+        dias = max(
+            DIAS_MINIMOS_RITMO_META,
+            (hoje - date.fromisoformat(primeiro_aporte)).days + 1,
+        )
+        ritmo_diario = valor_atual_centavos / dias
+        projecao["ritmo_mensal_centavos"] = round(ritmo_diario * DIAS_POR_MES)
+        if restante:
+            try:
+                previsao = hoje + timedelta(days=math.ceil(restante / ritmo_diario))
+                projecao["data_prevista"] = previsao.isoformat()
+            except OverflowError:
+                pass  # ritmo baixo demais: sem previsão
+
+    try:
+        prazo = date.fromisoformat(data_limite) if data_limite else None
+    except ValueError:
+        prazo = None
+    if prazo and restante:
+        if prazo < hoje:
+            projecao["prazo_vencido"] = True
+        else:
+            meses = max(1, math.ceil((prazo - hoje).days / DIAS_POR_MES))
+            projecao["necessario_mensal_centavos"] = math.ceil(restante / meses)
+
+    return projecao
+
+
+# Janelas (em meses) das médias móveis do /tendencias
+JANELAS_MEDIA_MOVEL = (3, 6, 12)
+
+
+class LancamentosColunares(NamedTuple):
+    """Lançamentos de um domicílio em colunas NumPy (uma posição por lançamento)
+
+    categoria e responsavel são códigos nas listas de nomes; mes é o índice
+    ano * 12 + mês - 1 da data de referência. ultimo_id é o maior ID lido,
+    a partir do qual a próxima carga continua.
+    """
+
+    valor: "np.ndarray"
+    receita: "np.ndarray"
+    mes: "np.ndarray"
+    categoria: "np.ndarray"
+    responsavel: "np.ndarray"
+    categorias: List[str]
+    responsaveis: List[str]
+    ultimo_id: int
+
+
+def _codificar_nomes(
+    conn: sqlite3.Connection, tabela: str, ids: "np.ndarray", nomes: List[str]
+) -> Tuple["np.ndarray", List[str]]:
+    """Troca IDs de uma dimensão por códigos na lista de nomes
+
+    Nomes iguais de usuários diferentes do domicílio viram o mesmo código;
+    nomes novos são acrescentados ao fim de uma cópia da lista.
+    """
+    nomes = list(nomes)
+    codigos = {nome: codigo for codigo, nome in enumerate(nomes)}
+    tabela_codigos = np.zeros(int(ids.max(initial=0)) + 1, dtype=np.int64)
+    unicos = np.unique(ids)
+    for inicio in range(0, len(unicos), 500):
+        lote = [int(dimensao_id) for dimensao_id in unicos[inicio : inicio + 500]]
+        marcadores = ", ".join("?" * len(lote))
+        for dimensao_id, nome in conn.execute(
+            f"SELECT id, nome FROM {tabela} WHERE id IN ({marcadores})", lote
+        ):
+            if nome not in codigos:
+                codigos[nome] = len(nomes)
+                nomes.append(nome)
+            tabela_codigos[dimensao_id] = codigos[nome]
+    return tabela_codigos[ids], nomes
+
+
+def carregar_lancamentos_colunares(
+    conn: sqlite3.Connection,
+    domicilio_id: int,
+    anteriores: Optional[LancamentosColunares] = None,
+) -> LancamentosColunares:
+    """Lê os lançamentos do domicílio para arrays NumPy
+
+    Com `anteriores`, lê só os lançamentos gravados depois deles (IDs
+    maiores) e os acrescenta às colunas já carregadas.
+    """
+    usuarios = [
+        linha[0]
+        for linha in conn.execute(
+            "SELECT user_id FROM usuarios WHERE domicilio_id = ? "
+            "OR (domicilio_id IS NULL AND ? = ?)",
+            (domicilio_id, domicilio_id, DOMICILIO_PADRAO),
+        )
+    ]
+    marcadores = ", ".join("?" * len(usuarios))
+    apos_id = anteriores.ultimo_id if anteriores else 0
+    # Na carga incremental o "+" desliga o índice de user_id: poucos IDs
+    # novos são lidos direto pela faixa da chave primária
+    filtro_usuario = "+user_id" if apos_id else "user_id"
+    # Tuplas simples (sem sqlite3.Row) vão direto para o np.fromiter
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(
+        f"""
+        SELECT id, valor_centavos, tipo = 'receita',
+               CAST(substr(data_referencia, 1, 4) AS INTEGER) * 12
+                   + CAST(substr(data_referencia, 6, 2) AS INTEGER) - 1,
+               COALESCE(categoria_id, 0), COALESCE(responsavel_id, 0)
+        FROM lancamentos
+        WHERE {filtro_usuario} IN ({marcadores}) AND id > ?
+        AND data_referencia IS NOT NULL
+    """,
+        (*usuarios, apos_id),
+    )
+    linhas = np.fromiter(
+        cursor,
+        dtype=[
+            ("id", np.int64),
+            ("valor", np.int64),
+            ("receita", np.bool_),
+            ("mes", np.int64),
+            ("categoria", np.int64),
+            ("responsavel", np.int64),
+        ],
+    )
+    categoria, categorias = _codificar_nomes(
+        conn,
+        "categorias",
+        linhas["categoria"],
+        anteriores.categorias if anteriores else ["-"],
+    )
+    responsavel, responsaveis = _codificar_nomes(
+        conn,
+        "responsaveis",
+        linhas["responsavel"],
+        anteriores.responsaveis if anteriores else ["-"],
+    )
+    novos = LancamentosColunares(
+        linhas["valor"],
+        linhas["receita"],
+        linhas["mes"],
+        categoria,
+        responsavel,
+        categorias,
+        responsaveis,
+        int(linhas["id"].max(initial=apos_id)),
+    )
+    if anteriores is None:
+        return novos
+    return LancamentosColunares(
+        *(
+            np.concatenate([antiga, nova])
+            for antiga, nova in zip(anteriores[:5], novos[:5])
+        ),
+        *novos[5:],
+    )
+
+
+def _somar_por(
+    codigos: "np.ndarray", valores: "np.ndarray", tamanho: int
+) -> "np.ndarray":
+    """Soma valores (centavos) por código, sem perder precisão"""
+    # bincount soma em float64: exato até 2**53 centavos
+    return np.rint(
+        np.bincount(codigos, weights=valores, minlength=tamanho)
+    ).astype(np.int64)
+
+
+def _variacao(atual: "np.ndarray", base: "np.ndarray") -> "np.ndarray":
+    """Variação relativa de atual sobre base: NaN quando só há gasto atual,
+    0 quando não há gasto em nenhum dos dois"""
+    variacao = np.divide(
+        atual - base, base, out=np.full(len(atual), np.nan), where=base > 0
+    )
+    variacao[(base == 0) & (atual == 0)] = 0.0
+    return variacao
+
+
+def calcular_tendencias(dados: LancamentosColunares, ano: int, mes: int) -> Dict:
+    """Tendências de despesa até o mês informado, com operações vetorizadas
+
+    Monta a matriz categoria x mês do primeiro mês com lançamentos até o
+    mês de referência e calcula, para cada categoria, a variação sobre o
+    mês anterior, as médias móveis de JANELAS_MEDIA_MOVEL meses e a
+    comparação com o mesmo mês do ano anterior. Inclui a participação de
+    cada responsável nas despesas dos últimos 12 meses.
+    """
+    final = ano * 12 + mes - 1
+    despesa = ~dados.receita & (dados.mes <= final)
+    primeiro = int(dados.mes[despesa].min(initial=final))
+    # Pelo menos 13 meses para a comparação anual
+    primeiro = min(primeiro, final - 12)
+    meses = final - primeiro + 1
+    categorias = len(dados.categorias)
+
+    matriz = _somar_por(
+        dados.categoria[despesa] * meses + (dados.mes[despesa] - primeiro),
+        dados.valor[despesa],
+        categorias * meses,
+    ).reshape(categorias, meses)
+
+    # Médias móveis: diferença de somas acumuladas, para todos os meses
+    acumulado = np.concatenate(
+        [np.zeros((categorias, 1), dtype=np.int64), np.cumsum(matriz, axis=1)], axis=1
+    )
+    medias = {
+        janela: (acumulado[:, janela:] - acumulado[:, :-janela]) / janela
+        for janela in JANELAS_MEDIA_MOVEL
+    }
+
+    atual, anterior, ano_anterior = matriz[:, -1], matriz[:, -2], matriz[:, -13]
+    variacao_mensal = _variacao(atual, anterior)
+    variacao_anual = _variacao(atual, ano_anterior)
+
+    ativas = np.flatnonzero(matriz[:, -13:].any(axis=1))
+    ativas = ativas[np.argsort(-medias[12][ativas, -1], kind="stable")]
+
+    ultimos_12 = despesa & (dados.mes > final - 12)
+    por_responsavel = _somar_por(
+        dados.responsavel[ultimos_12],
+        dados.valor[ultimos_12],
+        len(dados.responsaveis),
+    )
+    total_12 = int(por_responsavel.sum())
+
+    return {
+        "ano": ano,
+        "mes": mes,
+        "total_atual": int(atual.sum()),
+        "total_anterior": int(anterior.sum()),
+        "variacao_total": float(
+            _variacao(atual.sum(keepdims=True), anterior.sum(keepdims=True))[0]
+        ),
+        "categorias": [
+            {
+                "nome": dados.categorias[codigo],
+                "atual": int(atual[codigo]),
+                "anterior": int(anterior[codigo]),
+                "ano_anterior": int(ano_anterior[codigo]),
+                "variacao_mensal": float(variacao_mensal[codigo]),
+                "variacao_anual": float(variacao_anual[codigo]),
+                **{
+                    f"media_{janela}": float(medias[janela][codigo, -1])
+                    for janela in JANELAS_MEDIA_MOVEL
+                },
+            }
+            for codigo in ativas
+        ],
+        "responsaveis": [
+            (
+                dados.responsaveis[codigo],
+                int(por_responsavel[codigo]),
+                por_responsavel[codigo] / total_12,
+            )
+            for codigo in np.argsort(-por_responsavel, kind="stable")
+            if por_responsavel[codigo] > 0
+        ],
+    }
+
+
+def dobrar_acentos(texto: str) -> str:
+    """Minúsculas sem acentos ("Almoço" -> "almoco"), para comparar palavras"""
+    texto = texto.lower()
+    if texto.isascii():
+        return texto
+    # Os acentos viram caracteres combinantes, descartados na conversão
+    return unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode()
+
+
+def _regex_trie(palavras) -> str:
+    """Alternativa regex das palavras organizada como trie ("ca(?:fe|sa)")
+
+    Com os prefixos fatorados, cada posição do texto testa só os ramos que
+    começam com o caractere atual.
+    """
+    raiz: Dict = {}
+    for palavra in palavras:
+        no = raiz
+        for caractere in palavra:
+            no = no.setdefault(caractere, {})
+        no[""] = {}
+
+    def _emitir(no: Dict) -> str:
+        ramos = [
+            re.escape(caractere) + _emitir(filho)
+            for caractere, filho in sorted(no.items())
+            if caractere
+        ]
+        if not ramos:
+            return ""
+        termina_aqui = "" in no
+        if len(ramos) == 1 and not termina_aqui:
+            return ramos[0]
+        return "(?:" + "|".join(ramos) + ")" + ("?" if termina_aqui else "")
+
+    return _emitir(raiz)
+
+
+class Token(NamedTuple):
+    """Token de uma mensagem: tipo, texto original e valor interpretado
+
+    tipo é "comando", "valor" (valor em centavos), "data" (ISO),
+    "parcelas" ((parcela_atual, total_parcelas)), "meta" (#nome da meta,
+    sem acentos), "percentual" (float) ou "palavras" (trecho de palavras
+    seguidas, valor None).
+    """
+
+    tipo: str
+    texto: str
+    valor: object
+
+
 class ParsingInteligente:
     """Classe responsável pelo parsing inteligente dos comandos"""
 
     def __init__(self):
-        # Adiciona campo para parcelamentos
-        self.padrao_parcelas = re.compile(r"\[(\d+)/(\d+)\]")
+        # Parcelamento no formato [1/12]
+        self.padrao_parcelas = re.compile(
+            r"\[(?P<parcela_atual>\d+)/(?P<total_parcelas>\d+)\]"
+        )
         # Palavras-chave para identificar tipos de transação
         self.palavras_receita = [
             "receita",
             "salário",
-            "salario",
             "renda",
             "entrada",
             "ganho",
             "bônus",
-            "bonus",
             "freelance",
             "venda",
             "investimento",
@@ -128,23 +2244,17 @@ class ParsingInteligente:
             "aluguel",
             "supermercado",
             "combustível",
-            "combustivel",
             "gasolina",
             "transporte",
             "alimentação",
-            "alimentacao",
             "lanche",
             "jantar",
             "almoço",
-            "almoco",
             "café",
-            "cafe",
             "farmácia",
-            "farmacia",
             "medicamento",
             "roupa",
             "calçado",
-            "calcado",
             "lazer",
             "cinema",
             "teatro",
@@ -155,43 +2265,34 @@ class ParsingInteligente:
             "telefone",
             "energia",
             "água",
-            "agua",
         ]
 
         # Categorias comuns
         self.categorias_comuns = {
             "alimentação": [
                 "alimentação",
-                "alimentacao",
                 "comida",
                 "lanche",
                 "jantar",
                 "almoço",
-                "almoco",
                 "café",
-                "cafe",
                 "restaurante",
                 "bar",
             ],
             "transporte": [
                 "transporte",
                 "combustível",
-                "combustivel",
                 "gasolina",
                 "uber",
                 "taxi",
                 "ônibus",
-                "onibus",
                 "metro",
             ],
             "saúde": [
                 "saúde",
-                "saude",
                 "farmácia",
-                "farmacia",
                 "medicamento",
                 "médico",
-                "medico",
                 "hospital",
                 "terapia",
             ],
@@ -202,27 +2303,22 @@ class ParsingInteligente:
                 "shopping",
                 "viagem",
                 "férias",
-                "ferias",
             ],
             "casa": [
                 "casa",
                 "aluguel",
                 "energia",
                 "água",
-                "agua",
                 "internet",
                 "telefone",
             ],
             "roupas": [
                 "roupa",
                 "calçado",
-                "calcado",
                 "vestuário",
-                "vestuario",
             ],
             "educação": [
                 "educação",
-                "educacao",
                 "curso",
                 "livro",
                 "escola",
@@ -231,23 +2327,31 @@ class ParsingInteligente:
             "investimentos": [
                 "investimento",
                 "poupança",
-                "poupanca",
                 "ações",
-                "acoes",
                 "fundos",
             ],
         }
 
-        # Padrões regex para extrair informações
-        self.padrao_valor = re.compile(r"(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)")
-        self.padrao_data = re.compile(r"(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})")
+        # Padrões regex para extrair informações. Valores: "25,50", "25.5",
+        # "5000", "1.234,56" ou "1,234.56", com "R$" opcional
+        self.padrao_valor = re.compile(
+            r"(?:R\$\s*)?"
+            r"(?P<valor>\d{1,3}(?:\.\d{3})+(?:,\d{1,2})?"
+            r"|\d{1,3}(?:,\d{3})+(?:\.\d{1,2})?"
+            r"|\d+(?:[.,]\d{1,2})?)"
+            r"[.,;:!?)]*(?=\s|$)"
+        )
+        self.padrao_data = re.compile(r"(?P<data>\d{1,2}[-/]\d{1,2}[-/]\d{2,4})(?!\w)")
+        # Meta de um aporte (/add 500 guardar #viagem) e percentual das
+        # receitas destinado a uma meta (/meta Viagem 20000 10%)
+        self.padrao_meta = re.compile(r"#(?P<meta>\w+)")
+        self.padrao_percentual = re.compile(r"(?P<percentual>\d+(?:[.,]\d{1,2})?)%")
 
         # Palavras-chave para métodos de pagamento
         self.metodos_pagamento = {
             "dinheiro": [
                 "dinheiro",
                 "cash",
-                "especie",
                 "espécie",
             ],
             "pix": [
@@ -255,16 +2359,12 @@ class ParsingInteligente:
             ],
             "cartao": [
                 "cartão",
-                "cartao",
-                "credito",
                 "crédito",
-                "debito",
                 "débito",
                 "visa",
                 "mastercard",
             ],
             "transferencia": [
-                "transferencia",
                 "transferência",
                 "ted",
                 "doc",
@@ -273,7 +2373,6 @@ class ParsingInteligente:
                 "conta",
                 "corrente",
                 "poupança",
-                "poupanca",
                 "nubank",
                 "itau",
                 "bradesco",
@@ -281,673 +2380,1714 @@ class ParsingInteligente:
             ],
         }
 
-    def parse_comando_add(self, texto: str) -> Dict:
+        self._compilar_palavras_chave()
+
+        # Analisador léxico: uma alternativa por tipo de token, na ordem de
+        # prioridade (uma data nunca é lida como valor)
+        self.padrao_tokens = re.compile(
+            "|".join(
+                [
+                    r"(?P<comando>\A/\S+)",
+                    f"(?P<parcelas>{self.padrao_parcelas.pattern})",
+                    self.padrao_meta.pattern,
+                    self.padrao_data.pattern,
+                    self.padrao_percentual.pattern,
+                    self.padrao_valor.pattern,
+                    r"(?P<palavras>\S+(?:\s+(?![\d\[#]|R\$)\S+)*)",
+                ]
+            )
+        )
+
+    def _compilar_palavras_chave(self):
+        """Compila todas as listas de palavras-chave numa única regex
+
+        As palavras são comparadas sem acentos. Cada palavra aponta para os
+        (dimensão, prioridade, valor) que ela indica; a prioridade segue a
+        ordem das listas: receita antes de despesa e categorias e métodos na
+        ordem dos dicionários.
+        """
+        tabelas = [("tipo", "receita", self.palavras_receita)]
+        tabelas.append(("tipo", "despesa", self.palavras_despesa))
+        tabelas += [
+            ("categoria", categoria, palavras)
+            for categoria, palavras in self.categorias_comuns.items()
+        ]
+        tabelas += [
+            ("metodo_pagamento", metodo, palavras)
+            for metodo, palavras in self.metodos_pagamento.items()
+        ]
+
+        significados: Dict[str, set] = {}
+        for prioridade, (dimensao, valor, palavras) in enumerate(tabelas):
+            for palavra in palavras:
+                significados.setdefault(dobrar_acentos(palavra), set()).add(
+                    (dimensao, prioridade, valor)
+                )
+
+        # Uma palavra que contém outra também indica o que a menor indica
+        # (a regex só encontra a maior)
+        for palavra, sentidos in significados.items():
+            for outra, outros_sentidos in significados.items():
+                if outra != palavra and outra in palavra:
+                    sentidos |= outros_sentidos
+
+        self._significados_palavras = significados
+        self.padrao_palavras_chave = re.compile(_regex_trie(significados))
+
+    def identificar_palavras_chave(self, texto: str) -> Dict[str, Optional[str]]:
+        """Encontra tipo, categoria e método de pagamento numa única passada
+
+        Retorna {"tipo", "categoria", "metodo_pagamento"} com None onde
+        nenhuma palavra-chave aparece.
+        """
+        melhores: Dict[str, Tuple[int, str]] = {}
+        for palavra in self.padrao_palavras_chave.findall(dobrar_acentos(texto)):
+            for dimensao, prioridade, valor in self._significados_palavras[palavra]:
+                if dimensao not in melhores or prioridade < melhores[dimensao][0]:
+                    melhores[dimensao] = (prioridade, valor)
+
+        return {
+            dimensao: melhores[dimensao][1] if dimensao in melhores else None
+            for dimensao in ("tipo", "categoria", "metodo_pagamento")
+        }
+
+    def tokenizar(self, texto: str) -> List[Token]:
+        """Percorre o texto uma única vez e retorna os tokens tipados"""
+        tokens = []
+        for encontrado in self.padrao_tokens.finditer(texto.strip()):
+            tipo = encontrado.lastgroup
+            if tipo == "valor":
+                valor = para_centavos(encontrado.group("valor"))
+            elif tipo == "data":
+                valor = self.parse_data(encontrado.group("data"))
+            elif tipo == "parcelas":
+                valor = (
+                    int(encontrado.group("parcela_atual")),
+                    int(encontrado.group("total_parcelas")),
+                )
+            elif tipo == "meta":
+                valor = dobrar_acentos(encontrado.group("meta"))
+            elif tipo == "percentual":
+                valor = para_centavos(encontrado.group("percentual")) / 100
+            else:
+                valor = None
+            tokens.append(Token(tipo, encontrado.group(0), valor))
+        return tokens
+
+    def parse_comando_add(self, texto: str, tokens: List[Token] = None) -> Dict:
         """
         Faz parsing inteligente do comando /add
-        Exemplo: /add alimentação despesa 25,50 almoço no araujo
+        Exemplo: /add alimentação despesa 25,50 almoço no araujo 03/05/2025
+
+        A data (opcional, padrão hoje) vira data_referencia do lançamento.
+        tokens evita tokenizar de novo um texto já tokenizado.
+        """
+        resultado = {
+            "categoria": None,
+            "tipo": None,
+            "valor_centavos": None,
+            "descricao": None,
+            "responsavel": None,
+            "metodo_pagamento": None,
+            "parcelas": None,
+            "meta": None,
+            "data_referencia": None,
+            "erro": None,
+        }
+
+        try:
+            # 1. Primeiro valor, parcelamento e data; o resto é descrição
+            restante = []
+            if tokens is None:
+                tokens = self.tokenizar(texto)
+            for token in tokens:
+                if token.tipo == "comando":
+                    continue
+                if token.tipo == "valor" and resultado["valor_centavos"] is None:
+                    resultado["valor_centavos"] = token.valor
+                elif token.tipo == "parcelas" and resultado["parcelas"] is None:
+                    resultado["parcelas"] = token.valor
+                elif token.tipo == "meta" and resultado["meta"] is None:
+                    resultado["meta"] = token.valor
+                elif token.tipo == "data" and resultado["data_referencia"] is None:
+                    resultado["data_referencia"] = token.valor
+                else:
+                    restante.append(token.texto)
+            texto = " ".join(restante)
+
+            # 2-4. Tipo, categoria e método de pagamento numa única passada
+            palavras_chave = self.identificar_palavras_chave(texto)
+
+            # Se não encontrou tipo específico, assume despesa por padrão
+            resultado["tipo"] = palavras_chave["tipo"] or "despesa"
+            resultado["categoria"] = palavras_chave["categoria"] or "outros"
+            resultado["metodo_pagamento"] = (
+                palavras_chave["metodo_pagamento"] or "dinheiro"
+            )
+
+            # 5. Responsável será definido pelo usuário que enviou a mensagem
+            # (será passado como parâmetro na função add_lancamento)
+            resultado["responsavel"] = None  # Será definido pelo nome do usuário
+
+            # 6. Descrição é o que sobrou do texto
+            resultado["descricao"] = texto
+
+            # Validações
+            if resultado["valor_centavos"] is None:
+                resultado["erro"] = "Valor não encontrado. Use formato: 25,50 ou 25.50"
+            elif resultado["valor_centavos"] <= 0:
+                resultado["erro"] = "Valor deve ser maior que zero"
+            elif resultado["parcelas"] and not (
+                1 <= resultado["parcelas"][0] <= resultado["parcelas"][1]
+            ):
+                resultado["erro"] = "Parcelamento inválido. Use formato: [1/12]"
+            elif resultado["data_referencia"]:
+                try:
+                    data = date.fromisoformat(resultado["data_referencia"])
+                except ValueError:
+                    resultado["erro"] = "Data inválida. Use formato: 03/05/2025"
+                else:
+                    if data > datetime.utcnow().date():
+                        resultado["erro"] = "A data do lançamento não pode ser futura"
+
+        except Exception as e:
+            resultado["erro"] = f"Erro no parsing: {str(e)}"
+
+        return resultado
+
+    def parse_lote_add(self, texto: str) -> List[Tuple[int, Dict]]:
+        """Faz parsing de um /add com vários lançamentos, um por linha
+
+        Retorna (número da linha, resultado de parse_comando_add) para cada
+        linha com conteúdo; a linha do comando só conta se tiver algo além
+        do /add.
+        """
+        resultados = []
+        for numero, linha in enumerate(texto.splitlines(), start=1):
+            tokens = self.tokenizar(linha)
+            if all(token.tipo == "comando" for token in tokens):
+                continue
+            resultados.append((numero, self.parse_comando_add(linha, tokens)))
+        return resultados
+
+    def parse_comando_meta(self, texto: str) -> Dict:
+        """
+        Faz parsing inteligente do comando /meta
+        Exemplo: /meta Viagem de Casamento 20000 30-03-26 10%
+
+        O percentual (opcional) é a parte de cada receita aportada na meta.
         """
-        # Remove o comando /add do início
-        texto = texto.replace("/add", "").strip()
+        resultado = {
+            "nome": None,
+            "valor_centavos": None,
+            "data_limite": None,
+            "percentual_receitas": None,
+            "erro": None,
+        }
+
+        try:
+            # 1-2. Primeiro valor e primeira data
+            restante = []
+            for token in self.tokenizar(texto):
+                if token.tipo == "comando":
+                    continue
+                if token.tipo == "valor" and resultado["valor_centavos"] is None:
+                    resultado["valor_centavos"] = token.valor
+                elif token.tipo == "data" and resultado["data_limite"] is None:
+                    resultado["data_limite"] = token.valor
+                elif (
+                    token.tipo == "percentual"
+                    and resultado["percentual_receitas"] is None
+                ):
+                    resultado["percentual_receitas"] = token.valor
+                else:
+                    restante.append(token.texto)
+
+            # 3. Nome é o que sobrou
+            resultado["nome"] = " ".join(restante)
+
+            # Validações
+            if not resultado["nome"]:
+                resultado["erro"] = "Nome da meta não encontrado"
+            elif resultado["valor_centavos"] is None:
+                resultado["erro"] = "Valor da meta não encontrado"
+            elif resultado["valor_centavos"] <= 0:
+                resultado["erro"] = "Valor da meta deve ser maior que zero"
+            elif resultado["percentual_receitas"] is not None and not (
+                0 < resultado["percentual_receitas"] <= 100
+            ):
+                resultado["erro"] = (
+                    "Percentual das receitas deve ser maior que 0% e até 100%"
+                )
+
+        except Exception as e:
+            resultado["erro"] = f"Erro no parsing: {str(e)}"
+
+        return resultado
+
+    def parse_data(self, data_str: str) -> str:
+        """Converte string de data para formato YYYY-MM-DD"""
+        try:
+            # Remove caracteres não numéricos exceto separadores
+            data_limpa = re.sub(r"[^\d/-]", "", data_str)
+
+            # Tenta diferentes formatos
+            formatos = ["%d-%m-%y", "%d/%m/%y", "%d-%m-%Y", "%d/%m/%Y"]
+
+            for formato in formatos:
+                try:
+                    data_obj = datetime.strptime(data_limpa, formato)
+                    return data_obj.strftime("%Y-%m-%d")
+                except ValueError:
+                    continue
+
+            # Se não conseguiu parsear, retorna como está
+            return data_str
+
+        except Exception:
+            return data_str
+
+
+# Incrementar quando o provisionamento de novos usuários mudar, para que
+# usuários antigos sejam provisionados de novo na próxima mensagem
+VERSAO_PROVISIONAMENTO = 1
+
+METODOS_PAGAMENTO_PADRAO = [
+    ("Dinheiro", "dinheiro"),
+    ("PIX", "pix"),
+    ("Cartão de Crédito", "cartao"),
+    ("Cartão de Débito", "cartao"),
+    ("Transferência", "transferencia"),
+]
+
+
+# Planos com mais parcelas restantes que isso ficam no modo projetado: cada
+# parcela futura é inserida no dia dela pela manutenção (materializar_parcelas)
+LIMITE_PARCELAS_IMEDIATAS = 24
+
+
+class CacheDimensoes:
+    """Cache LRU limitado de nome -> ID para contas, categorias, responsáveis
+    e métodos de pagamento
+
+    As chaves começam por (tipo_dimensao, user_id, ...), o que permite
+    invalidar todas as entradas de um usuário.
+    """
+
+    def __init__(self, capacidade: int = 4096):
+        self.capacidade = capacidade
+        self.acertos = 0
+        self.falhas = 0
+        self._entradas: "OrderedDict[Tuple, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave: Tuple) -> Optional[int]:
+        with self._lock:
+            valor = self._entradas.get(chave)
+            if valor is None:
+                self.falhas += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+            return valor
+
+    def guardar(self, chave: Tuple, valor: int):
+        with self._lock:
+            self._entradas[chave] = valor
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.capacidade:
+                self._entradas.popitem(last=False)
+
+    def invalidar_usuario(self, user_id: int):
+        with self._lock:
+            for chave in [c for c in self._entradas if c[1] == user_id]:
+                del self._entradas[chave]
+
+    def estatisticas(self) -> Dict:
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "taxa_acerto": self.acertos / consultas if consultas else 0.0,
+                "tamanho": len(self._entradas),
+            }
+
+
+class CacheSaldos:
+    """Saldo de cada domicílio em memória, atualizado após cada commit
+
+    Cada saldo carrega a versão gravada em saldos_domicilio; uma publicação
+    mais antiga que a já guardada é ignorada, então commits concorrentes
+    publicados fora de ordem não deixam um saldo velho na memória.
+    """
+
+    def __init__(self):
+        self._saldos: Dict[int, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def obter(self, domicilio_id: int) -> Optional[int]:
+        with self._lock:
+            entrada = self._saldos.get(domicilio_id)
+            return entrada[1] if entrada else None
+
+    def publicar(self, domicilio_id: int, versao: int, saldo_centavos: int):
+        with self._lock:
+            atual = self._saldos.get(domicilio_id)
+            if atual is None or versao > atual[0]:
+                self._saldos[domicilio_id] = (versao, saldo_centavos)
+
+
+# Gráficos PNG do /grafico: processos de renderização, pedidos em andamento
+# acima dos quais a resposta cai no gráfico em texto, espera máxima
+# (segundos) e quantidade de imagens guardadas em memória
+PROCESSOS_GRAFICOS = 2
+FILA_MAXIMA_GRAFICOS = 8
+TIMEOUT_GRAFICO = 10
+GRAFICOS_EM_CACHE = 64
+
+# Sem o matplotlib o /grafico continua respondendo com o gráfico em texto
+MATPLOTLIB_DISPONIVEL = find_spec("matplotlib") is not None
+
+
+def renderizar_grafico_png(
+    titulo: str, categorias: List[str], valores_centavos: List[int]
+) -> bytes:
+    """Desenha pizza e barras dos gastos por categoria e retorna o PNG
+
+    Roda num processo do RenderizadorGraficos, fora das threads do bot.
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    valores = [valor / 100 for valor in valores_centavos]
+    figura, (pizza, barras) = plt.subplots(1, 2, figsize=(11, 5))
+    figura.suptitle(titulo)
+
+    pizza.pie(valores, labels=categorias, autopct="%1.1f%%", startangle=90)
+    pizza.axis("equal")
+
+    posicoes = range(len(categorias))
+    barras.barh(posicoes, valores)
+    barras.set_yticks(list(posicoes))
+    barras.set_yticklabels(categorias)
+    barras.invert_yaxis()
+    barras.set_xlabel("R$")
+    for posicao, valor in zip(posicoes, valores_centavos):
+        barras.annotate(
+            formatar_valor(valor),
+            (valor / 100, posicao),
+            xytext=(3, 0),
+            textcoords="offset points",
+            va="center",
+            fontsize=8,
+        )
+
+    buffer = io.BytesIO()
+    figura.savefig(buffer, format="png", dpi=100, bbox_inches="tight")
+    plt.close(figura)
+    return buffer.getvalue()
+
+
+class RenderizadorGraficos:
+    """Renderiza gráficos PNG num pool de processos, com cache e limite de fila
+
+    As imagens ficam num cache LRU pela chave informada (quem chama inclui a
+    versão dos dados). Com a fila cheia, estouro do timeout ou erro na
+    renderização o resultado é None e quem chama usa o gráfico em texto;
+    uma renderização que termina depois do timeout ainda entra no cache.
+    """
+
+    def __init__(
+        self,
+        processos: int = PROCESSOS_GRAFICOS,
+        fila_maxima: int = FILA_MAXIMA_GRAFICOS,
+        timeout: float = TIMEOUT_GRAFICO,
+        capacidade: int = GRAFICOS_EM_CACHE,
+    ):
+        self.processos = processos
+        self.timeout = timeout
+        self.capacidade = capacidade
+        self._vagas = threading.BoundedSemaphore(fila_maxima)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._imagens: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _obter_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: o bot já tem threads (escritor, executor do banco) e um fork
+                # copiaria locks no meio do uso
+                self._executor = ProcessPoolExecutor(
+                    self.processos, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def obter(self, chave: Tuple) -> Optional[bytes]:
+        with self._lock:
+            imagem = self._imagens.get(chave)
+            if imagem is not None:
+                self._imagens.move_to_end(chave)
+            return imagem
+
+    def _guardar(self, chave: Tuple, imagem: bytes):
+        with self._lock:
+            self._imagens[chave] = imagem
+            self._imagens.move_to_end(chave)
+            while len(self._imagens) > self.capacidade:
+                self._imagens.popitem(last=False)
+
+    def renderizar(self, chave: Tuple, funcao, *argumentos) -> Optional[bytes]:
+        """Retorna a imagem de funcao(*argumentos), do cache ou do pool"""
+        imagem = self.obter(chave)
+        if imagem is not None:
+            return imagem
+
+        if not self._vagas.acquire(blocking=False):
+            logger.warning("Fila de gráficos cheia, usando gráfico em texto")
+            return None
+        try:
+            futuro = self._obter_executor().submit(funcao, *argumentos)
+        except Exception as e:
+            self._vagas.release()
+            logger.error(f"Erro ao enviar gráfico para renderização: {e}")
+            if isinstance(e, BrokenProcessPool):
+                self.fechar()
+            return None
 
-        resultado = {
-            "categoria": None,
-            "tipo": None,
-            "valor": None,
-            "descricao": None,
-            "responsavel": None,
-            "metodo_pagamento": None,
-            "erro": None,
-        }
+        def _concluido(futuro: Future):
+            self._vagas.release()
+            if not futuro.cancelled() and futuro.exception() is None:
+                self._guardar(chave, futuro.result())
 
+        futuro.add_done_callback(_concluido)
         try:
-            # 1. Extrair valor (número com vírgula ou ponto)
-            valores_encontrados = self.padrao_valor.findall(texto)
-            if valores_encontrados:
-                valor_str = valores_encontrados[0]
-                # Converter vírgula para ponto e remover separadores de milhares
-                valor_str = valor_str.replace(",", ".").replace(
-                    ".", "", valor_str.count(".") - 1
-                )
-                resultado["valor"] = float(valor_str)
-                # Remove o valor do texto para facilitar parsing do resto
-                texto = texto.replace(valores_encontrados[0], "").strip()
-
-            # 2. Identificar tipo (receita ou despesa)
-            texto_lower = texto.lower()
-            for palavra in self.palavras_receita:
-                if palavra in texto_lower:
-                    resultado["tipo"] = "receita"
-                    break
+            return futuro.result(timeout=self.timeout)
+        except TimeoutError:
+            logger.warning("Gráfico demorou demais, usando gráfico em texto")
+        except BrokenProcessPool as e:
+            # Um processo morreu: o próximo pedido cria um pool novo
+            logger.error(f"Pool de gráficos interrompido: {e}")
+            self.fechar()
+        except Exception as e:
+            logger.error(f"Erro ao renderizar gráfico: {e}")
+        return None
 
-            if not resultado["tipo"]:
-                for palavra in self.palavras_despesa:
-                    if palavra in texto_lower:
-                        resultado["tipo"] = "despesa"
-                        break
+    def fechar(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
 
-            # Se não encontrou tipo específico, assume despesa por padrão
-            if not resultado["tipo"]:
-                resultado["tipo"] = "despesa"
-
-            # 3. Identificar categoria
-            categoria_encontrada = None
-            for categoria, palavras in self.categorias_comuns.items():
-                for palavra in palavras:
-                    if palavra in texto_lower:
-                        categoria_encontrada = categoria
-                        break
-                if categoria_encontrada:
-                    break
 
-            resultado["categoria"] = categoria_encontrada or "outros"
+class UnidadeDeTrabalho:
+    """Unidade de trabalho de escrita sobre uma única conexão/transação
 
-            # 4. Identificar método de pagamento
-            metodo_encontrado = None
-            for metodo, palavras in self.metodos_pagamento.items():
-                for palavra in palavras:
-                    if palavra in texto_lower:
-                        metodo_encontrado = metodo
-                        break
-                if metodo_encontrado:
-                    break
+    Resolve (ou cria) as dimensões de um lançamento, insere o lançamento,
+    atualiza o saldo e o resumo mensal sem abrir outras conexões: um
+    lançamento completo custa um único commit.
 
-            resultado["metodo_pagamento"] = metodo_encontrado or "dinheiro"
+    Com um CacheDimensoes, os IDs já conhecidos não vão ao banco. Os IDs
+    resolvidos ficam em dimensoes_resolvidas e só devem ser publicados no
+    cache depois do commit (publicar_no_cache); o mesmo vale para os saldos
+    de domicílio em saldos_atualizados.
+    """
 
-            # 5. Responsável será definido pelo usuário que enviou a mensagem
-            # (será passado como parâmetro na função add_lancamento)
-            resultado["responsavel"] = None  # Será definido pelo nome do usuário
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        cache: Optional[CacheDimensoes] = None,
+        chat_id: int = None,
+    ):
+        self.conn = conn
+        self.cache = cache
+        # Chat onde a escrita foi pedida, destino dos alertas de limite
+        # (sem chat, como nos jobs, o alerta vai para o privado do usuário)
+        self.chat_id = chat_id
+        self.dimensoes_resolvidas: List[Tuple[Tuple, int]] = []
+        # domicilio_id -> (versao, saldo_centavos) após as escritas
+        self.saldos_atualizados: Dict[int, Tuple[int, int]] = {}
+        # Relatórios em cache invalidados, apagados após o commit
+        self.relatorios_invalidados: List[str] = []
+        # Limites cruzados pelas despesas, notificados após o commit
+        self.alertas_limite: List[Dict] = []
+        # (meta, centavos) aportados pelos lançamentos gravados
+        self.aportes_metas: List[Tuple[str, int]] = []
+
+    def registrar_meses_alterados(self, user_id: int, anos_meses):
+        """Reabre os meses fechados e invalida os relatórios dos meses
+        (YYYY-MM) que receberam lançamentos"""
+        reabrir_meses(self.conn, user_id, anos_meses)
+        self.relatorios_invalidados += invalidar_relatorios_mensais(
+            self.conn, user_id, anos_meses
+        )
 
-            # 6. Descrição é o que sobrou do texto
-            resultado["descricao"] = texto.strip()
+    def registrar_aportes(
+        self, user_id: int, lancamentos: List[Tuple[int, Dict]]
+    ):
+        """Registra no livro das metas os aportes dos lançamentos gravados
+        agora ((lancamento_id, lançamento) com tipo, valor_centavos e,
+        opcionais, meta e data_referencia)
+
+        Um lançamento com #meta aporta todo o seu valor na meta; uma receita
+        sem #meta aporta o percentual_receitas de cada meta com essa regra,
+        até completar a meta. O valor atual das metas é mantido na mesma
+        transação.
+        """
+        relevantes = [
+            (lancamento_id, lancamento)
+            for lancamento_id, lancamento in lancamentos
+            if lancamento.get("meta") or lancamento["tipo"] == "receita"
+        ]
+        if not relevantes:
+            return
+        metas = [
+            dict(linha) for linha in self.conn.execute(SQL_METAS_APORTE, (user_id,))
+        ]
+        if not metas:
+            return
 
-            # Validações
-            if not resultado["valor"]:
-                resultado["erro"] = "Valor não encontrado. Use formato: 25,50 ou 25.50"
-            elif resultado["valor"] <= 0:
-                resultado["erro"] = "Valor deve ser maior que zero"
+        hoje = datetime.utcnow().date().isoformat()
+        aportes = []
+        for lancamento_id, lancamento in relevantes:
+            data = lancamento.get("data_referencia") or hoje
+            if lancamento.get("meta"):
+                meta = encontrar_meta(metas, lancamento["meta"])
+                destinos = []
+                if meta:
+                    destinos.append((meta, lancamento["valor_centavos"], "lancamento"))
+            else:
+                destinos = [
+                    (
+                        meta,
+                        min(
+                            meta["valor_meta_centavos"] - meta["valor_atual_centavos"],
+                            round(
+                                lancamento["valor_centavos"]
+                                * meta["percentual_receitas"]
+                                / 100
+                            ),
+                        ),
+                        "receita",
+                    )
+                    for meta in metas
+                    if meta["percentual_receitas"]
+                ]
+            for meta, valor_centavos, origem in destinos:
+                if valor_centavos <= 0:
+                    continue
+                meta["valor_atual_centavos"] += valor_centavos
+                aportes.append((meta, lancamento_id, valor_centavos, origem, data))
 
-        except Exception as e:
-            resultado["erro"] = f"Erro no parsing: {str(e)}"
+        self.conn.executemany(
+            "INSERT INTO aportes_metas (meta_id, lancamento_id, valor_centavos, "
+            "origem, data) VALUES (?, ?, ?, ?, ?)",
+            [
+                (meta["id"], lancamento_id, valor_centavos, origem, data)
+                for meta, lancamento_id, valor_centavos, origem, data in aportes
+            ],
+        )
+        for meta, _, valor_centavos, _, data in aportes:
+            self.conn.execute(
+                SQL_SOMAR_APORTE_META,
+                (valor_centavos, valor_centavos, data, meta["id"]),
+            )
+            self.aportes_metas.append((meta["nome"], valor_centavos))
 
-        return resultado
+    def registrar_despesas(
+        self, user_id: int, despesas: Dict[Tuple[str, int], int]
+    ):
+        """Atualiza os gastos diários e verifica os limites das despesas
+        ((data, categoria_id) -> centavos) gravadas agora
 
-    def parse_comando_meta(self, texto: str) -> Dict:
-        """
-        Faz parsing inteligente do comando /meta
-        Exemplo: /meta Viagem de Casamento 20000 30-03-26
+        Roda depois de o resumo mensal ser atualizado: os contadores já
+        incluem as despesas novas. Só geram alertas as despesas do mês atual
+        (limites mensais) ou dentro da janela terminada hoje (janela móvel).
         """
-        # Remove o comando /meta do início
-        texto = texto.replace("/meta", "").strip()
-
-        resultado = {"nome": None, "valor": None, "data_limite": None, "erro": None}
+        if not despesas:
+            return
+        atualizar_gastos_diarios(self.conn, user_id, despesas)
+
+        hoje = datetime.utcnow().date()
+        ano_mes = hoje.isoformat()[:7]
+        for categoria_id in {categoria_id for _, categoria_id in despesas}:
+            datas = {
+                date.fromisoformat(data): valor_centavos
+                for (data, despesa_categoria), valor_centavos in despesas.items()
+                if despesa_categoria == categoria_id
+            }
+            for categoria, limite_centavos, periodo, gasto_mes in self.conn.execute(
+                SQL_LIMITES_CATEGORIA, (ano_mes, user_id, categoria_id)
+            ).fetchall():
+                dias = PERIODOS_LIMITE.get(periodo, (None,))[0]
+                if periodo == "mensal":
+                    novo = sum(
+                        valor
+                        for data, valor in datas.items()
+                        if data.isoformat()[:7] == ano_mes
+                    )
+                elif dias:
+                    inicio = hoje - timedelta(days=dias)
+                    novo = sum(
+                        valor for data, valor in datas.items() if inicio < data <= hoje
+                    )
+                else:
+                    continue
+                if not novo:
+                    continue
 
-        try:
-            # 1. Extrair valor
-            valores_encontrados = self.padrao_valor.findall(texto)
-            if valores_encontrados:
-                valor_str = valores_encontrados[0]
-                valor_str = valor_str.replace(",", ".").replace(
-                    ".", "", valor_str.count(".") - 1
+                gasto_centavos = (
+                    gasto_mes
+                    if periodo == "mensal"
+                    else gasto_na_janela(self.conn, user_id, categoria_id, dias, hoje)
                 )
-                resultado["valor"] = float(valor_str)
-                # Remove o valor do texto
-                texto = texto.replace(valores_encontrados[0], "").strip()
-
-            # 2. Extrair data
-            datas_encontradas = self.padrao_data.findall(texto)
-            if datas_encontradas:
-                data_str = datas_encontradas[0]
-                resultado["data_limite"] = self.parse_data(data_str)
-                # Remove a data do texto
-                texto = texto.replace(datas_encontradas[0], "").strip()
-
-            # 3. Nome é o que sobrou
-            resultado["nome"] = texto.strip()
+                limiar = limiar_atingido(
+                    gasto_centavos - novo, gasto_centavos, limite_centavos
+                )
+                if limiar:
+                    self.alertas_limite.append(
+                        {
+                            "user_id": user_id,
+                            "chat_id": (
+                                self.chat_id if self.chat_id is not None else user_id
+                            ),
+                            "categoria": categoria,
+                            "periodo": periodo,
+                            "limiar": limiar,
+                            "limite_centavos": limite_centavos,
+                            "gasto_centavos": gasto_centavos,
+                        }
+                    )
 
-            # Validações
-            if not resultado["nome"]:
-                resultado["erro"] = "Nome da meta não encontrado"
-            elif not resultado["valor"]:
-                resultado["erro"] = "Valor da meta não encontrado"
-            elif resultado["valor"] <= 0:
-                resultado["erro"] = "Valor da meta deve ser maior que zero"
+    def _resolver(self, chave: Tuple, buscar) -> int:
+        """Consulta o cache antes de buscar (ou criar) a dimensão no banco"""
+        if self.cache is not None:
+            dimensao_id = self.cache.obter(chave)
+            if dimensao_id is not None:
+                return dimensao_id
+
+        dimensao_id = buscar()
+        self.dimensoes_resolvidas.append((chave, dimensao_id))
+        return dimensao_id
+
+    def publicar_no_cache(self):
+        """Guarda no cache os IDs resolvidos (chamar após o commit)"""
+        if self.cache is not None:
+            for chave, dimensao_id in self.dimensoes_resolvidas:
+                self.cache.guardar(chave, dimensao_id)
+
+    def obter_conta_padrao(self, user_id: int) -> int:
+        """Retorna o ID da conta padrão do usuário"""
+        return self._resolver(
+            ("conta", user_id),
+            lambda: self.conn.execute(
+                "SELECT id FROM contas WHERE user_id = ? AND nome = ?",
+                (user_id, "Conta Principal"),
+            ).fetchone()[0],
+        )
 
-        except Exception as e:
-            resultado["erro"] = f"Erro no parsing: {str(e)}"
+    def obter_domicilio(self, user_id: int) -> int:
+        """Retorna o domicílio do usuário (DOMICILIO_PADRAO se não cadastrado)"""
 
-        return resultado
+        def _buscar():
+            linha = self.conn.execute(
+                "SELECT domicilio_id FROM usuarios WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if linha is None or linha[0] is None:
+                return DOMICILIO_PADRAO
+            return linha[0]
 
-    def parse_data(self, data_str: str) -> str:
-        """Converte string de data para formato YYYY-MM-DD"""
-        try:
-            # Remove caracteres não numéricos exceto separadores
-            data_limpa = re.sub(r"[^\d/-]", "", data_str)
+        return self._resolver(("domicilio", user_id), _buscar)
 
-            # Tenta diferentes formatos
-            formatos = ["%d-%m-%y", "%d/%m/%y", "%d-%m-%Y", "%d/%m/%Y"]
+    def ajustar_saldo_domicilio(self, user_id: int, variacao_centavos: int):
+        """Aplica a variação ao saldo do domicílio do usuário"""
+        domicilio_id = self.obter_domicilio(user_id)
+        self.saldos_atualizados[domicilio_id] = ajustar_saldo_domicilio(
+            self.conn, domicilio_id, variacao_centavos
+        )
 
-            for formato in formatos:
-                try:
-                    data_obj = datetime.strptime(data_limpa, formato)
-                    return data_obj.strftime("%Y-%m-%d")
-                except ValueError:
-                    continue
+    def obter_ou_criar_responsavel(self, user_id: int, nome_responsavel: str) -> int:
+        """Obtém ou cria responsável e retorna o ID"""
+        return self._resolver(
+            ("responsavel", user_id, nome_responsavel),
+            lambda: self._buscar_ou_criar_responsavel(user_id, nome_responsavel),
+        )
 
-            # Se não conseguiu parsear, retorna como está
-            return data_str
+    def obter_ou_criar_metodo_pagamento(self, user_id: int, nome_metodo: str) -> int:
+        """Obtém ou cria método de pagamento e retorna o ID"""
+        return self._resolver(
+            ("metodo_pagamento", user_id, nome_metodo),
+            lambda: self._buscar_ou_criar_metodo_pagamento(user_id, nome_metodo),
+        )
 
-        except Exception:
-            return data_str
+    def obter_ou_criar_categoria(
+        self, user_id: int, nome_categoria: str, tipo: str
+    ) -> int:
+        """Obtém ou cria categoria e retorna o ID"""
+        return self._resolver(
+            ("categoria", user_id, nome_categoria, tipo),
+            lambda: self._buscar_ou_criar_categoria(user_id, nome_categoria, tipo),
+        )
 
+    def _buscar_ou_criar_responsavel(self, user_id: int, nome_responsavel: str) -> int:
+        cursor = self.conn.cursor()
 
-class VidaFinanceiraBot:
-    def __init__(self, token: str):
-        """Inicializa o bot de vida financeira"""
-        self.token = token
-        self.db_path = "financeiro.db"
-        self.parser = ParsingInteligente()
-        self.init_database()
+        # Busca responsável existente
+        cursor.execute(
+            """
+            SELECT id FROM responsaveis 
+            WHERE user_id = ? AND nome = ?
+        """,
+            (user_id, nome_responsavel),
+        )
 
-    def init_database(self):
-        """Inicializa o banco de dados SQLite"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        resultado = cursor.fetchone()
+        if resultado:
+            return resultado[0]
 
-        # Tabela de usuários
+        # Cria novo responsável
         cursor.execute(
             """
-            CREATE TABLE IF NOT EXISTS usuarios (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """
+            INSERT INTO responsaveis (user_id, nome)
+            VALUES (?, ?)
+        """,
+            (user_id, nome_responsavel),
         )
+        return cursor.lastrowid
+
+    def _buscar_ou_criar_metodo_pagamento(self, user_id: int, nome_metodo: str) -> int:
+        cursor = self.conn.cursor()
 
-        # Tabela de contas
+        # Busca método existente
         cursor.execute(
             """
-            CREATE TABLE IF NOT EXISTS contas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                nome TEXT NOT NULL,
-                saldo REAL DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES usuarios (user_id)
-            )
-        """
+            SELECT id FROM metodos_pagamento 
+            WHERE user_id = ? AND nome = ?
+        """,
+            (user_id, nome_metodo),
         )
 
-        # Tabela de responsáveis
+        resultado = cursor.fetchone()
+        if resultado:
+            return resultado[0]
+
+        # Determina tipo baseado no nome
+        nome_lower = nome_metodo.lower()
+        if (
+            "cartão" in nome_lower
+            or "cartao" in nome_lower
+            or "credito" in nome_lower
+            or "debito" in nome_lower
+        ):
+            tipo = "cartao"
+        elif "pix" in nome_lower:
+            tipo = "pix"
+        elif "dinheiro" in nome_lower or "cash" in nome_lower:
+            tipo = "dinheiro"
+        elif "transferencia" in nome_lower or "ted" in nome_lower:
+            tipo = "transferencia"
+        else:
+            tipo = "conta"
+
+        # Cria novo método
         cursor.execute(
             """
-            CREATE TABLE IF NOT EXISTS responsaveis (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                nome TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES usuarios (user_id)
-            )
-        """
+            INSERT INTO metodos_pagamento (user_id, nome, tipo)
+            VALUES (?, ?, ?)
+        """,
+            (user_id, nome_metodo, tipo),
         )
+        return cursor.lastrowid
+
+    def _buscar_ou_criar_categoria(
+        self, user_id: int, nome_categoria: str, tipo: str
+    ) -> int:
+        cursor = self.conn.cursor()
 
-        # Tabela de categorias
+        # Busca categoria existente
         cursor.execute(
             """
-            CREATE TABLE IF NOT EXISTS categorias (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                nome TEXT NOT NULL,
-                tipo TEXT CHECK(tipo IN ('receita', 'despesa')),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES usuarios (user_id)
-            )
-        """
+            SELECT id FROM categorias 
+            WHERE user_id = ? AND nome = ? AND tipo = ?
+        """,
+            (user_id, nome_categoria, tipo),
         )
 
-        # Tabela de lançamentos
+        resultado = cursor.fetchone()
+        if resultado:
+            return resultado[0]
+
+        # Cria nova categoria
         cursor.execute(
             """
-            CREATE TABLE IF NOT EXISTS lancamentos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                conta_id INTEGER,
-                responsavel_id INTEGER,
-                categoria_id INTEGER,
-                metodo_pagamento_id INTEGER,
-                tipo TEXT CHECK(tipo IN ('receita', 'despesa')),
-                valor REAL NOT NULL,
-                descricao TEXT,
-                data_lancamento TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                data_referencia DATE DEFAULT CURRENT_DATE,
-                parcela_atual INTEGER DEFAULT NULL,
-                total_parcelas INTEGER DEFAULT NULL,
-                FOREIGN KEY (user_id) REFERENCES usuarios (user_id),
-                FOREIGN KEY (conta_id) REFERENCES contas (id),
-                FOREIGN KEY (responsavel_id) REFERENCES responsaveis (id),
-                FOREIGN KEY (categoria_id) REFERENCES categorias (id),
-                FOREIGN KEY (metodo_pagamento_id) REFERENCES metodos_pagamento (id)
-            )
-        """
+            INSERT INTO categorias (user_id, nome, tipo)
+            VALUES (?, ?, ?)
+        """,
+            (user_id, nome_categoria, tipo),
+        )
+        return cursor.lastrowid
+
+    def inserir_lancamento(
+        self,
+        user_id: int,
+        categoria: str,
+        tipo: str,
+        valor_centavos: int,
+        descricao: str,
+        responsavel: str = None,
+        metodo_pagamento: str = None,
+    ) -> int:
+        """Insere um lançamento completo e retorna o seu ID"""
+        cursor = self.conn.cursor()
+
+        conta_id = self.obter_conta_padrao(user_id)
+        responsavel_id = self.obter_ou_criar_responsavel(user_id, responsavel or "Eu")
+        categoria_id = self.obter_ou_criar_categoria(user_id, categoria, tipo)
+        metodo_pagamento_id = self.obter_ou_criar_metodo_pagamento(
+            user_id, metodo_pagamento or "Dinheiro"
         )
 
-        # Tabela de relatórios mensais
+        # Adiciona lançamento
+        data_referencia = datetime.utcnow().date().isoformat()
         cursor.execute(
             """
-            CREATE TABLE IF NOT EXISTS relatorios_mensais (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                mes INTEGER NOT NULL,
-                ano INTEGER NOT NULL,
-                arquivo_path TEXT NOT NULL,
-                data_geracao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES usuarios (user_id)
-            )
-        """
+            INSERT INTO lancamentos (user_id, conta_id, responsavel_id, categoria_id, 
+                                   metodo_pagamento_id, tipo, valor, valor_centavos,
+                                   descricao, data_referencia)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            (
+                user_id,
+                conta_id,
+                responsavel_id,
+                categoria_id,
+                metodo_pagamento_id,
+                tipo,
+                valor_centavos / 100,
+                valor_centavos,
+                descricao,
+                data_referencia,
+            ),
         )
+        lancamento_id = cursor.lastrowid
 
-        # Tabela de metas
+        # Atualiza saldo da conta (a coluna REAL antiga é derivada)
+        variacao = valor_centavos if tipo == "receita" else -valor_centavos
         cursor.execute(
             """
-            CREATE TABLE IF NOT EXISTS metas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                nome TEXT NOT NULL,
-                valor_meta REAL NOT NULL,
-                valor_atual REAL DEFAULT 0,
-                data_limite DATE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES usuarios (user_id)
+            UPDATE contas
+            SET saldo_centavos = saldo_centavos + ?,
+                saldo = (saldo_centavos + ?) / 100.0
+            WHERE id = ?
+        """,
+            (variacao, variacao, conta_id),
+        )
+        self.ajustar_saldo_domicilio(user_id, variacao)
+
+        # Mantém o resumo mensal na mesma transação
+        atualizar_resumo_mensal(
+            self.conn, user_id, data_referencia, categoria_id, tipo, valor_centavos
+        )
+        self.registrar_meses_alterados(user_id, [data_referencia[:7]])
+        if tipo == "despesa":
+            self.registrar_despesas(
+                user_id, {(data_referencia, categoria_id): valor_centavos}
             )
+        self.registrar_aportes(
+            user_id,
+            [(lancamento_id, {"tipo": tipo, "valor_centavos": valor_centavos})],
+        )
+
+        return lancamento_id
+
+    def inserir_lancamentos(
+        self, user_id: int, lancamentos: List[Dict], responsavel: str = None
+    ) -> int:
+        """Insere vários lançamentos com um único executemany e retorna quantos
+
+        Cada lançamento é um dict com categoria, tipo, valor_centavos,
+        descricao e, opcionais, metodo_pagamento, data_referencia,
+        parcela_atual, total_parcelas e parcelamento_id. Um lançamento com
+        parcelas (n, m) vira um plano de parcelamento (criar_parcelamento).
+        Saldos da conta e do domicílio são ajustados uma vez para o lote e o
+        resumo mensal uma vez por (mês, categoria, tipo).
         """
+        conta_id = self.obter_conta_padrao(user_id)
+        responsavel_id = self.obter_ou_criar_responsavel(user_id, responsavel or "Eu")
+        hoje = datetime.utcnow().date().isoformat()
+
+        expandidos = []
+        for lancamento in lancamentos:
+            if lancamento.get("parcelas"):
+                expandidos += self.criar_parcelamento(user_id, lancamento, responsavel)
+            else:
+                expandidos.append(lancamento)
+
+        linhas = []
+        variacao = 0
+        resumo: Dict[Tuple[str, int, str], List[int]] = {}
+        despesas: Dict[Tuple[str, int], int] = {}
+        for lancamento in expandidos:
+            tipo = lancamento["tipo"]
+            valor_centavos = lancamento["valor_centavos"]
+            categoria_id = self.obter_ou_criar_categoria(
+                user_id, lancamento["categoria"], tipo
+            )
+            metodo_pagamento_id = self.obter_ou_criar_metodo_pagamento(
+                user_id, lancamento.get("metodo_pagamento") or "Dinheiro"
+            )
+            data_referencia = lancamento.get("data_referencia") or hoje
+
+            linhas.append(
+                (
+                    user_id,
+                    conta_id,
+                    responsavel_id,
+                    categoria_id,
+                    metodo_pagamento_id,
+                    tipo,
+                    valor_centavos / 100,
+                    valor_centavos,
+                    lancamento["descricao"],
+                    data_referencia,
+                    lancamento.get("parcela_atual"),
+                    lancamento.get("total_parcelas"),
+                    lancamento.get("parcelamento_id"),
+                )
+            )
+            variacao += valor_centavos if tipo == "receita" else -valor_centavos
+            chave = (data_referencia[:7], categoria_id, tipo)
+            totais = resumo.setdefault(chave, [0, 0])
+            totais[0] += valor_centavos
+            totais[1] += 1
+            if tipo == "despesa":
+                chave = (data_referencia, categoria_id)
+                despesas[chave] = despesas.get(chave, 0) + valor_centavos
+
+        if not linhas:
+            return 0
+
+        self.conn.executemany(
+            """
+            INSERT INTO lancamentos (user_id, conta_id, responsavel_id, categoria_id,
+                                   metodo_pagamento_id, tipo, valor, valor_centavos,
+                                   descricao, data_referencia, parcela_atual,
+                                   total_parcelas, parcelamento_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            linhas,
         )
+        # Um executemany numa transação de escrita grava IDs consecutivos: o
+        # último menos a quantidade dá o primeiro. Lido logo após o INSERT,
+        # antes que outro INSERT (o upsert do saldo do domicílio) o substitua
+        ultimo_id = self.conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        lancamento_ids = range(ultimo_id - len(linhas) + 1, ultimo_id + 1)
 
-        # Tabela de métodos de pagamento
-        cursor.execute(
+        self.conn.execute(
             """
-            CREATE TABLE IF NOT EXISTS metodos_pagamento (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                nome TEXT NOT NULL,
-                tipo TEXT CHECK(tipo IN ('conta', 'cartao', 'dinheiro', 'pix', 'transferencia')),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES usuarios (user_id)
-            )
+            UPDATE contas
+            SET saldo_centavos = saldo_centavos + ?,
+                saldo = (saldo_centavos + ?) / 100.0
+            WHERE id = ?
+        """,
+            (variacao, variacao, conta_id),
+        )
+        self.ajustar_saldo_domicilio(user_id, variacao)
+
+        self.conn.executemany(
+            SQL_SOMAR_RESUMO_MENSAL,
+            [
+                (user_id, *chave, total, quantidade)
+                for chave, (total, quantidade) in resumo.items()
+            ],
+        )
+        self.registrar_meses_alterados(user_id, [ano_mes for ano_mes, _, _ in resumo])
+        self.registrar_despesas(user_id, despesas)
+
+        self.registrar_aportes(user_id, list(zip(lancamento_ids, expandidos)))
+
+        return len(linhas)
+
+    def criar_parcelamento(
+        self, user_id: int, lancamento: Dict, responsavel: str = None
+    ) -> List[Dict]:
+        """Grava o plano de um lançamento com parcelas (n, m) e retorna as
+        parcelas a inserir agora
+
+        A parcela n cai na data do lançamento (padrão hoje) e as seguintes no
+        mesmo dia dos meses seguintes. Planos de até LIMITE_PARCELAS_IMEDIATAS
+        parcelas são expandidos de uma vez; nos maiores (modo projetado) só a
+        parcela n é inserida e as demais são materializadas por materializar_parcelas
+        quando o dia de cada uma chega; até lá aparecem como previstas.
         """
+        parcela_inicial, total_parcelas = lancamento["parcelas"]
+        data_inicio = date.fromisoformat(
+            lancamento.get("data_referencia") or datetime.utcnow().date().isoformat()
         )
+        restantes = total_parcelas - parcela_inicial + 1
+        imediatas = restantes if restantes <= LIMITE_PARCELAS_IMEDIATAS else 1
+
+        proxima_parcela = proxima_data = None
+        if imediatas < restantes:
+            proxima_parcela = parcela_inicial + imediatas
+            proxima_data = somar_meses(data_inicio, imediatas).isoformat()
+            self.relatorios_invalidados += invalidar_relatorios_a_partir(
+                self.conn, user_id, proxima_data[:7]
+            )
 
-        # Tabela de relatórios mensais
-        cursor.execute(
+        cursor = self.conn.execute(
             """
-            CREATE TABLE IF NOT EXISTS relatorios_mensais (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                mes INTEGER NOT NULL,
-                ano INTEGER NOT NULL,
-                arquivo_path TEXT NOT NULL,
-                data_geracao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES usuarios (user_id)
-            )
-        """
+            INSERT INTO parcelamentos (user_id, categoria, tipo, valor_centavos,
+                                       descricao, metodo_pagamento, responsavel,
+                                       data_inicio, parcela_inicial, total_parcelas,
+                                       proxima_parcela, proxima_data)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            (
+                user_id,
+                lancamento["categoria"],
+                lancamento["tipo"],
+                lancamento["valor_centavos"],
+                lancamento["descricao"],
+                lancamento.get("metodo_pagamento"),
+                responsavel,
+                data_inicio.isoformat(),
+                parcela_inicial,
+                total_parcelas,
+                proxima_parcela,
+                proxima_data,
+            ),
         )
+        parcelamento_id = cursor.lastrowid
+
+        return [
+            {
+                "categoria": lancamento["categoria"],
+                "tipo": lancamento["tipo"],
+                "valor_centavos": lancamento["valor_centavos"],
+                "descricao": lancamento["descricao"],
+                "metodo_pagamento": lancamento.get("metodo_pagamento"),
+                "data_referencia": somar_meses(data_inicio, deslocamento).isoformat(),
+                "parcela_atual": parcela_inicial + deslocamento,
+                "total_parcelas": total_parcelas,
+                "parcelamento_id": parcelamento_id,
+                "meta": lancamento.get("meta"),
+            }
+            for deslocamento in range(imediatas)
+        ]
 
-        # Tabela de limites de gastos
-        cursor.execute(
+    def materializar_parcelas(self, ate: str) -> int:
+        """Insere as parcelas projetadas com data anterior a `ate` (ISO)
+
+        Planos de usuários sem conta padrão (resetados) são ignorados, e cada
+        plano roda no seu SAVEPOINT: um plano com erro vai para o log sem
+        impedir as parcelas dos demais. Retorna o número de parcelas inseridas.
+        """
+        planos = self.conn.execute(
             """
-            CREATE TABLE IF NOT EXISTS limites_gastos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                categoria_id INTEGER,
-                valor_limite REAL NOT NULL,
-                periodo TEXT DEFAULT 'mensal',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES usuarios (user_id),
-                FOREIGN KEY (categoria_id) REFERENCES categorias (id)
+            SELECT p.* FROM parcelamentos p
+            WHERE p.proxima_data IS NOT NULL AND p.proxima_data < ?
+              AND EXISTS (SELECT 1 FROM usuarios u WHERE u.user_id = p.user_id)
+              AND EXISTS (
+                  SELECT 1 FROM contas c
+                  WHERE c.user_id = p.user_id AND c.nome = 'Conta Principal'
+              )
+        """,
+            (ate,),
+        ).fetchall()
+
+        inseridas = 0
+        for plano in planos:
+            # Estado da unidade antes do plano, restaurado se ele falhar
+            dimensoes = len(self.dimensoes_resolvidas)
+            saldos = dict(self.saldos_atualizados)
+            relatorios = len(self.relatorios_invalidados)
+            alertas = len(self.alertas_limite)
+            aportes = len(self.aportes_metas)
+
+            self.conn.execute("SAVEPOINT parcelamento")
+            try:
+                inseridas += self._materializar_plano(plano, ate)
+            except Exception as e:
+                self.conn.execute("ROLLBACK TO parcelamento")
+                self.conn.execute("RELEASE parcelamento")
+                del self.dimensoes_resolvidas[dimensoes:]
+                self.saldos_atualizados = saldos
+                del self.relatorios_invalidados[relatorios:]
+                del self.alertas_limite[alertas:]
+                del self.aportes_metas[aportes:]
+                logger.error(f"Erro ao materializar o parcelamento {plano['id']}: {e}")
+            else:
+                self.conn.execute("RELEASE parcelamento")
+
+        return inseridas
+
+    def _materializar_plano(self, plano: sqlite3.Row, ate: str) -> int:
+        """Insere as parcelas de um plano anteriores a `ate` e avança o plano"""
+        data_inicio = date.fromisoformat(plano["data_inicio"])
+        parcela = plano["proxima_parcela"]
+        parcelas = []
+        while parcela <= plano["total_parcelas"]:
+            data_parcela = somar_meses(
+                data_inicio, parcela - plano["parcela_inicial"]
+            ).isoformat()
+            if data_parcela >= ate:
+                break
+            parcelas.append(
+                {
+                    "categoria": plano["categoria"],
+                    "tipo": plano["tipo"],
+                    "valor_centavos": plano["valor_centavos"],
+                    "descricao": plano["descricao"],
+                    "metodo_pagamento": plano["metodo_pagamento"],
+                    "data_referencia": data_parcela,
+                    "parcela_atual": parcela,
+                    "total_parcelas": plano["total_parcelas"],
+                    "parcelamento_id": plano["id"],
+                }
             )
-        """
+            parcela += 1
+
+        inseridas = self.inserir_lancamentos(
+            plano["user_id"], parcelas, plano["responsavel"]
         )
+        proxima_data = None
+        if parcela <= plano["total_parcelas"]:
+            proxima_data = somar_meses(
+                data_inicio, parcela - plano["parcela_inicial"]
+            ).isoformat()
+        self.conn.execute(
+            "UPDATE parcelamentos SET proxima_parcela = ?, proxima_data = ? "
+            "WHERE id = ?",
+            (parcela if proxima_data else None, proxima_data, plano["id"]),
+        )
+
+        return inseridas
+
+
+class VidaFinanceiraBot:
+    def __init__(
+        self, token: str, db_path: str = DB_PATH, modo_armazenamento: str = "padrao"
+    ):
+        """Inicializa o bot de vida financeira
+
+        modo_armazenamento: "padrao" (rollback journal) ou "wal" (WAL com
+        escritor serializado, para várias threads do executor do banco)
+        """
+        self.token = token
+        self.db_path = db_path
+        self.pool = obter_pool(self.db_path)
+        self.parser = ParsingInteligente()
+        # user_id -> (username, first_name) dos usuários já provisionados
+        self._usuarios_provisionados: Dict[int, Tuple[str, str]] = {}
+        # nome -> ID de contas, categorias, responsáveis e métodos
+        self.cache_dimensoes = CacheDimensoes()
+        # domicilio_id -> saldo servido pelo /saldo
+        self.cache_saldos = CacheSaldos()
+        # domicilio_id -> (versão do saldo, LancamentosColunares) do /tendencias
+        self._colunas_domicilio: Dict[int, Tuple[int, LancamentosColunares]] = {}
+        self._lock_colunas = threading.Lock()
+        # PNGs do /grafico, renderizados fora das threads do bot
+        self.graficos = RenderizadorGraficos()
+        # Chamado com os alertas de limite de cada escrita, após o commit
+        self.notificar_limites = None
+        self.init_database()
+
+        if modo_armazenamento == "wal":
+            self.pool.ativar_wal()
+
+    def init_database(self):
+        """Aplica as migrações de esquema pendentes
 
-        conn.commit()
-        conn.close()
+        Com o esquema já na versão atual, a inicialização faz uma única
+        consulta e nenhum DDL.
+        """
+        migrador = MigradorEsquema(self.pool)
+        versao = migrador.versao_atual()
+
+        if versao < VERSAO_ESQUEMA:
+            versao = migrador.migrar()
+        elif versao > VERSAO_ESQUEMA:
+            logger.warning(
+                f"Banco na versão {versao}, mais nova que a deste código ({VERSAO_ESQUEMA})"
+            )
 
-        logger.info("Banco de dados inicializado com sucesso!")
+        logger.info(f"Banco de dados inicializado com sucesso! (versão {versao})")
 
     def registrar_usuario(self, user_id: int, username: str, first_name: str):
         """Registra ou atualiza usuário no banco"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        def _registrar(conn):
+            cursor = conn.cursor()
 
-        cursor.execute(
-            """
-            INSERT OR REPLACE INTO usuarios (user_id, username, first_name)
-            VALUES (?, ?, ?)
-        """,
-            (user_id, username, first_name),
-        )
+            cursor.execute(
+                """
+                INSERT INTO usuarios (user_id, username, first_name)
+                VALUES (?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    username = excluded.username,
+                    first_name = excluded.first_name
+            """,
+                (user_id, username, first_name),
+            )
 
-        conn.commit()
-        conn.close()
+        self.pool.executar_escrita(_registrar)
 
-    def criar_conta_padrao(self, user_id: int):
-        """Cria conta padrão para o usuário"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def provisionar_usuario(
+        self,
+        user_id: int,
+        username: str,
+        first_name: str,
+        domicilio_id: int = DOMICILIO_PADRAO,
+    ):
+        """Garante usuário, conta, responsável e métodos padrão
+
+        Executa uma única transação na primeira mensagem do usuário (ou quando
+        VERSAO_PROVISIONAMENTO muda) e depois só consulta a memória. O
+        domicílio (chat da primeira mensagem) só é gravado na criação do
+        usuário.
+        """
+        if self._usuarios_provisionados.get(user_id) == (username, first_name):
+            return
+
+        conn = self.pool.obter_conexao()
+        linha = conn.execute(
+            "SELECT username, first_name, provisionado_versao FROM usuarios WHERE user_id = ?",
+            (user_id,),
+        ).fetchone()
+        if (
+            linha
+            and (linha["username"], linha["first_name"]) == (username, first_name)
+            and (linha["provisionado_versao"] or 0) >= VERSAO_PROVISIONAMENTO
+        ):
+            self._usuarios_provisionados[user_id] = (username, first_name)
+            return
 
-        # Verifica se já existe conta padrão
-        cursor.execute(
-            "SELECT id FROM contas WHERE user_id = ? AND nome = ?",
-            (user_id, "Conta Principal"),
-        )
+        def _provisionar(conn):
+            cursor = conn.cursor()
 
-        if not cursor.fetchone():
             cursor.execute(
                 """
-                INSERT INTO contas (user_id, nome, saldo)
-                VALUES (?, ?, ?)
+                INSERT INTO usuarios (user_id, username, first_name, domicilio_id)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    username = excluded.username,
+                    first_name = excluded.first_name
             """,
-                (user_id, "Conta Principal", 0),
+                (user_id, username, first_name, domicilio_id),
             )
 
-        conn.commit()
-        conn.close()
-
-    def criar_responsavel_padrao(self, user_id: int, nome: str):
-        """Cria responsável padrão para o usuário"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Verifica se já existe responsável padrão
-        cursor.execute(
-            "SELECT id FROM responsaveis WHERE user_id = ? AND nome = ?",
-            (user_id, nome),
-        )
+            cursor.execute(
+                """
+                INSERT INTO contas (user_id, nome, saldo, saldo_centavos)
+                SELECT ?, ?, 0, 0
+                WHERE NOT EXISTS (SELECT 1 FROM contas WHERE user_id = ? AND nome = ?)
+            """,
+                (user_id, "Conta Principal", user_id, "Conta Principal"),
+            )
 
-        if not cursor.fetchone():
             cursor.execute(
                 """
                 INSERT INTO responsaveis (user_id, nome)
-                VALUES (?, ?)
+                SELECT ?, ?
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM responsaveis WHERE user_id = ? AND nome = ?
+                )
             """,
-                (user_id, nome),
+                (user_id, first_name, user_id, first_name),
             )
 
-        conn.commit()
-        conn.close()
+            cursor.executemany(
+                """
+                INSERT INTO metodos_pagamento (user_id, nome, tipo)
+                SELECT ?, ?, ?
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM metodos_pagamento WHERE user_id = ? AND nome = ?
+                )
+            """,
+                [
+                    (user_id, nome, tipo, user_id, nome)
+                    for nome, tipo in METODOS_PAGAMENTO_PADRAO
+                ],
+            )
 
-    def criar_metodo_pagamento_padrao(self, user_id: int):
-        """Cria métodos de pagamento padrão para o usuário"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE usuarios SET provisionado_versao = ? WHERE user_id = ?",
+                (VERSAO_PROVISIONAMENTO, user_id),
+            )
 
-        metodos_padrao = [
-            ("Dinheiro", "dinheiro"),
-            ("PIX", "pix"),
-            ("Cartão de Crédito", "cartao"),
-            ("Cartão de Débito", "cartao"),
-            ("Transferência", "transferencia"),
-        ]
+        self.pool.executar_escrita(_provisionar)
+        self._usuarios_provisionados[user_id] = (username, first_name)
+        self.cache_dimensoes.invalidar_usuario(user_id)
+
+    def criar_conta_padrao(self, user_id: int):
+        """Cria conta padrão para o usuário"""
+        def _criar_conta(conn):
+            cursor = conn.cursor()
 
-        for nome, tipo in metodos_padrao:
-            # Verifica se já existe
+            # Verifica se já existe conta padrão
             cursor.execute(
-                "SELECT id FROM metodos_pagamento WHERE user_id = ? AND nome = ?",
-                (user_id, nome),
+                "SELECT id FROM contas WHERE user_id = ? AND nome = ?",
+                (user_id, "Conta Principal"),
             )
 
             if not cursor.fetchone():
                 cursor.execute(
                     """
-                    INSERT INTO metodos_pagamento (user_id, nome, tipo)
-                    VALUES (?, ?, ?)
+                    INSERT INTO contas (user_id, nome, saldo, saldo_centavos)
+                    VALUES (?, ?, ?, ?)
                 """,
-                    (user_id, nome, tipo),
+                    (user_id, "Conta Principal", 0, 0),
                 )
 
-        conn.commit()
-        conn.close()
-
-    def obter_ou_criar_responsavel(self, user_id: int, nome_responsavel: str) -> int:
-        """Obtém ou cria responsável e retorna o ID"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Busca responsável existente
-        cursor.execute(
-            """
-            SELECT id FROM responsaveis 
-            WHERE user_id = ? AND nome = ?
-        """,
-            (user_id, nome_responsavel),
-        )
+        self.pool.executar_escrita(_criar_conta)
 
-        resultado = cursor.fetchone()
+    def criar_responsavel_padrao(self, user_id: int, nome: str):
+        """Cria responsável padrão para o usuário"""
+        def _criar_responsavel(conn):
+            cursor = conn.cursor()
 
-        if resultado:
-            responsavel_id = resultado[0]
-        else:
-            # Cria novo responsável
+            # Verifica se já existe responsável padrão
             cursor.execute(
-                """
-                INSERT INTO responsaveis (user_id, nome)
-                VALUES (?, ?)
-            """,
-                (user_id, nome_responsavel),
+                "SELECT id FROM responsaveis WHERE user_id = ? AND nome = ?",
+                (user_id, nome),
             )
-            responsavel_id = cursor.lastrowid
 
-        conn.commit()
-        conn.close()
-        return responsavel_id
+            if not cursor.fetchone():
+                cursor.execute(
+                    """
+                    INSERT INTO responsaveis (user_id, nome)
+                    VALUES (?, ?)
+                """,
+                    (user_id, nome),
+                )
+
+        self.pool.executar_escrita(_criar_responsavel)
 
-    def obter_ou_criar_metodo_pagamento(self, user_id: int, nome_metodo: str) -> int:
-        """Obtém ou cria método de pagamento e retorna o ID"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def criar_metodo_pagamento_padrao(self, user_id: int):
+        """Cria métodos de pagamento padrão para o usuário"""
+        def _criar_metodos(conn):
+            cursor = conn.cursor()
 
-        # Busca método existente
-        cursor.execute(
-            """
-            SELECT id FROM metodos_pagamento 
-            WHERE user_id = ? AND nome = ?
-        """,
-            (user_id, nome_metodo),
-        )
+            for nome, tipo in METODOS_PAGAMENTO_PADRAO:
+                # Verifica se já existe
+                cursor.execute(
+                    "SELECT id FROM metodos_pagamento WHERE user_id = ? AND nome = ?",
+                    (user_id, nome),
+                )
 
-        resultado = cursor.fetchone()
+                if not cursor.fetchone():
+                    cursor.execute(
+                        """
+                        INSERT INTO metodos_pagamento (user_id, nome, tipo)
+                        VALUES (?, ?, ?)
+                    """,
+                        (user_id, nome, tipo),
+                    )
 
-        if resultado:
-            metodo_id = resultado[0]
-        else:
-            # Determina tipo baseado no nome
-            nome_lower = nome_metodo.lower()
-            if (
-                "cartão" in nome_lower
-                or "cartao" in nome_lower
-                or "credito" in nome_lower
-                or "debito" in nome_lower
-            ):
-                tipo = "cartao"
-            elif "pix" in nome_lower:
-                tipo = "pix"
-            elif "dinheiro" in nome_lower or "cash" in nome_lower:
-                tipo = "dinheiro"
-            elif "transferencia" in nome_lower or "ted" in nome_lower:
-                tipo = "transferencia"
-            else:
-                tipo = "conta"
+        self.pool.executar_escrita(_criar_metodos)
 
-            # Cria novo método
-            cursor.execute(
-                """
-                INSERT INTO metodos_pagamento (user_id, nome, tipo)
-                VALUES (?, ?, ?)
-            """,
-                (user_id, nome_metodo, tipo),
+    def executar_unidade(self, funcao, chat_id: int = None):
+        """Executa funcao(unidade) em uma transação de escrita
+
+        Os IDs de dimensões resolvidos e os saldos atualizados só entram nos
+        caches depois que a transação é confirmada, para nunca guardar
+        valores de um rollback. chat_id é o chat que recebe os alertas.
+        """
+        unidades: List[UnidadeDeTrabalho] = []
+
+        def _executar(conn):
+            unidade = UnidadeDeTrabalho(conn, self.cache_dimensoes, chat_id)
+            unidades.append(unidade)
+            return funcao(unidade)
+
+        resultado = self.pool.executar_escrita(_executar)
+        for unidade in unidades:
+            unidade.publicar_no_cache()
+            for domicilio_id, (versao, saldo) in unidade.saldos_atualizados.items():
+                self.cache_saldos.publicar(domicilio_id, versao, saldo)
+            apagar_arquivos(unidade.relatorios_invalidados)
+            if unidade.alertas_limite and self.notificar_limites:
+                try:
+                    self.notificar_limites(unidade.alertas_limite)
+                except Exception as e:
+                    logger.error(f"Erro ao notificar limites: {e}")
+        return resultado
+
+    def obter_ou_criar_responsavel(self, user_id: int, nome_responsavel: str) -> int:
+        """Obtém ou cria responsável e retorna o ID"""
+        return self.executar_unidade(
+            lambda unidade: unidade.obter_ou_criar_responsavel(
+                user_id, nome_responsavel
             )
-            metodo_id = cursor.lastrowid
+        )
 
-        conn.commit()
-        conn.close()
-        return metodo_id
+    def obter_ou_criar_metodo_pagamento(self, user_id: int, nome_metodo: str) -> int:
+        """Obtém ou cria método de pagamento e retorna o ID"""
+        return self.executar_unidade(
+            lambda unidade: unidade.obter_ou_criar_metodo_pagamento(
+                user_id, nome_metodo
+            )
+        )
 
     def obter_ou_criar_categoria(
         self, user_id: int, nome_categoria: str, tipo: str
     ) -> int:
         """Obtém ou cria categoria e retorna o ID"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Busca categoria existente
-        cursor.execute(
-            """
-            SELECT id FROM categorias 
-            WHERE user_id = ? AND nome = ? AND tipo = ?
-        """,
-            (user_id, nome_categoria, tipo),
-        )
-
-        resultado = cursor.fetchone()
-
-        if resultado:
-            categoria_id = resultado[0]
-        else:
-            # Cria nova categoria
-            cursor.execute(
-                """
-                INSERT INTO categorias (user_id, nome, tipo)
-                VALUES (?, ?, ?)
-            """,
-                (user_id, nome_categoria, tipo),
+        return self.executar_unidade(
+            lambda unidade: unidade.obter_ou_criar_categoria(
+                user_id, nome_categoria, tipo
             )
-            categoria_id = cursor.lastrowid
-
-        conn.commit()
-        conn.close()
-        return categoria_id
+        )
 
     def adicionar_lancamento(
         self,
         user_id: int,
         categoria: str,
         tipo: str,
-        valor: float,
+        valor_centavos: int,
         descricao: str,
         responsavel: str = None,
         metodo_pagamento: str = None,
+        chat_id: int = None,
     ) -> bool:
-        """Adiciona lançamento ao banco"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            # Obtém conta padrão
-            cursor.execute(
-                "SELECT id FROM contas WHERE user_id = ? AND nome = ?",
-                (user_id, "Conta Principal"),
-            )
-            conta_id = cursor.fetchone()[0]
-
-            # Obtém ou cria responsável
-            responsavel_id = self.obter_ou_criar_responsavel(
-                user_id, responsavel or "Eu"
-            )
-
-            # Obtém ou cria categoria
-            categoria_id = self.obter_ou_criar_categoria(user_id, categoria, tipo)
+        """Adiciona lançamento ao banco (valor em centavos)
 
-            # Obtém ou cria método de pagamento
-            metodo_pagamento_id = self.obter_ou_criar_metodo_pagamento(
-                user_id, metodo_pagamento or "Dinheiro"
-            )
-
-            # Adiciona lançamento
-            cursor.execute(
-                """
-                INSERT INTO lancamentos (user_id, conta_id, responsavel_id, categoria_id, 
-                                       metodo_pagamento_id, tipo, valor, descricao)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-                (
+        Dimensões, lançamento, saldo e resumo são gravados em uma única
+        transação pela UnidadeDeTrabalho. Os alertas de limite vão para o
+        chat_id (o chat do comando).
+        """
+        try:
+            self.executar_unidade(
+                lambda unidade: unidade.inserir_lancamento(
                     user_id,
-                    conta_id,
-                    responsavel_id,
-                    categoria_id,
-                    metodo_pagamento_id,
+                    categoria,
                     tipo,
-                    valor,
+                    valor_centavos,
                     descricao,
+                    responsavel,
+                    metodo_pagamento,
                 ),
+                chat_id,
             )
+            return True
 
-            # Atualiza saldo da conta
-            if tipo == "receita":
-                cursor.execute(
-                    """
-                    UPDATE contas SET saldo = saldo + ? WHERE id = ?
-                """,
-                    (valor, conta_id),
-                )
-            else:
-                cursor.execute(
-                    """
-                    UPDATE contas SET saldo = saldo - ? WHERE id = ?
-                """,
-                    (valor, conta_id),
-                )
+        except Exception as e:
+            logger.error(f"Erro ao adicionar lançamento: {e}")
+            return False
 
-            conn.commit()
-            conn.close()
+    def adicionar_lancamentos(
+        self,
+        user_id: int,
+        lancamentos: List[Dict],
+        responsavel: str = None,
+        chat_id: int = None,
+    ) -> bool:
+        """Adiciona um lote de lançamentos numa única transação (um commit)
+
+        lancamentos usa o formato de UnidadeDeTrabalho.inserir_lancamentos;
+        se um deles falhar, nenhum é gravado. Os alertas de limite vão para o
+        chat_id (o chat do comando).
+        """
+        try:
+            self.executar_unidade(
+                lambda unidade: unidade.inserir_lancamentos(
+                    user_id, lancamentos, responsavel
+                ),
+                chat_id,
+            )
             return True
 
         except Exception as e:
-            logger.error(f"Erro ao adicionar lançamento: {e}")
+            logger.error(f"Erro ao adicionar lote de lançamentos: {e}")
             return False
 
-    def obter_saldo(self, user_id: int) -> float:
-        """Obtém saldo atual do casal (todos os usuários)"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def materializar_parcelas(self, ate: str = None) -> int:
+        """Insere as parcelas projetadas com data anterior a `ate` (ISO),
+        limitado a amanhã: uma parcela futura nunca entra nos saldos antes
+        do dia dela (as consultas mostram as previstas, parcelas_previstas)
 
-        # Busca saldo de todos os usuários (casal compartilhado)
-        cursor.execute("SELECT SUM(saldo) FROM contas")
-        resultado = cursor.fetchone()
+        Sem parcelas pendentes custa uma consulta de leitura pelo índice.
+        """
+        amanha = (datetime.utcnow().date() + timedelta(days=1)).isoformat()
+        ate = min(ate or amanha, amanha)
+        pendente = (
+            self.pool.obter_conexao()
+            .execute(
+                "SELECT 1 FROM parcelamentos "
+                "WHERE proxima_data IS NOT NULL AND proxima_data < ? LIMIT 1",
+                (ate,),
+            )
+            .fetchone()
+        )
+        if not pendente:
+            return 0
+        return self.executar_unidade(lambda unidade: unidade.materializar_parcelas(ate))
+
+    def obter_tendencias(self, user_id: int, ano: int, mes: int) -> Optional[Dict]:
+        """Tendências de despesa do domicílio do usuário (None sem NumPy)
+
+        As colunas do domicílio ficam em memória junto com a versão do saldo
+        (que muda a cada escrita): enquanto ela não muda nada é lido; depois,
+        só os lançamentos novos.
+        """
+        if np is None:
+            return None
+        domicilio = self.obter_domicilio(user_id)
+        if domicilio is None:
+            domicilio = DOMICILIO_PADRAO
+
+        conn = self.pool.obter_conexao()
+        linha = conn.execute(
+            "SELECT versao FROM saldos_domicilio WHERE domicilio_id = ?", (domicilio,)
+        ).fetchone()
+        versao = linha[0] if linha else 0
+
+        with self._lock_colunas:
+            versao_carregada, dados = self._colunas_domicilio.get(
+                domicilio, (None, None)
+            )
+        if versao_carregada != versao:
+            dados = carregar_lancamentos_colunares(conn, domicilio, dados)
+            with self._lock_colunas:
+                self._colunas_domicilio[domicilio] = (versao, dados)
+        return calcular_tendencias(dados, ano, mes)
+
+    def obter_domicilio(self, user_id: int) -> Optional[int]:
+        """Retorna o domicílio do usuário, ou None se ele não estiver cadastrado"""
+        chave = ("domicilio", user_id)
+        domicilio_id = self.cache_dimensoes.obter(chave)
+        if domicilio_id is not None:
+            return domicilio_id
+
+        linha = (
+            self.pool.obter_conexao()
+            .execute("SELECT domicilio_id FROM usuarios WHERE user_id = ?", (user_id,))
+            .fetchone()
+        )
+        if linha is None:
+            return None
+        domicilio_id = linha[0] if linha[0] is not None else DOMICILIO_PADRAO
+        self.cache_dimensoes.guardar(chave, domicilio_id)
+        return domicilio_id
+
+    def obter_saldo(self, user_id: int, domicilio_id: int = None) -> int:
+        """Obtém saldo atual do domicílio do usuário, em centavos
+
+        Usuários não cadastrados veem o saldo de domicilio_id (o chat atual).
+        O saldo vem da memória; só a primeira consulta de cada domicílio lê
+        saldos_domicilio (busca pela chave primária).
+        """
+        domicilio = self.obter_domicilio(user_id)
+        if domicilio is None:
+            domicilio = domicilio_id if domicilio_id is not None else DOMICILIO_PADRAO
+
+        saldo = self.cache_saldos.obter(domicilio)
+        if saldo is not None:
+            return saldo
+
+        linha = (
+            self.pool.obter_conexao()
+            .execute(
+                "SELECT versao, saldo_centavos FROM saldos_domicilio "
+                "WHERE domicilio_id = ?",
+                (domicilio,),
+            )
+            .fetchone()
+        )
+        if linha is None:
+            return 0
+        self.cache_saldos.publicar(domicilio, linha[0], linha[1])
+        return linha[1]
+
+    def reconciliar_saldos(self, corrigir: bool = True) -> List[Dict]:
+        """Recalcula os saldos de domicílio a partir dos lançamentos
+
+        Registra no log cada divergência encontrada e, com corrigir=True,
+        atualiza o banco e a memória.
+        """
+        divergencias = reconciliar_saldos_domicilio(self.pool, corrigir=corrigir)
+        conn = self.pool.obter_conexao()
+
+        for divergencia in divergencias:
+            logger.warning(
+                "Saldo do domicílio %s divergente: armazenado %s, recalculado %s",
+                divergencia["domicilio_id"],
+                divergencia["armazenado_centavos"],
+                divergencia["recalculado_centavos"],
+            )
+            if corrigir:
+                linha = conn.execute(
+                    "SELECT versao, saldo_centavos FROM saldos_domicilio "
+                    "WHERE domicilio_id = ?",
+                    (divergencia["domicilio_id"],),
+                ).fetchone()
+                self.cache_saldos.publicar(
+                    divergencia["domicilio_id"], linha[0], linha[1]
+                )
 
-        conn.close()
-        return resultado[0] if resultado[0] else 0.0
+        return divergencias
 
     def adicionar_meta(
-        self, user_id: int, nome: str, valor_meta: float, data_limite: str = None
+        self,
+        user_id: int,
+        nome: str,
+        valor_meta_centavos: int,
+        data_limite: str = None,
+        percentual_receitas: float = None,
     ) -> bool:
-        """Adiciona meta ao banco"""
+        """Adiciona meta ao banco (valor em centavos)
+
+        Com percentual_receitas, cada receita sem #meta aporta esse
+        percentual na meta (UnidadeDeTrabalho.registrar_aportes).
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            def _adicionar_meta(conn):
+                cursor = conn.cursor()
 
-            cursor.execute(
-                """
-                INSERT INTO metas (user_id, nome, valor_meta, data_limite)
-                VALUES (?, ?, ?, ?)
-            """,
-                (user_id, nome, valor_meta, data_limite),
-            )
+                cursor.execute(
+                    """
+                    INSERT INTO metas (user_id, nome, valor_meta, valor_meta_centavos,
+                                       valor_atual_centavos, data_limite,
+                                       percentual_receitas)
+                    VALUES (?, ?, ?, ?, 0, ?, ?)
+                """,
+                    (
+                        user_id,
+                        nome,
+                        valor_meta_centavos / 100,
+                        valor_meta_centavos,
+                        data_limite,
+                        percentual_receitas,
+                    ),
+                )
 
-            conn.commit()
-            conn.close()
+            self.pool.executar_escrita(_adicionar_meta)
             return True
 
         except Exception as e:
             logger.error(f"Erro ao adicionar meta: {e}")
             return False
 
+    def encontrar_meta(self, user_id: int, nome: str) -> Optional[Dict]:
+        """Meta citada por #nome num lançamento (None se não existir)"""
+        metas = self.pool.obter_conexao().execute(SQL_METAS_APORTE, (user_id,))
+        return encontrar_meta([dict(linha) for linha in metas], nome)
+
     def listar_metas(self, user_id: int) -> List[Dict]:
-        """Lista todas as metas do usuário"""
-        conn = sqlite3.connect(self.db_path)
+        """Lista todas as metas do usuário com progresso e projeções
+
+        Tudo vem dos contadores da própria meta (valor atual e primeiro
+        aporte), sem somar o livro de aportes.
+        """
+        conn = self.pool.obter_conexao()
         cursor = conn.cursor()
 
         cursor.execute(
             """
-            SELECT id, nome, valor_meta, valor_atual, data_limite, created_at
+            SELECT id, nome, valor_meta_centavos, valor_atual_centavos, data_limite,
+                   created_at, percentual_receitas, primeiro_aporte
             FROM metas WHERE user_id = ?
             ORDER BY created_at DESC
         """,
@@ -955,44 +4095,36 @@ class VidaFinanceiraBot:
         )
 
         metas = []
+        hoje = datetime.utcnow().date()
         for row in cursor.fetchall():
-            metas.append(
-                {
-                    "id": row[0],
-                    "nome": row[1],
-                    "valor_meta": row[2],
-                    "valor_atual": row[3],
-                    "data_limite": row[4],
-                    "created_at": row[5],
-                }
-            )
+            meta = {
+                "id": row[0],
+                "nome": row[1],
+                "valor_meta_centavos": row[2],
+                "valor_atual_centavos": row[3],
+                "data_limite": row[4],
+                "created_at": row[5],
+                "percentual_receitas": row[6],
+            }
+            meta.update(projetar_meta(row[2], row[3], row[7], row[4], hoje))
+            metas.append(meta)
 
-        conn.close()
         return metas
 
     def obter_lancamentos_por_periodo(
         self, user_id: int, periodo: str = None
     ) -> List[Dict]:
         """Obtém lançamentos por período (casal compartilhado)"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.pool.obter_conexao()
         cursor = conn.cursor()
 
         if periodo:
             # Implementar filtro por período (mês atual por padrão)
-            cursor.execute(
-                """
-                SELECT l.id, l.tipo, l.valor, l.descricao, l.data_lancamento, c.nome as categoria, r.nome as responsavel
-                FROM lancamentos l
-                JOIN categorias c ON l.categoria_id = c.id
-                JOIN responsaveis r ON l.responsavel_id = r.id
-                WHERE strftime('%Y-%m', l.data_lancamento) = strftime('%Y-%m', 'now')
-                ORDER BY l.data_lancamento DESC
-            """
-            )
+            cursor.execute(SQL_LANCAMENTOS_PERIODO, intervalo_mes_atual())
         else:
             cursor.execute(
                 """
-                SELECT l.id, l.tipo, l.valor, l.descricao, l.data_lancamento, c.nome as categoria, r.nome as responsavel
+                SELECT l.id, l.tipo, l.valor_centavos, l.descricao, l.data_lancamento, c.nome as categoria, r.nome as responsavel
                 FROM lancamentos l
                 JOIN categorias c ON l.categoria_id = c.id
                 JOIN responsaveis r ON l.responsavel_id = r.id
@@ -1006,7 +4138,7 @@ class VidaFinanceiraBot:
                 {
                     "id": row[0],
                     "tipo": row[1],
-                    "valor": row[2],
+                    "valor_centavos": row[2],
                     "descricao": row[3],
                     "data_lancamento": row[4],
                     "categoria": row[5],
@@ -1014,32 +4146,23 @@ class VidaFinanceiraBot:
                 }
             )
 
-        conn.close()
         return lancamentos
 
     def obter_resumo_por_categoria(self, user_id: int, periodo: str = None) -> Dict:
         """Obtém resumo de gastos por categoria (casal compartilhado)"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.pool.obter_conexao()
         cursor = conn.cursor()
 
+        # Lê do resumo mensal (O(categorias)) em vez de agregar os lançamentos
         if periodo:
-            cursor.execute(
-                """
-                SELECT c.nome, l.tipo, SUM(l.valor) as total
-                FROM lancamentos l
-                JOIN categorias c ON l.categoria_id = c.id
-                WHERE strftime('%Y-%m', l.data_lancamento) = strftime('%Y-%m', 'now')
-                GROUP BY c.nome, l.tipo
-                ORDER BY total DESC
-            """
-            )
+            cursor.execute(SQL_RESUMO_CATEGORIA_PERIODO, (ano_mes_atual(),))
         else:
             cursor.execute(
                 """
-                SELECT c.nome, l.tipo, SUM(l.valor) as total
-                FROM lancamentos l
-                JOIN categorias c ON l.categoria_id = c.id
-                GROUP BY c.nome, l.tipo
+                SELECT c.nome, r.tipo, SUM(r.total_centavos) as total
+                FROM resumo_mensal r
+                JOIN categorias c ON r.categoria_id = c.id
+                GROUP BY c.nome, r.tipo
                 ORDER BY total DESC
             """
             )
@@ -1055,13 +4178,63 @@ class VidaFinanceiraBot:
 
             resumo[categoria][tipo] = total
 
-        conn.close()
         return resumo
 
-    def criar_grafico_gastos(self, user_id: int) -> str:
+    def _gastos_por_categoria(
+        self, user_id: int, periodo: str = None
+    ) -> Tuple[List[str], List[int]]:
+        """Categorias com despesa e os valores (centavos), do maior ao menor"""
+        resumo = self.obter_resumo_por_categoria(user_id, periodo)
+        gastos = sorted(
+            (
+                (dados["despesa"], categoria)
+                for categoria, dados in resumo.items()
+                if dados["despesa"] > 0
+            ),
+            reverse=True,
+        )
+        return [categoria for _, categoria in gastos], [valor for valor, _ in gastos]
+
+    def criar_grafico_png(self, user_id: int, periodo: str = None) -> Optional[bytes]:
+        """Gráfico de gastos por categoria em PNG, ou None para usar o texto
+
+        A imagem fica em cache por (domicílio, período, versão dos dados). O
+        resumo mostrado é o compartilhado por todos os domicílios, então a
+        versão é a soma das versões dos saldos: muda a cada escrita.
+        """
+        if not MATPLOTLIB_DISPONIVEL:
+            return None
+        try:
+            versao = (
+                self.pool.obter_conexao()
+                .execute("SELECT COALESCE(SUM(versao), 0) FROM saldos_domicilio")
+                .fetchone()[0]
+            )
+            chave = (self.obter_domicilio(user_id), periodo, versao)
+            imagem = self.graficos.obter(chave)
+            if imagem is not None:
+                return imagem
+
+            categorias, valores = self._gastos_por_categoria(user_id, periodo)
+            if not categorias:
+                return None
+            titulo = (
+                "Gastos do mês por categoria"
+                if periodo
+                else "Gastos por categoria"
+            )
+            return self.graficos.renderizar(
+                chave, renderizar_grafico_png, titulo, categorias, valores
+            )
+
+        except Exception as e:
+            logger.error(f"Erro ao criar gráfico PNG: {e}")
+            return None
+
+    def criar_grafico_gastos(self, user_id: int, periodo: str = None) -> str:
         """Cria gráfico de gastos por categoria (versão simplificada)"""
         try:
-            resumo = self.obter_resumo_por_categoria(user_id)
+            resumo = self.obter_resumo_por_categoria(user_id, periodo)
 
             # Filtrar apenas despesas
             categorias = []
@@ -1083,7 +4256,7 @@ class VidaFinanceiraBot:
                 percentual = (valor / total) * 100
                 barra = "█" * int(percentual / 2)  # Barra visual simples
                 grafico_texto += f"{categoria}: {percentual:.1f}%\n"
-                grafico_texto += f"`{barra}` R$ {valor:.2f}\n\n"
+                grafico_texto += f"`{barra}` {formatar_valor(valor)}\n\n"
 
             return grafico_texto
 
@@ -1091,86 +4264,77 @@ class VidaFinanceiraBot:
             logger.error(f"Erro ao criar gráfico: {e}")
             return None
 
-    def exportar_csv(self, user_id: int) -> str:
-        """Exporta dados para CSV (versão simplificada)"""
-        try:
-            lancamentos = self.obter_lancamentos_por_periodo(user_id)
+    def exportar_csv(self, user_id: int) -> Optional[tempfile.SpooledTemporaryFile]:
+        """Exporta os lançamentos para CSV num arquivo temporário em memória
 
-            if not lancamentos:
+        As linhas vêm do cursor em lotes (fetchmany), então a memória não
+        cresce com o histórico: acima de MEMORIA_MAXIMA_EXPORTACAO o arquivo
+        passa para o disco e é apagado ao ser fechado. Retorna o arquivo
+        posicionado no início, ou None se não houver lançamentos.
+        """
+        arquivo = tempfile.SpooledTemporaryFile(max_size=MEMORIA_MAXIMA_EXPORTACAO)
+        try:
+            cursor = self.pool.obter_conexao().execute(SQL_EXPORTACAO_CSV)
+            linhas = cursor.fetchmany(LINHAS_POR_LOTE_EXPORTACAO)
+            if not linhas:
+                arquivo.close()
                 return None
 
-            # Salvar CSV usando biblioteca nativa
-            filename = f"dados_financeiros_{user_id}.csv"
-
-            with open(filename, "w", newline="", encoding="utf-8-sig") as csvfile:
-                fieldnames = [
-                    "id",
-                    "tipo",
-                    "valor",
-                    "descricao",
-                    "data_lancamento",
-                    "categoria",
-                ]
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-                writer.writeheader()
-                for lancamento in lancamentos:
-                    # Formatar data
-                    try:
-                        data_obj = datetime.fromisoformat(
-                            lancamento["data_lancamento"].replace("Z", "+00:00")
-                        )
-                        lancamento["data_lancamento"] = data_obj.strftime(
-                            "%d/%m/%Y %H:%M"
-                        )
-                    except:
-                        # Se não conseguir parsear, manter como está
-                        pass
-                    writer.writerow(lancamento)
-
-            return filename
+            texto = io.TextIOWrapper(arquivo, encoding="utf-8-sig", newline="")
+            writer = csv.writer(texto)
+            writer.writerow(COLUNAS_EXPORTACAO_CSV)
+            while linhas:
+                writer.writerows(linhas)
+                linhas = cursor.fetchmany(LINHAS_POR_LOTE_EXPORTACAO)
+            texto.flush()
+            texto.detach()
+
+            arquivo.seek(0)
+            return arquivo
 
         except Exception as e:
             logger.error(f"Erro ao exportar CSV: {e}")
+            arquivo.close()
             return None
 
     def adicionar_limite_gasto(
-        self, user_id: int, categoria: str, valor_limite: float
+        self,
+        user_id: int,
+        categoria: str,
+        valor_limite_centavos: int,
+        periodo: str = "mensal",
     ) -> bool:
-        """Adiciona limite de gasto para categoria"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+        """Adiciona limite de gasto para categoria (valor em centavos)
 
-            # Obtém categoria
-            cursor.execute(
-                """
-                SELECT id FROM categorias 
-                WHERE user_id = ? AND nome = ? AND tipo = 'despesa'
-            """,
-                (user_id, categoria),
-            )
+        periodo é uma chave de PERIODOS_LIMITE; cada período tem o seu
+        limite, independente dos demais da mesma categoria.
+        """
+        try:
+            def _adicionar_limite(unidade):
+                cursor = unidade.conn.cursor()
 
-            resultado = cursor.fetchone()
-            if not resultado:
-                # Cria categoria se não existir
-                categoria_id = self.obter_ou_criar_categoria(
+                # Obtém categoria (cria se não existir) na mesma transação
+                categoria_id = unidade.obter_ou_criar_categoria(
                     user_id, categoria, "despesa"
                 )
-            else:
-                categoria_id = resultado[0]
 
-            # Adiciona limite
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO limites_gastos (user_id, categoria_id, valor_limite)
-                VALUES (?, ?, ?)
-            """,
-                (user_id, categoria_id, valor_limite),
-            )
+                # Adiciona limite
+                cursor.execute(
+                    """
+                    INSERT OR REPLACE INTO limites_gastos (user_id, categoria_id, valor_limite,
+                                                           valor_limite_centavos, periodo)
+                    VALUES (?, ?, ?, ?, ?)
+                """,
+                    (
+                        user_id,
+                        categoria_id,
+                        valor_limite_centavos / 100,
+                        valor_limite_centavos,
+                        periodo,
+                    ),
+                )
 
-            conn.commit()
-            conn.close()
+            self.executar_unidade(_adicionar_limite)
             return True
 
         except Exception as e:
@@ -1178,57 +4342,101 @@ class VidaFinanceiraBot:
             return False
 
     def verificar_limites(self, user_id: int) -> List[Dict]:
-        """Verifica se algum limite foi ultrapassado"""
-        conn = sqlite3.connect(self.db_path)
+        """Verifica se algum limite foi ultrapassado
+
+        Limites mensais são lidos do resumo mensal; os de janela móvel custam
+        duas buscas em gastos_diarios cada.
+        """
+        conn = self.pool.obter_conexao()
         cursor = conn.cursor()
 
-        cursor.execute(
-            """
-            SELECT c.nome, lg.valor_limite, COALESCE(SUM(l.valor), 0) as gasto_atual
-            FROM limites_gastos lg
-            JOIN categorias c ON lg.categoria_id = c.id
-            LEFT JOIN lancamentos l ON l.categoria_id = c.id 
-                AND l.user_id = ? 
-                AND l.tipo = 'despesa'
-                AND strftime('%Y-%m', l.data_lancamento) = strftime('%Y-%m', 'now')
-            WHERE lg.user_id = ?
-            GROUP BY c.nome, lg.valor_limite
-            HAVING gasto_atual > lg.valor_limite
-        """,
-            (user_id, user_id),
-        )
+        cursor.execute(SQL_VERIFICAR_LIMITES, (ano_mes_atual(), user_id))
+        ultrapassados = [
+            (row[0], "mensal", row[1], row[2]) for row in cursor.fetchall()
+        ]
+
+        for categoria_id, categoria, limite_centavos, periodo in conn.execute(
+            SQL_LIMITES_JANELA_MOVEL, (user_id,)
+        ).fetchall():
+            dias = PERIODOS_LIMITE.get(periodo, (None,))[0]
+            if not dias:
+                continue
+            gasto_centavos = gasto_na_janela(conn, user_id, categoria_id, dias)
+            if gasto_centavos > limite_centavos:
+                ultrapassados.append(
+                    (categoria, periodo, limite_centavos, gasto_centavos)
+                )
 
         limites_ultrapassados = []
-        for row in cursor.fetchall():
+        for categoria, periodo, limite_centavos, gasto_centavos in ultrapassados:
             limites_ultrapassados.append(
                 {
-                    "categoria": row[0],
-                    "limite": row[1],
-                    "gasto_atual": row[2],
-                    "excesso": row[2] - row[1],
+                    "categoria": categoria,
+                    "periodo": periodo,
+                    "limite_centavos": limite_centavos,
+                    "gasto_atual_centavos": gasto_centavos,
+                    "excesso_centavos": gasto_centavos - limite_centavos,
                 }
             )
 
-        conn.close()
         return limites_ultrapassados
 
     def resetar_dados(self, user_id: int) -> bool:
         """Resetar todos os dados do usuário"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            def _resetar(conn):
+                cursor = conn.cursor()
 
-            # Deletar dados do usuário
-            cursor.execute("DELETE FROM lancamentos WHERE user_id = ?", (user_id,))
-            cursor.execute("DELETE FROM metas WHERE user_id = ?", (user_id,))
-            cursor.execute("DELETE FROM limites_gastos WHERE user_id = ?", (user_id,))
-            cursor.execute("DELETE FROM categorias WHERE user_id = ?", (user_id,))
-            cursor.execute("DELETE FROM responsaveis WHERE user_id = ?", (user_id,))
-            cursor.execute("DELETE FROM contas WHERE user_id = ?", (user_id,))
-            cursor.execute("DELETE FROM usuarios WHERE user_id = ?", (user_id,))
-
-            conn.commit()
-            conn.close()
+                # Retira os lançamentos do usuário do saldo do domicílio
+                cursor.execute(
+                    """
+                    SELECT COALESCE(SUM(CASE WHEN tipo = 'receita'
+                                             THEN valor_centavos
+                                             ELSE -valor_centavos END), 0)
+                    FROM lancamentos WHERE user_id = ?
+                """,
+                    (user_id,),
+                )
+                contribuicao = cursor.fetchone()[0]
+                unidade = UnidadeDeTrabalho(conn)
+                unidade.ajustar_saldo_domicilio(user_id, -contribuicao)
+
+                # Deletar dados do usuário
+                cursor.execute("DELETE FROM lancamentos WHERE user_id = ?", (user_id,))
+                cursor.execute("DELETE FROM resumo_mensal WHERE user_id = ?", (user_id,))
+                cursor.execute("DELETE FROM gastos_diarios WHERE user_id = ?", (user_id,))
+                cursor.execute("DELETE FROM meses_fechados WHERE user_id = ?", (user_id,))
+                relatorios = [
+                    linha[0]
+                    for linha in cursor.execute(
+                        "DELETE FROM relatorios_mensais WHERE user_id = ? "
+                        "RETURNING arquivo_path",
+                        (user_id,),
+                    )
+                ]
+                cursor.execute(
+                    "DELETE FROM aportes_metas WHERE meta_id IN "
+                    "(SELECT id FROM metas WHERE user_id = ?)",
+                    (user_id,),
+                )
+                cursor.execute("DELETE FROM metas WHERE user_id = ?", (user_id,))
+                cursor.execute("DELETE FROM parcelamentos WHERE user_id = ?", (user_id,))
+                cursor.execute("DELETE FROM limites_gastos WHERE user_id = ?", (user_id,))
+                cursor.execute("DELETE FROM categorias WHERE user_id = ?", (user_id,))
+                cursor.execute("DELETE FROM responsaveis WHERE user_id = ?", (user_id,))
+                cursor.execute("DELETE FROM contas WHERE user_id = ?", (user_id,))
+                cursor.execute("DELETE FROM usuarios WHERE user_id = ?", (user_id,))
+                return unidade.saldos_atualizados, relatorios
+
+            saldos, relatorios = self.pool.executar_escrita(_resetar)
+            apagar_arquivos(relatorios)
+            for domicilio_id, (versao, saldo) in saldos.items():
+                self.cache_saldos.publicar(domicilio_id, versao, saldo)
+            self._usuarios_provisionados.pop(user_id, None)
+            self.cache_dimensoes.invalidar_usuario(user_id)
+            # Lançamentos apagados: as colunas do domicílio são relidas
+            with self._lock_colunas:
+                self._colunas_domicilio.clear()
             return True
 
         except Exception as e:
@@ -1236,6 +4444,245 @@ class VidaFinanceiraBot:
             return False
 
 
+# Agenda padrão das tarefas de manutenção: "HH:MM" roda todo dia nesse
+# horário em UTC (o mesmo fuso das datas dos lançamentos; 03:00-05:00 UTC
+# é madrugada no Brasil), "<n>m" ou "<n>h" a cada intervalo e "off" desliga.
+# AGENDA_MANUTENCAO="fechar-meses=02:00;reconciliar-saldos=6h" sobrescreve.
+AGENDA_MANUTENCAO_PADRAO = {
+    "materializar-parcelas": "00:05",
+    "fechar-meses": "03:00",
+    "relatorios-mes-anterior": "03:30",
+    "otimizar-banco": "04:00",
+    "reconciliar-saldos": "04:30",
+}
+
+# Tarefas que também rodam logo após o bot iniciar, para não esperar a
+# próxima janela depois de um restart
+TAREFAS_NA_INICIALIZACAO = ("materializar-parcelas",)
+
+
+def ler_agenda_manutencao(texto: Optional[str]) -> Dict[str, str]:
+    """Combina a agenda padrão com as entradas "tarefa=quando" do texto
+
+    Entradas com tarefa ou horário inválidos vão para o log e são ignoradas.
+    """
+    agenda = dict(AGENDA_MANUTENCAO_PADRAO)
+    for entrada in filter(None, (texto or "").replace(",", ";").split(";")):
+        nome, _, quando = (parte.strip() for parte in entrada.partition("="))
+        if nome not in agenda:
+            logger.warning(f"Tarefa de manutenção desconhecida: {nome}")
+            continue
+        try:
+            if quando != "off":
+                interpretar_agenda(quando)
+        except ValueError:
+            logger.warning(f"Agenda inválida para {nome}: {quando!r}")
+            continue
+        agenda[nome] = quando
+    return agenda
+
+
+def interpretar_agenda(quando: str):
+    """Converte "HH:MM" em horário (UTC) ou "<n>m"/"<n>h" em segundos"""
+    if ":" in quando:
+        return datetime.strptime(quando, "%H:%M").time().replace(tzinfo=timezone.utc)
+
+    multiplicador = {"m": 60, "h": 60 * 60}.get(quando[-1:])
+    if multiplicador is None or not quando[:-1].isdigit() or int(quando[:-1]) < 1:
+        raise ValueError(quando)
+    return int(quando[:-1]) * multiplicador
+
+
+class TarefasManutencao:
+    """Tarefas de manutenção em segundo plano, fora do caminho dos comandos
+
+    Cada tarefa roda uma vez por vez: uma execução que encontra a anterior
+    ainda em andamento (um job atrasado ou uma execução manual) é ignorada e
+    contada nas métricas. As métricas ficam em memória e cada execução vai
+    para o log com a duração e o resultado.
+    """
+
+    def __init__(self, bot: "VidaFinanceiraBot"):
+        self.bot = bot
+        self._tarefas = {
+            "materializar-parcelas": self._materializar_parcelas,
+            "fechar-meses": lambda: fechar_meses(bot.pool),
+            "relatorios-mes-anterior": lambda: pre_gerar_relatorios(bot.pool),
+            "otimizar-banco": lambda: otimizar_banco(bot.pool),
+            "reconciliar-saldos": self._reconciliar_saldos,
+        }
+        self._em_execucao = {nome: threading.Lock() for nome in self._tarefas}
+        self._lock_metricas = threading.Lock()
+        self._metricas = {
+            nome: {
+                "execucoes": 0,
+                "falhas": 0,
+                "ignoradas": 0,
+                "duracao_total": 0.0,
+                "duracao_maxima": 0.0,
+                "ultima_duracao": None,
+                "ultimo_inicio": None,
+                "ultimo_resultado": None,
+                "ultimo_erro": None,
+            }
+            for nome in self._tarefas
+        }
+
+    @property
+    def nomes(self) -> List[str]:
+        return list(self._tarefas)
+
+    def _materializar_parcelas(self) -> int:
+        return self.bot.materializar_parcelas()
+
+    def _reconciliar_saldos(self) -> int:
+        # As divergências já vão para o log em reconciliar_saldos
+        return len(self.bot.reconciliar_saldos())
+
+    def executar(self, nome: str):
+        """Roda a tarefa agora e retorna o resultado (None se ignorada ou falhou)"""
+        em_execucao = self._em_execucao[nome]
+        if not em_execucao.acquire(blocking=False):
+            with self._lock_metricas:
+                self._metricas[nome]["ignoradas"] += 1
+            logger.warning(f"Tarefa {nome} ignorada: execução anterior em andamento")
+            return None
+
+        inicio = time.perf_counter()
+        resultado, erro = None, None
+        try:
+            resultado = self._tarefas[nome]()
+        except Exception as e:
+            erro = e
+            logger.exception(f"Erro na tarefa {nome}")
+        finally:
+            em_execucao.release()
+
+        duracao = time.perf_counter() - inicio
+        with self._lock_metricas:
+            metricas = self._metricas[nome]
+            metricas["execucoes"] += 1
+            metricas["duracao_total"] += duracao
+            metricas["duracao_maxima"] = max(metricas["duracao_maxima"], duracao)
+            metricas["ultima_duracao"] = duracao
+            metricas["ultimo_inicio"] = datetime.utcnow().isoformat(timespec="seconds")
+            if erro is None:
+                metricas["ultimo_resultado"] = resultado
+            else:
+                metricas["falhas"] += 1
+                metricas["ultimo_erro"] = repr(erro)
+
+        if erro is None:
+            logger.info(f"Tarefa {nome} concluída em {duracao:.3f}s: {resultado}")
+        return resultado
+
+    def metricas(self) -> Dict[str, Dict]:
+        """Cópia das métricas de cada tarefa"""
+        with self._lock_metricas:
+            return {nome: dict(metricas) for nome, metricas in self._metricas.items()}
+
+    def agendar(self, job_queue, agenda: Dict[str, str]):
+        """Agenda as tarefas no job_queue do Application conforme a agenda"""
+        for nome, quando in agenda.items():
+            if quando == "off":
+                logger.info(f"Tarefa {nome} desativada")
+                continue
+
+            horario = interpretar_agenda(quando)
+            if isinstance(horario, int):
+                job_queue.run_repeating(
+                    executar_tarefa_job,
+                    interval=horario,
+                    first=horario,
+                    data=nome,
+                    name=nome,
+                )
+            else:
+                job_queue.run_daily(
+                    executar_tarefa_job, time=horario, data=nome, name=nome
+                )
+
+        for nome in TAREFAS_NA_INICIALIZACAO:
+            job_queue.run_once(executar_tarefa_job, when=30, data=nome)
+
+
+# Threads do executor do banco: o SQLite bloqueia, então as consultas e
+# escritas saem do loop asyncio; cada thread mantém uma conexão do pool
+THREADS_BANCO = 8
+# Atualizações do Telegram atendidas ao mesmo tempo (uma corrotina cada)
+ATUALIZACOES_CONCORRENTES = 256
+
+
+async def no_banco(context: CallbackContext, funcao, *argumentos):
+    """Roda funcao(*argumentos) no executor do banco sem bloquear o loop"""
+    return await asyncio.get_running_loop().run_in_executor(
+        context.bot_data.get("executor_banco"), partial(funcao, *argumentos)
+    )
+
+
+async def encerrar_aplicacao(application: Application):
+    """Ao parar: espera as tarefas do executor do banco e fecha as conexões"""
+    application.bot_data["executor_banco"].shutdown(wait=True)
+    application.bot_data["bot_instance"].pool.fechar()
+
+
+def construir_aplicacao(
+    bot: "VidaFinanceiraBot",
+    token: str,
+    concorrencia: int = ATUALIZACOES_CONCORRENTES,
+    threads_banco: int = THREADS_BANCO,
+    request=None,
+) -> Application:
+    """Cria o Application com os handlers e o executor do banco
+
+    Os handlers são corrotinas: várias conversas são atendidas ao mesmo tempo
+    num único loop, e só o trabalho no SQLite ocupa uma das threads_banco
+    threads (no_banco). request troca o cliente HTTP do Telegram (benchmark).
+    """
+    construtor = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(concorrencia)
+        .post_shutdown(encerrar_aplicacao)
+    )
+    if request is not None:
+        construtor = construtor.request(request).get_updates_request(request)
+    application = construtor.build()
+
+    # Armazenar instância do bot para uso nos handlers
+    application.bot_data["bot_instance"] = bot
+    application.bot_data["executor_banco"] = ThreadPoolExecutor(
+        threads_banco, thread_name_prefix="banco"
+    )
+
+    # Adicionar handlers de comandos
+    application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("add", add_lancamento_command))
+    application.add_handler(CommandHandler("saldo", saldo_command))
+    application.add_handler(CommandHandler("meta", meta_command))
+    application.add_handler(CommandHandler("metas", listar_metas_command))
+    application.add_handler(CommandHandler("relatorio", relatorio_command))
+    application.add_handler(CommandHandler("grafico", grafico_command))
+    application.add_handler(CommandHandler("exportar", exportar_command))
+    application.add_handler(CommandHandler("limite", limite_command))
+    application.add_handler(CommandHandler("limites", listar_limites_command))
+    application.add_handler(CommandHandler("reset", reset_command))
+    application.add_handler(CommandHandler("mes", mes_command))
+    application.add_handler(CommandHandler("tendencias", tendencias_command))
+
+    # Handler para botões inline
+    application.add_handler(CallbackQueryHandler(button_callback))
+
+    # Alertas de limite saem pelo job_queue, sem atrasar a resposta do comando
+    # (notificar_limites é chamado na thread do executor; o agendador do
+    # job_queue aceita jobs de outras threads)
+    bot.notificar_limites = lambda alertas: application.job_queue.run_once(
+        enviar_alertas_limite_job, when=0, data=alertas
+    )
+    return application
+
+
 def main():
     """Função principal para iniciar o bot"""
     # Token do bot (você precisa criar um bot no @BotFather do Telegram)
@@ -1251,44 +4698,35 @@ def main():
         print("5. Copie o token e defina como variável de ambiente TELEGRAM_BOT_TOKEN")
         return
 
-    # Criar instância do bot
-    bot = VidaFinanceiraBot(BOT_TOKEN)
-
-    # Criar updater e dispatcher
-    updater = Updater(token=BOT_TOKEN, use_context=True)
-    dispatcher = updater.dispatcher
-
-    # Armazenar instância do bot para uso nos handlers
-    dispatcher.bot_data["bot_instance"] = bot
+    # Criar instância do bot (MODO_ARMAZENAMENTO=padrao desativa o WAL)
+    bot = VidaFinanceiraBot(
+        BOT_TOKEN, modo_armazenamento=os.getenv("MODO_ARMAZENAMENTO", "wal")
+    )
 
-    # Adicionar handlers de comandos
-    dispatcher.add_handler(CommandHandler("start", start_command))
-    dispatcher.add_handler(CommandHandler("help", help_command))
-    dispatcher.add_handler(CommandHandler("add", add_lancamento_command))
-    dispatcher.add_handler(CommandHandler("saldo", saldo_command))
-    dispatcher.add_handler(CommandHandler("meta", meta_command))
-    dispatcher.add_handler(CommandHandler("metas", listar_metas_command))
-    dispatcher.add_handler(CommandHandler("relatorio", relatorio_command))
-    dispatcher.add_handler(CommandHandler("grafico", grafico_command))
-    dispatcher.add_handler(CommandHandler("exportar", exportar_command))
-    dispatcher.add_handler(CommandHandler("limite", limite_command))
-    dispatcher.add_handler(CommandHandler("limites", listar_limites_command))
-    dispatcher.add_handler(CommandHandler("reset", reset_command))
-    dispatcher.add_handler(CommandHandler("mes", mes_command))
+    # Criar o Application (handlers assíncronos, SQLite no executor)
+    application = construir_aplicacao(
+        bot,
+        BOT_TOKEN,
+        threads_banco=int(os.getenv("THREADS_BANCO", THREADS_BANCO)),
+    )
 
-    # Handler para botões inline
-    dispatcher.add_handler(CallbackQueryHandler(button_callback))
+    # Manutenção em segundo plano: parcelas que vencem, meses fechados,
+    # relatórios do mês anterior, estatísticas do banco e saldos
+    application.bot_data["tarefas"] = TarefasManutencao(bot)
+    application.bot_data["tarefas"].agendar(
+        application.job_queue, ler_agenda_manutencao(os.getenv("AGENDA_MANUTENCAO"))
+    )
 
     # Iniciar o bot
     print("🚀 Bot iniciado! Pressione Ctrl+C para parar.")
-    updater.start_polling()
+    application.run_polling()
 
 
 # Handlers de comandos (serão implementados)
-def start_command(update: Update, context: CallbackContext):
+async def start_command(update: Update, context: CallbackContext):
     """Comando /start - Boas-vindas"""
     user = update.effective_user
-    update.message.reply_text(
+    await update.message.reply_text(
         f"👋 Olá {user.first_name}!\n\n"
         "🎯 Bem-vindo ao seu Bot de Vida Financeira!\n\n"
         "📋 Comandos disponíveis:\n"
@@ -1301,7 +4739,7 @@ def start_command(update: Update, context: CallbackContext):
     )
 
 
-def help_command(update: Update, context: CallbackContext):
+async def help_command(update: Update, context: CallbackContext):
     """Comando /help - Lista todos os comandos"""
     help_text = """
 🤖 **Bot de Vida Financeira - Comandos**
@@ -1314,16 +4752,19 @@ def help_command(update: Update, context: CallbackContext):
 💰 **Saldo e Relatórios:**
 /saldo - Ver saldo atual
 /relatorio - Relatório mensal completo
-/grafico - Gráfico de gastos por categoria
+/grafico - Gráfico de gastos por categoria (/grafico mes: mês atual)
+/tendencias - Tendências de gastos (ou /tendencias MM-YYYY)
 
 🎯 **Metas Inteligentes:**
 /meta Viagem de Casamento 20000 30-03-26
-/meta Notebook Gamer 3000 15-12-24
+/meta Notebook Gamer 3000 15-12-24 10% (10% de cada receita vai para a meta)
+/add 500 guardar #viagem - Aporte na meta
 /metas - Listar todas as metas
 
 🎯 **Limites de Gastos:**
 /limite alimentação 500
 /limite transporte 200
+/limite alimentação 150 semanal (diario, semanal, quinzenal, mensal, anual)
 /limites - Ver limites ultrapassados
 
 📤 **Exportação:**
@@ -1337,67 +4778,215 @@ def help_command(update: Update, context: CallbackContext):
 • O bot reconhece categorias automaticamente
 • Datas aceitas: 30-03-26, 30/03/2026
 • Comandos funcionam em qualquer ordem!
+• Vários lançamentos: um por linha no mesmo /add, ou responda
+  uma lista (colada ou encaminhada) com /add
+• Parcelado: /add eletrônicos despesa 150 tv [1/10] lança 150 por
+  mês nos próximos 10 meses (as parcelas já lançadas entram no saldo)
     """
-    update.message.reply_text(help_text)
+    await update.message.reply_text(help_text)
 
 
-def add_lancamento_command(update: Update, context: CallbackContext):
+async def add_lancamento_command(update: Update, context: CallbackContext):
     """Comando /add - Adicionar lançamento com parsing inteligente"""
     user = update.effective_user
     texto_completo = update.message.text
 
-    # Registrar usuário se não existir
+    # Registrar usuário se não existir (só consulta a memória depois da 1ª vez)
     bot_instance = context.bot_data.get("bot_instance")
     if bot_instance:
-        bot_instance.registrar_usuario(user.id, user.username, user.first_name)
-        bot_instance.criar_conta_padrao(user.id)
-        bot_instance.criar_responsavel_padrao(user.id, user.first_name)
-        bot_instance.criar_metodo_pagamento_padrao(user.id)
+        await no_banco(
+            context,
+            bot_instance.provisionar_usuario,
+            user.id,
+            user.username,
+            user.first_name,
+            update.effective_chat.id,
+        )
+
+        # Vários lançamentos: um por linha, ou /add em resposta a uma lista
+        linhas = bot_instance.parser.parse_lote_add(texto_completo)
+        respondida = update.message.reply_to_message
+        if not linhas and respondida and respondida.text:
+            linhas = bot_instance.parser.parse_lote_add(respondida.text)
+            if linhas:
+                await adicionar_lote(update, context, bot_instance, user, linhas)
+                return
+        if len(linhas) > 1:
+            await adicionar_lote(update, context, bot_instance, user, linhas)
+            return
 
         # Fazer parsing inteligente
-        resultado = bot_instance.parser.parse_comando_add(texto_completo)
+        if linhas:
+            resultado = linhas[0][1]
+        else:
+            resultado = bot_instance.parser.parse_comando_add(texto_completo)
 
         if resultado["erro"]:
-            update.message.reply_text(f"❌ {resultado['erro']}")
+            await update.message.reply_text(f"❌ {resultado['erro']}")
         else:
-            # Adicionar lançamento
-            sucesso = bot_instance.adicionar_lancamento(
-                user.id,
-                resultado["categoria"],
-                resultado["tipo"],
-                resultado["valor"],
-                resultado["descricao"],
-                user.first_name,  # Usar nome do usuário como responsável
-                resultado["metodo_pagamento"],
-            )
+            # Adicionar lançamento (parcelado vira um plano de parcelamento,
+            # um #meta vira um aporte e uma data reabre o mês, se fechado,
+            # todos pelo caminho de lote)
+            if (
+                resultado["parcelas"]
+                or resultado["meta"]
+                or resultado["data_referencia"]
+            ):
+                sucesso = await no_banco(
+                    context,
+                    bot_instance.adicionar_lancamentos,
+                    user.id,
+                    [resultado],
+                    user.first_name,
+                    update.effective_chat.id,
+                )
+            else:
+                sucesso = await no_banco(
+                    context,
+                    bot_instance.adicionar_lancamento,
+                    user.id,
+                    resultado["categoria"],
+                    resultado["tipo"],
+                    resultado["valor_centavos"],
+                    resultado["descricao"],
+                    user.first_name,  # Usar nome do usuário como responsável
+                    resultado["metodo_pagamento"],
+                    update.effective_chat.id,
+                )
 
             if sucesso:
                 emoji = "💰" if resultado["tipo"] == "receita" else "💸"
-                update.message.reply_text(
+                data = date.fromisoformat(
+                    resultado["data_referencia"]
+                    or datetime.utcnow().date().isoformat()
+                )
+                data_info = (
+                    f"📅 Data: {data.strftime('%d/%m/%Y')}\n"
+                    if resultado["data_referencia"]
+                    else ""
+                )
+                parcelas_info = ""
+                if resultado["parcelas"]:
+                    parcela_atual, total_parcelas = resultado["parcelas"]
+                    restantes = total_parcelas - parcela_atual + 1
+                    ultima = somar_meses(data, restantes - 1)
+                    parcelas_info = (
+                        f"🗓️ Parcelas: {parcela_atual} a {total_parcelas} "
+                        f"({restantes}x {formatar_valor(resultado['valor_centavos'])}"
+                        f" = {formatar_valor(restantes * resultado['valor_centavos'])}"
+                        f", até {ultima.month:02d}/{ultima.year})\n"
+                    )
+                meta_info = ""
+                if resultado["meta"]:
+                    meta = await no_banco(
+                        context, bot_instance.encontrar_meta, user.id, resultado["meta"]
+                    )
+                    meta_info = (
+                        f"🎯 Aporte na meta: {meta['nome']}\n"
+                        if meta
+                        else f"⚠️ Meta #{resultado['meta']} não encontrada\n"
+                    )
+                await update.message.reply_text(
                     f"{emoji} **Lançamento adicionado!**\n\n"
                     f"📊 Categoria: {resultado['categoria']}\n"
                     f"🏷️ Tipo: {resultado['tipo']}\n"
-                    f"💵 Valor: R$ {resultado['valor']:.2f}\n"
+                    f"💵 Valor: {formatar_valor(resultado['valor_centavos'])}\n"
+                    f"{data_info}"
+                    f"{parcelas_info}"
+                    f"{meta_info}"
                     f"👤 Responsável: {user.first_name}\n"
                     f"💳 Método: {resultado['metodo_pagamento']}\n"
                     f"📝 Descrição: {resultado['descricao']}\n\n"
                     f"✅ Saldo atualizado!"
                 )
             else:
-                update.message.reply_text(
+                await update.message.reply_text(
                     "❌ Erro ao adicionar lançamento. Tente novamente."
                 )
     else:
-        update.message.reply_text("❌ Erro interno do bot. Tente novamente.")
+        await update.message.reply_text("❌ Erro interno do bot. Tente novamente.")
+
+
+# Máximo de lançamentos listados na resposta de um lote
+LANCAMENTOS_LISTADOS_NO_LOTE = 20
+
+
+async def adicionar_lote(
+    update: Update,
+    context: CallbackContext,
+    bot_instance,
+    user,
+    linhas: List[Tuple[int, Dict]],
+):
+    """Grava os lançamentos válidos de um lote e responde com um resumo"""
+    validos = [(numero, r) for numero, r in linhas if not r["erro"]]
+    invalidos = [(numero, r) for numero, r in linhas if r["erro"]]
+
+    if not validos:
+        await update.message.reply_text(
+            "❌ Nenhum lançamento válido na lista.\n"
+            + "\n".join(f"• linha {n}: {r['erro']}" for n, r in invalidos[:10])
+        )
+        return
+
+    sucesso = await no_banco(
+        context,
+        bot_instance.adicionar_lancamentos,
+        user.id,
+        [resultado for _, resultado in validos],
+        user.first_name,  # Usar nome do usuário como responsável
+        update.effective_chat.id,
+    )
+    if not sucesso:
+        await update.message.reply_text(
+            "❌ Erro ao adicionar lançamentos. Tente novamente."
+        )
+        return
+
+    totais = {"receita": [0, 0], "despesa": [0, 0]}
+    for _, resultado in validos:
+        totais[resultado["tipo"]][0] += resultado["valor_centavos"]
+        totais[resultado["tipo"]][1] += 1
+
+    mensagem = f"📥 **{len(validos)} lançamentos adicionados!**\n\n"
+    if totais["despesa"][1]:
+        mensagem += (
+            f"💸 Despesas: {formatar_valor(totais['despesa'][0])} "
+            f"({totais['despesa'][1]})\n"
+        )
+    if totais["receita"][1]:
+        mensagem += (
+            f"💰 Receitas: {formatar_valor(totais['receita'][0])} "
+            f"({totais['receita'][1]})\n"
+        )
+    mensagem += f"👤 Responsável: {user.first_name}\n\n"
+
+    for numero, resultado in validos[:LANCAMENTOS_LISTADOS_NO_LOTE]:
+        mensagem += (
+            f"• {resultado['categoria']}: {formatar_valor(resultado['valor_centavos'])}"
+            f" - {resultado['descricao']}\n"
+        )
+    if len(validos) > LANCAMENTOS_LISTADOS_NO_LOTE:
+        mensagem += f"… e mais {len(validos) - LANCAMENTOS_LISTADOS_NO_LOTE}\n"
+
+    if invalidos:
+        mensagem += f"\n⚠️ {len(invalidos)} linhas ignoradas:\n"
+        for numero, resultado in invalidos[:10]:
+            mensagem += f"• linha {numero}: {resultado['erro']}\n"
 
+    mensagem += "\n✅ Saldo atualizado!"
+    await update.message.reply_text(mensagem)
 
-def saldo_command(update: Update, context: CallbackContext):
+
+async def saldo_command(update: Update, context: CallbackContext):
     """Comando /saldo - Ver saldo atual"""
     user = update.effective_user
 
     bot_instance = context.bot_data.get("bot_instance")
     if bot_instance:
-        saldo = bot_instance.obter_saldo(user.id)
+        saldo = await no_banco(
+            context, bot_instance.obter_saldo, user.id, update.effective_chat.id
+        )
 
         if saldo >= 0:
             emoji = "💰"
@@ -1406,17 +4995,57 @@ def saldo_command(update: Update, context: CallbackContext):
             emoji = "⚠️"
             status = "Negativo"
 
-        update.message.reply_text(
+        await update.message.reply_text(
             f"{emoji} **Saldo do Casal**\n\n"
-            f"💵 Valor: R$ {saldo:.2f}\n"
+            f"💵 Valor: {formatar_valor(saldo)}\n"
             f"📊 Status: {status}\n\n"
             f"💡 Use /add para adicionar lançamentos"
         )
     else:
-        update.message.reply_text("❌ Erro interno do bot. Tente novamente.")
+        await update.message.reply_text("❌ Erro interno do bot. Tente novamente.")
+
+
+def formatar_alerta_limite(alerta: Dict) -> str:
+    """Mensagem de um limite atingido (80%) ou ultrapassado (100%)"""
+    limite = alerta["limite_centavos"]
+    gasto = alerta["gasto_centavos"]
+    nome = alerta["categoria"]
+    if alerta["periodo"] != "mensal":
+        nome += f" ({alerta['periodo']})"
+    if alerta["limiar"] >= 100:
+        texto = f"🚨 **Limite ultrapassado: {nome}**\n\n"
+    else:
+        texto = f"⚠️ **{alerta['limiar']}% do limite: {nome}**\n\n"
+
+    descricao = PERIODOS_LIMITE[alerta["periodo"]][1]
+    texto += (
+        f"💰 Limite: {formatar_valor(limite)}\n"
+        f"💸 Gasto {descricao}: {formatar_valor(gasto)} ({gasto * 100 // limite}%)"
+    )
+    if gasto > limite:
+        texto += f"\n📈 Excesso: {formatar_valor(gasto - limite)}"
+    return texto
+
+
+async def enviar_alertas_limite_job(context: CallbackContext):
+    """Job imediato - envia os alertas de limite ao chat do comando"""
+    for alerta in context.job.data:
+        try:
+            await context.bot.send_message(
+                chat_id=alerta["chat_id"], text=formatar_alerta_limite(alerta)
+            )
+        except Exception as e:
+            logger.error(f"Erro ao enviar alerta de limite: {e}")
 
 
-def meta_command(update: Update, context: CallbackContext):
+async def executar_tarefa_job(context: CallbackContext):
+    """Job agendado - roda a tarefa de manutenção indicada nos dados do job"""
+    tarefas = context.bot_data.get("tarefas")
+    if tarefas:
+        await no_banco(context, tarefas.executar, context.job.data)
+
+
+async def meta_command(update: Update, context: CallbackContext):
     """Comando /meta - Criar meta com parsing inteligente"""
     user = update.effective_user
     texto_completo = update.message.text
@@ -1427,11 +5056,17 @@ def meta_command(update: Update, context: CallbackContext):
         resultado = bot_instance.parser.parse_comando_meta(texto_completo)
 
         if resultado["erro"]:
-            update.message.reply_text(f"❌ {resultado['erro']}")
+            await update.message.reply_text(f"❌ {resultado['erro']}")
         else:
             # Adicionar meta
-            sucesso = bot_instance.adicionar_meta(
-                user.id, resultado["nome"], resultado["valor"], resultado["data_limite"]
+            sucesso = await no_banco(
+                context,
+                bot_instance.adicionar_meta,
+                user.id,
+                resultado["nome"],
+                resultado["valor_centavos"],
+                resultado["data_limite"],
+                resultado["percentual_receitas"],
             )
 
             if sucesso:
@@ -1440,31 +5075,60 @@ def meta_command(update: Update, context: CallbackContext):
                     if resultado["data_limite"]
                     else ""
                 )
+                if resultado["percentual_receitas"]:
+                    data_info += (
+                        f"\n🔁 Aporte: {resultado['percentual_receitas']:g}% "
+                        "de cada receita"
+                    )
 
-                update.message.reply_text(
+                await update.message.reply_text(
                     f"🎯 **Meta criada!**\n\n"
                     f"📝 Nome: {resultado['nome']}\n"
-                    f"💰 Valor: R$ {resultado['valor']:.2f}{data_info}\n\n"
+                    f"💰 Valor: {formatar_valor(resultado['valor_centavos'])}{data_info}\n\n"
                     f"✅ Use /metas para ver todas as metas"
                 )
             else:
-                update.message.reply_text(
+                await update.message.reply_text(
                     "❌ Erro ao criar meta. Tente novamente."
                 )
     else:
-        update.message.reply_text("❌ Erro interno do bot. Tente novamente.")
+        await update.message.reply_text("❌ Erro interno do bot. Tente novamente.")
+
+
+def formatar_projecao_meta(meta: Dict) -> str:
+    """Linhas de ritmo, previsão e aporte necessário de uma meta"""
+    if not meta["restante_centavos"]:
+        return "\n✅ Meta atingida!"
+
+    linhas = ""
+    if meta["percentual_receitas"]:
+        linhas += f"\n🔁 Aporte: {meta['percentual_receitas']:g}% de cada receita"
+    if meta["data_prevista"]:
+        previsao = date.fromisoformat(meta["data_prevista"])
+        linhas += (
+            f"\n📆 Previsão: {previsao.month:02d}/{previsao.year} "
+            f"({formatar_valor(meta['ritmo_mensal_centavos'])}/mês)"
+        )
+    if meta["prazo_vencido"]:
+        linhas += "\n⏰ Prazo vencido"
+    elif meta["necessario_mensal_centavos"]:
+        linhas += (
+            f"\n🎯 Necessário: "
+            f"{formatar_valor(meta['necessario_mensal_centavos'])}/mês até o prazo"
+        )
+    return linhas
 
 
-def listar_metas_command(update: Update, context: CallbackContext):
+async def listar_metas_command(update: Update, context: CallbackContext):
     """Comando /metas - Listar todas as metas"""
     user = update.effective_user
 
     bot_instance = context.bot_data.get("bot_instance")
     if bot_instance:
-        metas = bot_instance.listar_metas(user.id)
+        metas = await no_banco(context, bot_instance.listar_metas, user.id)
 
         if not metas:
-            update.message.reply_text(
+            await update.message.reply_text(
                 "🎯 **Suas Metas**\n\n"
                 "📝 Nenhuma meta encontrada.\n\n"
                 "💡 Use /meta para criar uma nova meta!\n"
@@ -1474,43 +5138,44 @@ def listar_metas_command(update: Update, context: CallbackContext):
             texto_metas = "🎯 **Suas Metas**\n\n"
 
             for meta in metas:
-                progresso = (
-                    (meta["valor_atual"] / meta["valor_meta"]) * 100
-                    if meta["valor_meta"] > 0
-                    else 0
-                )
-                barra_progresso = "█" * int(progresso / 10) + "░" * (
-                    10 - int(progresso / 10)
-                )
+                # Progresso e projeções já vêm calculados pelos contadores
+                progresso = meta["progresso"]
+                cheios = min(10, int(progresso / 10))
+                barra_progresso = "█" * cheios + "░" * (10 - cheios)
 
                 data_info = (
                     f"\n📅 Prazo: {meta['data_limite']}" if meta["data_limite"] else ""
                 )
+                data_info += formatar_projecao_meta(meta)
 
                 texto_metas += (
                     f"📝 **{meta['nome']}**\n"
-                    f"💰 Meta: R$ {meta['valor_meta']:.2f}\n"
-                    f"📊 Atual: R$ {meta['valor_atual']:.2f}\n"
+                    f"💰 Meta: {formatar_valor(meta['valor_meta_centavos'])}\n"
+                    f"📊 Atual: {formatar_valor(meta['valor_atual_centavos'])}\n"
                     f"📈 Progresso: {progresso:.1f}%\n"
                     f"`{barra_progresso}`{data_info}\n\n"
                 )
 
-            update.message.reply_text(texto_metas)
+            await update.message.reply_text(texto_metas)
     else:
-        update.message.reply_text("❌ Erro interno do bot. Tente novamente.")
+        await update.message.reply_text("❌ Erro interno do bot. Tente novamente.")
 
 
-def relatorio_command(update: Update, context: CallbackContext):
+async def relatorio_command(update: Update, context: CallbackContext):
     """Comando /relatorio - Relatório mensal"""
     user = update.effective_user
 
     bot_instance = context.bot_data.get("bot_instance")
     if bot_instance:
-        lancamentos = bot_instance.obter_lancamentos_por_periodo(user.id, "mes_atual")
-        resumo = bot_instance.obter_resumo_por_categoria(user.id, "mes_atual")
+        lancamentos = await no_banco(
+            context, bot_instance.obter_lancamentos_por_periodo, user.id, "mes_atual"
+        )
+        resumo = await no_banco(
+            context, bot_instance.obter_resumo_por_categoria, user.id, "mes_atual"
+        )
 
         if not lancamentos:
-            update.message.reply_text(
+            await update.message.reply_text(
                 "📊 **Relatório Mensal**\n\n"
                 "📝 Nenhum lançamento encontrado para este mês.\n\n"
                 "💡 Use /add para adicionar lançamentos!"
@@ -1523,18 +5188,18 @@ def relatorio_command(update: Update, context: CallbackContext):
 
             # Montar relatório
             relatorio = f"📊 **Relatório Mensal do Casal**\n\n"
-            relatorio += f"💰 **Receitas:** R$ {total_receitas:.2f}\n"
-            relatorio += f"💸 **Despesas:** R$ {total_despesas:.2f}\n"
-            relatorio += f"📈 **Saldo:** R$ {saldo_mensal:.2f}\n\n"
+            relatorio += f"💰 **Receitas:** {formatar_valor(total_receitas)}\n"
+            relatorio += f"💸 **Despesas:** {formatar_valor(total_despesas)}\n"
+            relatorio += f"📈 **Saldo:** {formatar_valor(saldo_mensal)}\n\n"
 
             relatorio += "📋 **Por Categoria:**\n"
             for categoria, dados in resumo.items():
                 if dados["receita"] > 0 or dados["despesa"] > 0:
                     relatorio += f"• {categoria}: "
                     if dados["receita"] > 0:
-                        relatorio += f"💰 R$ {dados['receita']:.2f} "
+                        relatorio += f"💰 {formatar_valor(dados['receita'])} "
                     if dados["despesa"] > 0:
-                        relatorio += f"💸 R$ {dados['despesa']:.2f}"
+                        relatorio += f"💸 {formatar_valor(dados['despesa'])}"
                     relatorio += "\n"
 
             # Mostrar últimos lançamentos com responsáveis
@@ -1542,148 +5207,177 @@ def relatorio_command(update: Update, context: CallbackContext):
                 relatorio += "\n📝 **Últimos Lançamentos:**\n"
                 for lancamento in lancamentos[:5]:  # Mostrar apenas os 5 últimos
                     emoji_lanc = "💰" if lancamento["tipo"] == "receita" else "💸"
-                    relatorio += f"{emoji_lanc} {lancamento['responsavel']}: R$ {lancamento['valor']:.2f} - {lancamento['descricao']}\n"
+                    relatorio += f"{emoji_lanc} {lancamento['responsavel']}: {formatar_valor(lancamento['valor_centavos'])} - {lancamento['descricao']}\n"
 
-            update.message.reply_text(relatorio)
+            await update.message.reply_text(relatorio)
     else:
-        update.message.reply_text("❌ Erro interno do bot. Tente novamente.")
+        await update.message.reply_text("❌ Erro interno do bot. Tente novamente.")
 
 
-def grafico_command(update: Update, context: CallbackContext):
-    """Comando /grafico - Gerar gráfico de gastos"""
+async def grafico_command(update: Update, context: CallbackContext):
+    """Comando /grafico - Gerar gráfico de gastos (/grafico mes: só o mês atual)"""
     user = update.effective_user
+    periodo = "mes_atual" if context.args and context.args[0] == "mes" else None
 
     bot_instance = context.bot_data.get("bot_instance")
     if bot_instance:
-        grafico_texto = bot_instance.criar_grafico_gastos(user.id)
+        # Imagem renderizada fora do dispatcher; sem ela, gráfico em texto
+        imagem = await no_banco(
+            context, bot_instance.criar_grafico_png, user.id, periodo
+        )
+        if imagem:
+            await update.message.reply_photo(
+                photo=io.BytesIO(imagem),
+                caption="📊 Gastos por categoria\n💡 Use /relatorio para ver detalhes!",
+            )
+            return
+
+        grafico_texto = await no_banco(
+            context, bot_instance.criar_grafico_gastos, user.id, periodo
+        )
 
         if (
             grafico_texto
             and grafico_texto != "📊 Nenhum gasto encontrado para criar gráfico."
         ):
-            update.message.reply_text(
+            await update.message.reply_text(
                 f"{grafico_texto}\n" "💡 Use /relatorio para ver detalhes!"
             )
         else:
-            update.message.reply_text(
+            await update.message.reply_text(
                 "📊 **Gráfico de Gastos**\n\n"
                 "📝 Nenhum gasto encontrado para criar gráfico.\n\n"
                 "💡 Use /add para adicionar lançamentos!"
             )
     else:
-        update.message.reply_text("❌ Erro interno do bot. Tente novamente.")
+        await update.message.reply_text("❌ Erro interno do bot. Tente novamente.")
 
 
-def exportar_command(update: Update, context: CallbackContext):
+async def exportar_command(update: Update, context: CallbackContext):
     """Comando /exportar - Exportar dados em CSV"""
     user = update.effective_user
 
     bot_instance = context.bot_data.get("bot_instance")
     if bot_instance:
-        filename = bot_instance.exportar_csv(user.id)
+        arquivo = await no_banco(context, bot_instance.exportar_csv, user.id)
 
-        if filename:
+        if arquivo:
             try:
-                with open(filename, "rb") as document:
-                    update.message.reply_document(
-                        document=document,
+                # O PTB lê o arquivo inteiro para o upload, e o arquivo em
+                # memória não tem nome: envia o conteúdo direto
+                with arquivo:
+                    await update.message.reply_document(
+                        document=arquivo.read(),
                         filename=f"dados_financeiros_{user.first_name}.csv",
                         caption="📤 **Dados Exportados!**\n\n"
                         "📊 Arquivo CSV com todos os seus lançamentos.\n"
                         "💡 Pode ser aberto no Excel ou Google Sheets.",
                     )
-                # Limpar arquivo temporário
-                os.remove(filename)
             except Exception as e:
-                update.message.reply_text(
+                await update.message.reply_text(
                     "❌ Erro ao enviar arquivo. Tente novamente."
                 )
         else:
-            update.message.reply_text(
+            await update.message.reply_text(
                 "📤 **Exportação de Dados**\n\n"
                 "📝 Nenhum lançamento encontrado para exportar.\n\n"
                 "💡 Use /add para adicionar lançamentos!"
             )
     else:
-        update.message.reply_text("❌ Erro interno do bot. Tente novamente.")
+        await update.message.reply_text("❌ Erro interno do bot. Tente novamente.")
 
 
-def limite_command(update: Update, context: CallbackContext):
+async def limite_command(update: Update, context: CallbackContext):
     """Comando /limite - Definir limite de gastos"""
     user = update.effective_user
     args = context.args
 
-    if len(args) < 2:
-        update.message.reply_text(
-            "⚠️ **Uso:** /limite [categoria] [valor]\n\n"
+    periodo = dobrar_acentos(args[2]) if len(args) > 2 else "mensal"
+    if len(args) < 2 or periodo not in PERIODOS_LIMITE:
+        await update.message.reply_text(
+            "⚠️ **Uso:** /limite [categoria] [valor] [período]\n\n"
             "📝 Exemplos:\n"
             "• /limite alimentação 500\n"
-            "• /limite transporte 200\n"
-            "• /limite lazer 300"
+            "• /limite alimentação 150 semanal\n"
+            "• /limite lazer 3000 anual\n\n"
+            f"📅 Períodos: {', '.join(PERIODOS_LIMITE)} (padrão: mensal)"
         )
         return
 
     categoria = args[0]
     try:
-        valor_limite = float(args[1].replace(",", "."))
+        valor_limite_centavos = para_centavos(args[1])
 
         bot_instance = context.bot_data.get("bot_instance")
         if bot_instance:
-            sucesso = bot_instance.adicionar_limite_gasto(
-                user.id, categoria, valor_limite
+            sucesso = await no_banco(
+                context,
+                bot_instance.adicionar_limite_gasto,
+                user.id,
+                categoria,
+                valor_limite_centavos,
+                periodo,
             )
 
             if sucesso:
-                update.message.reply_text(
+                await update.message.reply_text(
                     f"🎯 **Limite Definido!**\n\n"
                     f"📊 Categoria: {categoria}\n"
-                    f"💰 Limite: R$ {valor_limite:.2f}\n\n"
+                    f"💰 Limite: {formatar_valor(valor_limite_centavos)}\n"
+                    f"📅 Período: {periodo}\n\n"
                     f"✅ Use /limites para ver todos os limites"
                 )
             else:
-                update.message.reply_text(
+                await update.message.reply_text(
                     "❌ Erro ao definir limite. Tente novamente."
                 )
         else:
-            update.message.reply_text("❌ Erro interno do bot. Tente novamente.")
+            await update.message.reply_text("❌ Erro interno do bot. Tente novamente.")
 
     except ValueError:
-        update.message.reply_text(
+        await update.message.reply_text(
             "❌ Valor inválido. Use números como: 500 ou 500,50"
         )
 
 
-def listar_limites_command(update: Update, context: CallbackContext):
+async def listar_limites_command(update: Update, context: CallbackContext):
     """Comando /limites - Listar limites de gastos"""
     user = update.effective_user
 
     bot_instance = context.bot_data.get("bot_instance")
     if bot_instance:
-        limites_ultrapassados = bot_instance.verificar_limites(user.id)
+        limites_ultrapassados = await no_banco(
+            context, bot_instance.verificar_limites, user.id
+        )
 
         if limites_ultrapassados:
             texto = "⚠️ **Limites Ultrapassados!**\n\n"
             for limite in limites_ultrapassados:
+                nome = limite["categoria"]
+                if limite["periodo"] != "mensal":
+                    nome += f" ({limite['periodo']})"
+                descricao = PERIODOS_LIMITE[limite["periodo"]][1]
                 texto += (
-                    f"🚨 **{limite['categoria']}**\n"
-                    f"💰 Limite: R$ {limite['limite']:.2f}\n"
-                    f"💸 Gasto: R$ {limite['gasto_atual']:.2f}\n"
-                    f"📈 Excesso: R$ {limite['excesso']:.2f}\n\n"
+                    f"🚨 **{nome}**\n"
+                    f"💰 Limite: {formatar_valor(limite['limite_centavos'])}\n"
+                    f"💸 Gasto {descricao}: "
+                    f"{formatar_valor(limite['gasto_atual_centavos'])}\n"
+                    f"📈 Excesso: {formatar_valor(limite['excesso_centavos'])}\n\n"
                 )
-            update.message.reply_text(texto)
+            await update.message.reply_text(texto)
         else:
-            update.message.reply_text(
+            await update.message.reply_text(
                 "🎯 **Limites de Gastos**\n\n"
                 "✅ Nenhum limite ultrapassado!\n\n"
                 "💡 Use /limite para definir novos limites:\n"
                 "• /limite alimentação 500\n"
-                "• /limite transporte 200"
+                "• /limite alimentação 150 semanal"
             )
     else:
-        update.message.reply_text("❌ Erro interno do bot. Tente novamente.")
+        await update.message.reply_text("❌ Erro interno do bot. Tente novamente.")
 
 
-def reset_command(update: Update, context: CallbackContext):
+async def reset_command(update: Update, context: CallbackContext):
     """Comando /reset - Resetar todos os dados"""
     user = update.effective_user
 
@@ -1698,7 +5392,7 @@ def reset_command(update: Update, context: CallbackContext):
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    update.message.reply_text(
+    await update.message.reply_text(
         "⚠️ **ATENÇÃO!**\n\n"
         "🗑️ Esta ação irá **DELETAR TODOS** os seus dados:\n"
         "• Lançamentos\n"
@@ -1712,34 +5406,58 @@ def reset_command(update: Update, context: CallbackContext):
     )
 
 
-def button_callback(update: Update, context: CallbackContext):
+async def button_callback(update: Update, context: CallbackContext):
     """Handler para botões inline"""
     query = update.callback_query
-    query.answer()
+    await query.answer()
 
     if query.data.startswith("reset_confirm_"):
         user_id = int(query.data.split("_")[2])
 
         bot_instance = context.bot_data.get("bot_instance")
         if bot_instance:
-            sucesso = bot_instance.resetar_dados(user_id)
+            sucesso = await no_banco(context, bot_instance.resetar_dados, user_id)
 
             if sucesso:
-                query.edit_message_text(
+                await query.edit_message_text(
                     "🗑️ **Dados Resetados!**\n\n"
                     "✅ Todos os seus dados foram deletados.\n"
                     "🆕 Use /start para começar novamente!"
                 )
             else:
-                query.edit_message_text("❌ Erro ao resetar dados. Tente novamente.")
+                await query.edit_message_text(
+                    "❌ Erro ao resetar dados. Tente novamente."
+                )
         else:
-            query.edit_message_text("❌ Erro interno do bot. Tente novamente.")
+            await query.edit_message_text("❌ Erro interno do bot. Tente novamente.")
 
     elif query.data == "reset_cancel":
-        query.edit_message_text("❌ Reset cancelado. Seus dados estão seguros!")
+        await query.edit_message_text("❌ Reset cancelado. Seus dados estão seguros!")
+
+    elif query.data.startswith("mes_"):
+        # Navegação do /mes: mes_<user>_<YYYY-MM>_<a|s>_<data_referencia>_<id>
+        _, user_id, ano_mes, direcao, data_referencia, lancamento_id = (
+            query.data.split("_")
+        )
+        bot_instance = context.bot_data.get("bot_instance")
+        # A conexão é a da thread do executor que monta a página
+        mensagem, botoes = await no_banco(
+            context,
+            lambda: montar_pagina_mes(
+                bot_instance.pool.obter_conexao()
+                if bot_instance
+                else get_database_connection(),
+                int(user_id),
+                int(ano_mes[:4]),
+                int(ano_mes[5:7]),
+                (data_referencia, int(lancamento_id)),
+                anterior=direcao == "a",
+            ),
+        )
+        await query.edit_message_text(mensagem, reply_markup=botoes)
 
 
-def relatorio_command(update: Update, context: CallbackContext):
+async def relatorio_command(update: Update, context: CallbackContext):
     """Gera relatório mensal em CSV"""
     try:
         if not context.args or len(context.args) != 1:
@@ -1749,94 +5467,327 @@ def relatorio_command(update: Update, context: CallbackContext):
             mes_ano = context.args[0]
             mes_atual, ano_atual = map(int, mes_ano.split("-"))
 
-        filepath = gerar_relatorio_mensal(
-            update.effective_user.id, mes_atual, ano_atual
-        )
+        bot_instance = context.bot_data.get("bot_instance")
+
+        def gerar():
+            return gerar_relatorio_mensal(
+                update.effective_user.id,
+                mes_atual,
+                ano_atual,
+                bot_instance.pool if bot_instance else None,
+            )
+
+        filepath = await no_banco(context, gerar)
 
         with open(filepath, "rb") as f:
-            update.message.reply_document(
+            await update.message.reply_document(
                 document=f,
                 filename=f"relatorio_{mes_atual:02d}_{ano_atual}.csv",
                 caption=f"📊 Relatório financeiro de {mes_atual:02d}/{ano_atual}",
             )
     except Exception as e:
-        update.message.reply_text(f"Erro ao gerar relatório: {str(e)}")
+        await update.message.reply_text(f"Erro ao gerar relatório: {str(e)}")
+
+
+# Máximo de parcelas previstas listadas no /mes
+PARCELAS_PREVISTAS_MES = 10
+
+
+def formatar_parcelas_previstas(previstas: List[Dict], mes: int) -> str:
+    """Seção do /mes com as parcelas previstas (ainda não lançadas)"""
+    mensagem = "\n\n🗓️ Parcelas previstas (ainda não lançadas):\n"
+    for p in previstas[:PARCELAS_PREVISTAS_MES]:
+        mensagem += (
+            f"{'💰' if p['tipo'] == 'receita' else '💸'} "
+            f"{p['data_referencia'][8:10]}/{mes:02d} {p['categoria']}: "
+            f"{formatar_valor(p['valor_centavos'])} "
+            f"[{p['parcela_atual']}/{p['total_parcelas']}]\n"
+        )
+    if len(previstas) > PARCELAS_PREVISTAS_MES:
+        mensagem += f"… e mais {len(previstas) - PARCELAS_PREVISTAS_MES}\n"
+    despesas = sum(p["valor_centavos"] for p in previstas if p["tipo"] == "despesa")
+    return mensagem + f"📉 Despesas previstas: {formatar_valor(despesas)}"
+
+
+# Máximo de itens por dimensão na resposta de um mês fechado
+ITENS_POR_DIMENSAO_MES_FECHADO = 10
+
+
+def formatar_mes_fechado(resumo: Dict, mes: int, ano: int) -> str:
+    """Texto do /mes para um mês fechado (a partir do resumo compacto)"""
+    if not resumo["quantidade"]:
+        return f"Nenhum lançamento encontrado para {mes:02d}/{ano}"
+
+    mensagem = f"📅 Resumo de {mes:02d}/{ano} (mês fechado):\n"
+    for titulo, dimensao in (
+        ("📊 Por categoria", "categorias"),
+        ("👤 Por responsável", "responsaveis"),
+        ("💳 Por método", "metodos"),
+    ):
+        mensagem += f"\n{titulo}:\n"
+        itens = sorted(
+            resumo[dimensao].items(),
+            key=lambda item: item[1]["despesa"] + item[1]["receita"],
+            reverse=True,
+        )
+        for nome, totais in itens[:ITENS_POR_DIMENSAO_MES_FECHADO]:
+            mensagem += f"• {nome}:"
+            if totais["receita"]:
+                mensagem += f" 💰 {formatar_valor(totais['receita'])}"
+            if totais["despesa"]:
+                mensagem += f" 💸 {formatar_valor(totais['despesa'])}"
+            mensagem += "\n"
+
+    dia_maior_gasto = max(
+        resumo["dias"].items(), key=lambda item: item[1]["despesa"]
+    )
+    if dia_maior_gasto[1]["despesa"]:
+        dia = date.fromisoformat(dia_maior_gasto[0])
+        mensagem += (
+            f"\n📆 Dia de maior gasto: {dia.strftime('%d/%m')} "
+            f"({formatar_valor(dia_maior_gasto[1]['despesa'])})\n"
+        )
+
+    mensagem += (
+        f"\n📊 Resumo ({resumo['quantidade']} lançamentos):\n"
+        f"📈 Receitas: {formatar_valor(resumo['receita'])}\n"
+        f"📉 Despesas: {formatar_valor(resumo['despesa'])}\n"
+        f"💰 Saldo: {formatar_valor(resumo['receita'] - resumo['despesa'])}\n\n"
+        f"💡 Lançamentos um a um: /relatorio {mes:02d}-{ano}"
+    )
+    return mensagem
+
+
+# Lançamentos por página do /mes e caracteres da descrição mostrados
+# (mantém a mensagem bem abaixo do limite de 4096 do Telegram)
+LANCAMENTOS_POR_PAGINA_MES = 10
+DESCRICAO_MAXIMA_MES = 80
+
+
+def buscar_pagina_mes(
+    conn: sqlite3.Connection,
+    user_id: int,
+    ano: int,
+    mes: int,
+    posicao: Tuple[str, int] = None,
+    anterior: bool = False,
+) -> Tuple[List[sqlite3.Row], bool, bool]:
+    """Busca uma página do mês a partir de posicao = (data_referencia, id)
+
+    Sem posição, retorna a primeira página. Com anterior=True, a página que
+    termina antes da posição. Retorna (linhas, tem_anterior, tem_seguinte).
+    """
+    inicio, fim = intervalo_mes(ano, mes)
+    limite = LANCAMENTOS_POR_PAGINA_MES + 1
+    if anterior:
+        data, lancamento_id = posicao
+        linhas = conn.execute(
+            SQL_PAGINA_MES_ANTERIOR,
+            (user_id, data, lancamento_id, limite)
+            + (user_id, inicio, data, limite, limite),
+        ).fetchall()
+        mais = len(linhas) == limite
+        return list(reversed(linhas[:-1] if mais else linhas)), mais, True
+
+    data, lancamento_id = posicao or (inicio, 0)
+    linhas = conn.execute(
+        SQL_PAGINA_MES_SEGUINTE,
+        (user_id, data, lancamento_id, limite) + (user_id, data, fim, limite, limite),
+    ).fetchall()
+    mais = len(linhas) == limite
+    return (linhas[:-1] if mais else linhas), lancamento_id > 0, mais
+
+
+def montar_pagina_mes(
+    conn: sqlite3.Connection,
+    user_id: int,
+    ano: int,
+    mes: int,
+    posicao: Tuple[str, int] = None,
+    anterior: bool = False,
+) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Texto e botões de navegação de uma página do /mes"""
+    lancamentos, tem_anterior, tem_seguinte = buscar_pagina_mes(
+        conn, user_id, ano, mes, posicao, anterior
+    )
+    if not lancamentos:
+        return f"Nenhum lançamento encontrado para {mes:02d}/{ano}", None
+
+    mensagem = f"📅 Lançamentos de {mes:02d}/{ano}:\n\n"
+    for l in lancamentos:
+        parcela_info = (
+            f" [{l['parcela_atual']}/{l['total_parcelas']}]"
+            if l["total_parcelas"]
+            else ""
+        )
+        descricao = l["descricao"] or ""
+        if len(descricao) > DESCRICAO_MAXIMA_MES:
+            descricao = descricao[: DESCRICAO_MAXIMA_MES - 1] + "…"
+        dia = l["data_referencia"][8:10]
+        mensagem += (
+            f"{'💰' if l['tipo'] == 'receita' else '💸'} {dia}/{mes:02d} "
+            f"{l['categoria']}: {formatar_valor(l['valor_centavos'])}{parcela_info}\n"
+            f"📝 {descricao}\n\n"
+        )
+
+    totais = {"receita": 0, "despesa": 0}
+    quantidade = 0
+    for tipo, total, quantidade_tipo in conn.execute(
+        SQL_TOTAIS_MES_RESUMO, (user_id, f"{ano:04d}-{mes:02d}")
+    ):
+        if tipo in totais:
+            totais[tipo] = total
+            quantidade += quantidade_tipo
+    mensagem += (
+        f"📊 Resumo ({quantidade} lançamentos):\n"
+        f"📈 Receitas: {formatar_valor(totais['receita'])}\n"
+        f"📉 Despesas: {formatar_valor(totais['despesa'])}\n"
+        f"💰 Saldo: {formatar_valor(totais['receita'] - totais['despesa'])}"
+    )
+
+    # callback_data: mes_<user>_<YYYY-MM>_<a|s>_<data_referencia>_<id>
+    base = f"mes_{user_id}_{ano:04d}-{mes:02d}"
+    primeiro, ultimo = lancamentos[0], lancamentos[-1]
+    botoes = []
+    if tem_anterior:
+        posicao = f"{primeiro['data_referencia']}_{primeiro['id']}"
+        botoes.append(
+            InlineKeyboardButton("⬅️ Anteriores", callback_data=f"{base}_a_{posicao}")
+        )
+    if tem_seguinte:
+        posicao = f"{ultimo['data_referencia']}_{ultimo['id']}"
+        botoes.append(
+            InlineKeyboardButton("Próximos ➡️", callback_data=f"{base}_s_{posicao}")
+        )
+    return mensagem, InlineKeyboardMarkup([botoes]) if botoes else None
+
 
+def consultar_mes(
+    bot_instance, user_id: int, ano: int, mes: int
+) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Resposta do /mes: resumo de um mês encerrado ou a primeira página
 
-def mes_command(update: Update, context: CallbackContext):
-    """Visualiza gastos de um mês específico"""
+    Só os meses já encerrados passam por meses_fechados; o mês atual e os
+    futuros vão direto para a página por keyset, sem agregar o mês inteiro,
+    seguida das parcelas previstas dos planos projetados.
+    """
+    if bot_instance and f"{ano:04d}-{mes:02d}" < ano_mes_atual():
+        # Mês encerrado: lido só do resumo fechado
+        resumo, _ = obter_resumo_mes(bot_instance.pool, user_id, ano, mes)
+        return formatar_mes_fechado(resumo, mes, ano), None
+
+    conn = (
+        bot_instance.pool.obter_conexao()
+        if bot_instance
+        else get_database_connection()
+    )
+    mensagem, botoes = montar_pagina_mes(conn, user_id, ano, mes)
+    previstas = parcelas_previstas(conn, user_id, ano, mes)
+    if previstas:
+        mensagem += formatar_parcelas_previstas(previstas, mes)
+    return mensagem, botoes
+
+
+async def mes_command(update: Update, context: CallbackContext):
+    """Visualiza gastos de um mês específico, uma página por vez"""
     if not context.args or len(context.args) != 1:
-        update.message.reply_text("Use: /mes MM-YYYY (exemplo: /mes 11-2025)")
+        await update.message.reply_text("Use: /mes MM-YYYY (exemplo: /mes 11-2025)")
         return
 
     try:
         mes_ano = context.args[0]
         mes, ano = map(int, mes_ano.split("-"))
 
-        conn = get_database_connection()
-        cursor = conn.cursor()
+        intervalo_mes(ano, mes)
+        mensagem, botoes = await no_banco(
+            context,
+            consultar_mes,
+            context.bot_data.get("bot_instance"),
+            update.effective_user.id,
+            ano,
+            mes,
+        )
+        await update.message.reply_text(mensagem, reply_markup=botoes)
 
-        cursor.execute(
-            """
-            SELECT l.*, c.nome as categoria, r.nome as responsavel
-            FROM lancamentos l
-            LEFT JOIN categorias c ON l.categoria_id = c.id
-            LEFT JOIN responsaveis r ON l.responsavel_id = r.id
-            WHERE l.user_id = ? 
-            AND strftime('%m', l.data_referencia) = ? 
-            AND strftime('%Y', l.data_referencia) = ?
-            ORDER BY l.data_lancamento
-        """,
-            (update.effective_user.id, f"{mes:02d}", str(ano)),
+    except ValueError:
+        await update.message.reply_text(
+            "Formato inválido. Use MM-YYYY (exemplo: 11-2025)"
         )
+    except Exception as e:
+        await update.message.reply_text(f"Erro ao buscar lançamentos: {str(e)}")
 
-        lancamentos = cursor.fetchall()
 
-        if not lancamentos:
-            update.message.reply_text(
-                f"Nenhum lançamento encontrado para {mes:02d}/{ano}"
-            )
-            return
+# Categorias listadas na resposta do /tendencias
+CATEGORIAS_EM_TENDENCIAS = 8
 
-        mensagem = f"📅 Lançamentos de {mes:02d}/{ano}:\n\n"
-        total_receitas = 0
-        total_despesas = 0
 
-        for l in lancamentos:
-            valor = l["valor"]
-            if l["tipo"] == "receita":
-                total_receitas += valor
-            else:
-                total_despesas += valor
+def formatar_variacao(variacao: float) -> str:
+    """Variação relativa como "+12%" ("novo" quando não havia base)"""
+    if variacao != variacao:  # NaN: sem gasto no período de comparação
+        return "novo"
+    return f"{variacao * 100:+.0f}%"
 
-            parcela_info = (
-                f" [{l['parcela_atual']}/{l['total_parcelas']}]"
-                if l["total_parcelas"]
-                else ""
-            )
-            mensagem += (
-                f"{'💰' if l['tipo'] == 'receita' else '💸'} "
-                f"{l['categoria']}: R$ {valor:.2f}{parcela_info}\n"
-                f"📝 {l['descricao']}\n\n"
-            )
 
-        saldo = total_receitas - total_despesas
-        mensagem += (
-            f"📊 Resumo:\n"
-            f"📈 Receitas: R$ {total_receitas:.2f}\n"
-            f"📉 Despesas: R$ {total_despesas:.2f}\n"
-            f"💰 Saldo: R$ {saldo:.2f}"
+async def tendencias_command(update: Update, context: CallbackContext):
+    """Comando /tendencias - Tendências de gastos do domicílio"""
+    try:
+        if context.args:
+            mes, ano = map(int, context.args[0].split("-"))
+            date(ano, mes, 1)
+        else:
+            # Último mês completo
+            anterior = somar_meses(datetime.utcnow().date().replace(day=1), -1)
+            mes, ano = anterior.month, anterior.year
+    except ValueError:
+        await update.message.reply_text(
+            "Formato inválido. Use MM-YYYY (exemplo: /tendencias 11-2025)"
         )
+        return
 
-        update.message.reply_text(mensagem)
-        conn.close()
+    bot_instance = context.bot_data.get("bot_instance")
+    if not bot_instance:
+        await update.message.reply_text("❌ Erro interno do bot. Tente novamente.")
+        return
 
-    except ValueError:
-        update.message.reply_text(
-            "Formato inválido. Use MM-YYYY (exemplo: 11-2025)"
+    tendencias = await no_banco(
+        context, bot_instance.obter_tendencias, update.effective_user.id, ano, mes
+    )
+    if tendencias is None:
+        await update.message.reply_text(
+            "⚠️ Tendências indisponíveis: o NumPy não está instalado no servidor."
         )
-    except Exception as e:
-        update.message.reply_text(f"Erro ao buscar lançamentos: {str(e)}")
+        return
+    if not tendencias["categorias"]:
+        await update.message.reply_text(
+            f"📈 Nenhum gasto nos 12 meses até {mes:02d}/{ano}.\n\n"
+            "💡 Use /add para adicionar lançamentos!"
+        )
+        return
+
+    mensagem = (
+        f"📈 **Tendências de {mes:02d}/{ano}**\n\n"
+        f"💸 Gastos no mês: {formatar_valor(tendencias['total_atual'])} "
+        f"({formatar_variacao(tendencias['variacao_total'])} vs mês anterior)\n\n"
+        "📊 **Por categoria** (médias de 3/6/12 meses):\n"
+    )
+    for categoria in tendencias["categorias"][:CATEGORIAS_EM_TENDENCIAS]:
+        medias = " / ".join(
+            formatar_valor(round(categoria[f"media_{janela}"]))
+            for janela in JANELAS_MEDIA_MOVEL
+        )
+        mensagem += (
+            f"• {categoria['nome']}: {formatar_valor(categoria['atual'])} "
+            f"({formatar_variacao(categoria['variacao_mensal'])} no mês, "
+            f"{formatar_variacao(categoria['variacao_anual'])} no ano)\n"
+            f"   médias: {medias}\n"
+        )
+
+    if tendencias["responsaveis"]:
+        mensagem += "\n👥 **Quem gastou** (últimos 12 meses):\n"
+        for nome, total, participacao in tendencias["responsaveis"]:
+            mensagem += f"• {nome}: {formatar_valor(total)} ({participacao:.0%})\n"
+
+    await update.message.reply_text(mensagem)
 
 
 if __name__ == "__main__":
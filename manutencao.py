@@ -0,0 +1,158 @@
+"""Tarefas de manutenção do banco do Bot de Vida Financeira
+
+Uso: python manutencao.py <comando> [--db financeiro.db]
+
+Comandos:
+  planos             Verifica (EXPLAIN QUERY PLAN) se as consultas mensais usam índices
+  reconstruir-resumo Recalcula resumo_mensal e gastos_diarios a partir dos lançamentos
+  verificar-resumo   Compara resumo_mensal com os lançamentos
+  verificar-saldos   Compara os saldos de domicílio com os lançamentos
+  reconciliar-saldos Corrige os saldos de domicílio divergentes
+  fechar-meses       Fecha os meses encerrados em resumos imutáveis
+  tarefas            Roda uma vez cada tarefa de manutenção em segundo plano
+"""
+
+import argparse
+import sys
+
+from bot import (
+    DB_PATH,
+    AGENDA_MANUTENCAO_PADRAO,
+    TarefasManutencao,
+    VidaFinanceiraBot,
+    fechar_meses,
+    formatar_valor,
+    reconciliar_saldos_domicilio,
+    reconstruir_gastos_diarios,
+    reconstruir_resumo_mensal,
+    verificar_planos_consulta,
+    verificar_resumo_mensal,
+)
+
+
+def comando_planos(bot: VidaFinanceiraBot) -> int:
+    """Falha se alguma consulta mensal fizer SCAN em vez de usar índice"""
+    problemas = verificar_planos_consulta(bot.pool.obter_conexao())
+
+    if problemas:
+        print("❌ Consultas mensais sem índice:")
+        for problema in problemas:
+            print(f"  • {problema}")
+        return 1
+
+    print("✅ Todas as consultas mensais usam índices")
+    return 0
+
+
+def comando_reconstruir_resumo(bot: VidaFinanceiraBot) -> int:
+    """Recalcula o resumo mensal e os gastos diários do zero"""
+    linhas = reconstruir_resumo_mensal(bot.pool)
+    print(f"✅ Resumo mensal reconstruído: {linhas} linhas")
+    linhas = reconstruir_gastos_diarios(bot.pool)
+    print(f"✅ Gastos diários reconstruídos: {linhas} linhas")
+    return 0
+
+
+def comando_verificar_resumo(bot: VidaFinanceiraBot) -> int:
+    """Falha se o resumo mensal divergir dos lançamentos"""
+    divergencias = verificar_resumo_mensal(bot.pool.obter_conexao())
+
+    if divergencias:
+        print(f"❌ {len(divergencias)} divergências no resumo mensal:")
+        for divergencia in divergencias:
+            print(f"  • {divergencia}")
+        print("💡 Use: python manutencao.py reconstruir-resumo")
+        return 1
+
+    print("✅ Resumo mensal consistente com os lançamentos")
+    return 0
+
+
+def _mostrar_divergencias_saldo(divergencias) -> None:
+    for divergencia in divergencias:
+        armazenado = divergencia["armazenado_centavos"]
+        print(
+            f"  • domicílio {divergencia['domicilio_id']}: "
+            f"armazenado {formatar_valor(armazenado) if armazenado is not None else '-'}, "
+            f"recalculado {formatar_valor(divergencia['recalculado_centavos'])}"
+        )
+
+
+def comando_verificar_saldos(bot: VidaFinanceiraBot) -> int:
+    """Falha se algum saldo de domicílio divergir dos lançamentos"""
+    divergencias = reconciliar_saldos_domicilio(bot.pool)
+
+    if divergencias:
+        print(f"❌ {len(divergencias)} saldos de domicílio divergentes:")
+        _mostrar_divergencias_saldo(divergencias)
+        print("💡 Use: python manutencao.py reconciliar-saldos")
+        return 1
+
+    print("✅ Saldos de domicílio consistentes com os lançamentos")
+    return 0
+
+
+def comando_reconciliar_saldos(bot: VidaFinanceiraBot) -> int:
+    """Corrige os saldos de domicílio a partir dos lançamentos"""
+    divergencias = reconciliar_saldos_domicilio(bot.pool, corrigir=True)
+
+    if divergencias:
+        print(f"🔧 {len(divergencias)} saldos de domicílio corrigidos:")
+        _mostrar_divergencias_saldo(divergencias)
+    else:
+        print("✅ Nenhuma divergência nos saldos de domicílio")
+    return 0
+
+
+def comando_fechar_meses(bot: VidaFinanceiraBot) -> int:
+    """Fecha os meses encerrados que ainda não têm resumo fechado"""
+    fechados = fechar_meses(bot.pool)
+    print(f"✅ {fechados} meses fechados")
+    return 0
+
+
+def comando_tarefas(bot: VidaFinanceiraBot) -> int:
+    """Roda as tarefas de manutenção na ordem da agenda e mostra as métricas"""
+    tarefas = TarefasManutencao(bot)
+    for nome in AGENDA_MANUTENCAO_PADRAO:
+        tarefas.executar(nome)
+
+    falhas = 0
+    for nome, metricas in tarefas.metricas().items():
+        if metricas["falhas"]:
+            falhas += 1
+            print(f"❌ {nome}: {metricas['ultimo_erro']}")
+        else:
+            print(
+                f"✅ {nome} ({metricas['ultima_duracao']:.3f}s): "
+                f"{metricas['ultimo_resultado']}"
+            )
+    return 1 if falhas else 0
+
+
+COMANDOS = {
+    "planos": comando_planos,
+    "reconstruir-resumo": comando_reconstruir_resumo,
+    "verificar-resumo": comando_verificar_resumo,
+    "verificar-saldos": comando_verificar_saldos,
+    "reconciliar-saldos": comando_reconciliar_saldos,
+    "fechar-meses": comando_fechar_meses,
+    "tarefas": comando_tarefas,
+}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Manutenção do banco de dados")
+    parser.add_argument("comando", choices=sorted(COMANDOS))
+    parser.add_argument("--db", default=DB_PATH, help="caminho do banco SQLite")
+    args = parser.parse_args()
+
+    bot = VidaFinanceiraBot(None, args.db)
+    try:
+        return COMANDOS[args.comando](bot)
+    finally:
+        bot.pool.fechar()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,78 +1,54 @@
-import sqlite3
-from datetime import datetime, date
+"""Migração do banco de dados do Bot de Vida Financeira
 
+Uso: python migrar_db.py [--db financeiro.db] [--lote 1000] [--status]
 
-def migrar_banco():
-    """Migra o banco de dados para o novo formato"""
-    conn = sqlite3.connect("financeiro.db")
-    cursor = conn.cursor()
+Aplica as migrações versionadas de bot.MIGRACOES em lotes, sem segurar o
+lock de escrita durante toda a cópia. Uma migração interrompida continua do
+último lote confirmado na próxima execução. O bot aplica as mesmas
+migrações ao iniciar; este script permite rodá-las antes do deploy.
+"""
 
-    # Backup das tabelas existentes
-    cursor.execute("ALTER TABLE lancamentos RENAME TO lancamentos_old")
+import argparse
+import sys
 
-    # Criar nova tabela de lançamentos com suporte a parcelamento
-    cursor.execute(
-        """
-        CREATE TABLE lancamentos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            conta_id INTEGER,
-            responsavel_id INTEGER,
-            categoria_id INTEGER,
-            metodo_pagamento_id INTEGER,
-            tipo TEXT CHECK(tipo IN ('receita', 'despesa')),
-            valor REAL NOT NULL,
-            descricao TEXT,
-            data_lancamento TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            data_referencia DATE DEFAULT CURRENT_DATE,
-            parcela_atual INTEGER DEFAULT NULL,
-            total_parcelas INTEGER DEFAULT NULL,
-            FOREIGN KEY (user_id) REFERENCES usuarios (user_id),
-            FOREIGN KEY (conta_id) REFERENCES contas (id),
-            FOREIGN KEY (responsavel_id) REFERENCES responsaveis (id),
-            FOREIGN KEY (categoria_id) REFERENCES categorias (id),
-            FOREIGN KEY (metodo_pagamento_id) REFERENCES metodos_pagamento (id)
-        )
-    """
-    )
+from bot import DB_PATH, VERSAO_ESQUEMA, MigradorEsquema, obter_pool
 
-    # Migrar dados antigos
-    cursor.execute(
-        """
-        INSERT INTO lancamentos (
-            user_id, conta_id, responsavel_id, categoria_id,
-            metodo_pagamento_id, tipo, valor, descricao,
-            data_lancamento, data_referencia
-        )
-        SELECT 
-            user_id, conta_id, responsavel_id, categoria_id,
-            metodo_pagamento_id, tipo, valor, descricao,
-            data_lancamento, date(data_lancamento)
-        FROM lancamentos_old
-    """
-    )
 
-    # Criar tabela de relatórios mensais
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS relatorios_mensais (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            mes INTEGER NOT NULL,
-            ano INTEGER NOT NULL,
-            arquivo_path TEXT NOT NULL,
-            data_geracao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES usuarios (user_id)
-        )
-    """
+def mostrar_progresso(etapa: str, processados: int, total: int):
+    fim = "\n" if processados >= total else "\r"
+    print(f"  {etapa}: {processados}/{total} ids", end=fim)
+
+
+def migrar_banco(db_path: str = DB_PATH, tamanho_lote: int = 1000) -> int:
+    """Migra o banco de dados para a versão atual do esquema"""
+    migrador = MigradorEsquema(obter_pool(db_path), tamanho_lote, mostrar_progresso)
+    return migrador.migrar()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Migração do banco de dados")
+    parser.add_argument("--db", default=DB_PATH, help="caminho do banco SQLite")
+    parser.add_argument("--lote", type=int, default=1000, help="ids por transação")
+    parser.add_argument(
+        "--status", action="store_true", help="só mostra as migrações pendentes"
     )
+    args = parser.parse_args()
 
-    # Commit e fechar conexão
-    conn.commit()
-    conn.close()
+    migrador = MigradorEsquema(obter_pool(args.db), args.lote, mostrar_progresso)
+    versao = migrador.versao_atual()
+    print(f"📦 Versão do esquema: {versao} (atual: {VERSAO_ESQUEMA})")
 
+    pendentes = migrador.pendentes()
+    for numero, descricao, _ in pendentes:
+        print(f"  • pendente {numero}: {descricao}")
+    if args.status or not pendentes:
+        return 0
 
-if __name__ == "__main__":
     print("Iniciando migração do banco de dados...")
-    migrar_banco()
-    print("Migração concluída com sucesso!")
+    versao = migrar_banco(args.db, args.lote)
+    print(f"Migração concluída com sucesso! Versão {versao}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())